@@ -0,0 +1,291 @@
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+ARTIFACTS_FILE = "artifacts.db"
+MAX_STORED_CHARS = 8 * 1024 * 1024 # Output beyond this is not stored
+MAX_INDEXED_CHARS = 1024 * 1024 # Only the start of a longer output is searchable
+MAX_STDERR_CHARS = 4000
+MAX_QUERY_TERMS = 16
+SEARCH_RESULTS = 5
+SNIPPET_LINES = 6 # Matching lines shown for each result
+MAX_SNIPPET_LINE_CHARS = 200
+SCAN_LIMIT = 200 # Most recent outputs searched when SQLite has no full-text index
+CONTEXT_RESULTS = 3 # Earlier outputs offered to the LLM with a request
+CONTEXT_MAX_CHARS = 2000
+CONTEXT_MIN_COVERAGE = 0.5 # Share of the request's words an earlier output must contain to be offered
+
+# Words that say nothing about which output is meant
+STOP_WORDS = frozenset("""
+a an and are as at be by can did do does earlier for from had has have how i in is it me my of on or
+show that the there this to was were what which who with you again before last previous
+""".split())
+
+_WORD = re.compile(r"\w+")
+
+def query_terms(text: str) -> list:
+    """Returns the distinct search terms of a query, in order."""
+    terms = [word for word in _WORD.findall(text.lower()) if word not in STOP_WORDS]
+    return list(dict.fromkeys(terms))[:MAX_QUERY_TERMS]
+
+def parse_answer(command: str):
+    """
+    Extracts an answer given from earlier outputs instead of a command.
+
+    :param command: The generated command.
+    :return: The text inside the <answer> tag, or None if the command is not an answer.
+    """
+    if not command or not command.lstrip().startswith("<answer>"):
+        return None
+    match = re.search(r'<answer>(.*?)(?:</answer>|$)', command, re.DOTALL)
+    return match.group(1).strip()
+
+class ArtifactStore:
+    """
+    The outputs of the commands run by the agent, kept for search and recall.
+
+    Each executed command is stored with its request, exit status, line count,
+    zlib-compressed output and, once ready, its summary, in an SQLite database.
+    The request, command, summary and the start of the output are indexed with
+    FTS5 (a contentless index, so the text is not stored twice); if SQLite was
+    built without FTS5, the most recent outputs are scanned instead.
+
+    By default the database is a temporary file deleted when the session ends;
+    with a path, outputs persist across sessions. The store may be used from
+    worker threads.
+    """
+
+    def __init__(self, path: str = None):
+        """
+        :param path: The database file, or None for a temporary one that lasts for this session.
+        """
+        self.temporary = path is None
+        if self.temporary:
+            fd, path = tempfile.mkstemp(prefix="hacker-agent-artifacts-", suffix=".db")
+            os.close(fd)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS artifacts (
+                id INTEGER PRIMARY KEY,
+                created REAL NOT NULL,
+                request TEXT NOT NULL,
+                command TEXT,
+                exit_code INTEGER,
+                line_count INTEGER,
+                stored_chars INTEGER,
+                truncated INTEGER,
+                stderr TEXT,
+                summary TEXT,
+                output BLOB
+            );
+            -- One row per indexed text; several texts (e.g. output and summary) may belong to one artifact
+            CREATE TABLE IF NOT EXISTS fragments (id INTEGER PRIMARY KEY, artifact_id INTEGER NOT NULL);
+        """)
+        try:
+            self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS artifact_index USING fts5(text, content='')")
+            self.indexed = True
+        except sqlite3.OperationalError:
+            self.indexed = False
+        self._db.commit()
+
+    def add(self, user_input: str, result) -> int:
+        """
+        Stores the output of an executed command.
+
+        :param user_input: The request the command was run for.
+        :param result: The `CommandResult` (or `PlanResult`); its spooled output is read in full.
+        :return: The id of the new artifact.
+        """
+        lines = []
+        size = 0
+        truncated = bool(result.truncated)
+        for line in result.iter_output_lines():
+            if size + len(line) + 1 > MAX_STORED_CHARS:
+                truncated = True
+                break
+            lines.append(line)
+            size += len(line) + 1
+        output = "\n".join(lines)
+        indexed_text = "\n".join((user_input, result.command or "", output[:MAX_INDEXED_CHARS]))
+        with self._lock:
+            with self._db:
+                cursor = self._db.execute(
+                    "INSERT INTO artifacts (created, request, command, exit_code, line_count, stored_chars, truncated, stderr, output) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (time.time(), user_input, result.command, result.exit_code, result.line_count, len(output), truncated,
+                     (result.stderr or "")[-MAX_STDERR_CHARS:], zlib.compress(output.encode('utf-8')))
+                )
+                artifact_id = cursor.lastrowid
+                self._index(artifact_id, indexed_text)
+        return artifact_id
+
+    def set_summary(self, artifact_id: int, summary: str):
+        """Stores the summary of an artifact's output and makes it searchable."""
+        with self._lock:
+            with self._db:
+                self._db.execute("UPDATE artifacts SET summary = ? WHERE id = ?", (summary, artifact_id))
+                self._index(artifact_id, summary)
+
+    def get(self, artifact_id: int) -> dict:
+        """
+        Returns an artifact's metadata and summary, without its output.
+
+        :return: A dictionary, or None if there is no such artifact.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, created, request, command, exit_code, line_count, stored_chars, truncated, stderr, summary "
+                "FROM artifacts WHERE id = ?", (artifact_id,)
+            ).fetchone()
+        return self._record(row) if row else None
+
+    def iter_output_lines(self, artifact_id: int):
+        """Yields the stored output of an artifact line by line."""
+        with self._lock:
+            row = self._db.execute("SELECT output FROM artifacts WHERE id = ?", (artifact_id,)).fetchone()
+        if row and row[0]:
+            yield from zlib.decompress(row[0]).decode('utf-8').split("\n")
+
+    def recent(self, limit: int = SEARCH_RESULTS) -> list:
+        """Returns the metadata of the most recent artifacts, newest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, created, request, command, exit_code, line_count, stored_chars, truncated, stderr, summary "
+                "FROM artifacts ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._record(row) for row in rows]
+
+    def search(self, query: str, limit: int = SEARCH_RESULTS) -> list:
+        """
+        Finds the stored outputs matching a query.
+
+        Any of the query's words may match; outputs are ranked by the full-text
+        index (BM25), or by the number of matching words without it.
+
+        :param query: Free text, e.g. "port 22 open".
+        :param limit: The maximum number of results.
+        :return: Artifact records, best match first, each with its matching lines as
+            "snippets" (line number, line) and the share of the query's words it contains as "coverage".
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        if self.indexed:
+            match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT fragments.artifact_id FROM artifact_index JOIN fragments ON fragments.id = artifact_index.rowid "
+                    "WHERE artifact_index MATCH ? ORDER BY rank LIMIT ?", (match, limit * 4)
+                ).fetchall()
+            candidates = list(dict.fromkeys(row[0] for row in rows))[:limit]
+        else:
+            with self._lock:
+                rows = self._db.execute("SELECT id FROM artifacts ORDER BY id DESC LIMIT ?", (SCAN_LIMIT,)).fetchall()
+            candidates = [row[0] for row in rows]
+
+        hits = []
+        for artifact_id in candidates:
+            record = self.get(artifact_id)
+            if record is None:
+                continue
+            found = set(terms) & set(_WORD.findall(" ".join((record["request"], record["command"] or "", record["summary"] or "")).lower()))
+            record["snippets"] = self._snippets(artifact_id, terms, found)
+            record["coverage"] = len(found) / len(terms)
+            if found:
+                hits.append(record)
+        if not self.indexed:
+            hits.sort(key=lambda hit: -hit["coverage"])
+        return hits[:limit]
+
+    def related(self, user_input: str, limit: int = CONTEXT_RESULTS) -> list:
+        """
+        Finds the stored outputs that may already answer a request.
+
+        :return: The `search` results containing at least `CONTEXT_MIN_COVERAGE` of the request's words.
+        """
+        return [hit for hit in self.search(user_input, limit) if hit["coverage"] >= CONTEXT_MIN_COVERAGE]
+
+    def stats(self) -> dict:
+        """Returns the number and size of the stored outputs."""
+        with self._lock:
+            count, chars, stored_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(stored_chars), 0), COALESCE(SUM(LENGTH(output)), 0) FROM artifacts"
+            ).fetchone()
+        return {"artifacts": count, "output_chars": chars, "stored_bytes": stored_bytes,
+                "path": self.path, "temporary": self.temporary, "indexed": self.indexed}
+
+    def close(self):
+        """Closes the database; a temporary one is deleted."""
+        with self._lock:
+            self._db.close()
+        if self.temporary:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def _index(self, artifact_id: int, text: str):
+        if not self.indexed or not text:
+            return
+        cursor = self._db.execute("INSERT INTO fragments (artifact_id) VALUES (?)", (artifact_id,))
+        self._db.execute("INSERT INTO artifact_index (rowid, text) VALUES (?, ?)", (cursor.lastrowid, text))
+
+    def _snippets(self, artifact_id: int, terms: list, found: set) -> list:
+        """Picks the output lines containing the most query terms; adds the terms seen to `found`."""
+        with self._lock:
+            row = self._db.execute("SELECT output FROM artifacts WHERE id = ?", (artifact_id,)).fetchone()
+        if not row or not row[0]:
+            return []
+        # Only the indexed part is scanned, so search results and snippets agree
+        output = zlib.decompressobj().decompress(row[0], MAX_INDEXED_CHARS * 4).decode('utf-8', errors='replace')[:MAX_INDEXED_CHARS]
+        wanted = set(terms)
+        scored = []
+        for line_number, line in enumerate(output.split("\n"), 1):
+            matched = wanted.intersection(_WORD.findall(line.lower()))
+            if matched:
+                found.update(matched)
+                scored.append((-len(matched), line_number, line))
+        best = sorted(scored)[:SNIPPET_LINES]
+        return [(line_number, line[:MAX_SNIPPET_LINE_CHARS]) for _, line_number, line in sorted(best, key=lambda item: item[1])]
+
+    @staticmethod
+    def _record(row) -> dict:
+        keys = ("id", "created", "request", "command", "exit_code", "line_count", "stored_chars", "truncated", "stderr", "summary")
+        record = dict(zip(keys, row))
+        record["truncated"] = bool(record["truncated"])
+        return record
+
+def format_references(hits: list, max_chars: int = CONTEXT_MAX_CHARS) -> str:
+    """
+    Formats earlier outputs for the command-generation prompt.
+
+    :param hits: Results of `ArtifactStore.related`.
+    :return: The excerpts, or an empty string if there are none.
+    """
+    if not hits:
+        return ""
+    parts = []
+    remaining = max_chars
+    for hit in hits:
+        lines = [f"[#{hit['id']}] Request: {hit['request']}",
+                 f"Command: {hit['command']} (exit code {hit['exit_code']}, {hit['line_count']} lines, "
+                 f"run {time.strftime('%Y-%m-%d %H:%M', time.localtime(hit['created']))})"]
+        if hit["summary"]:
+            lines.append(f"Summary: {hit['summary']}")
+        if hit["snippets"]:
+            lines.append("Matching output lines:")
+            lines.extend(f"  {line_number}: {line}" for line_number, line in hit["snippets"])
+        text = "\n".join(lines)
+        if len(text) > remaining:
+            text = text[:remaining]
+        parts.append(text)
+        remaining -= len(text)
+        if remaining <= 0:
+            break
+    return "Stored output of earlier commands that matches this request:\n" + "\n\n".join(parts) + "\n\n"
@@ -0,0 +1,60 @@
+import asyncio
+import contextvars
+import threading
+
+def _resolve(future, result=None, exception=None):
+    """Completes an asyncio future from the event loop thread unless it was already cancelled."""
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    Runs a blocking call in a daemon thread and awaits its result without blocking the event loop.
+
+    Unlike the default executor, the worker thread never delays interpreter
+    shutdown, so a call that is still waiting on the network or on stdin when
+    the session ends cannot hang the exit. Cancelling the awaiting task returns
+    immediately and the call's eventual result is discarded. The call runs in a
+    copy of the caller's context, so context variables (e.g. the current
+    telemetry span) stay visible.
+
+    :param func: The blocking callable to run.
+    :return: The callable's return value.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    context = contextvars.copy_context()
+
+    def worker():
+        try:
+            result = context.run(func, *args, **kwargs)
+        except BaseException as e:
+            outcome = {"exception": e}
+        else:
+            outcome = {"result": result}
+        try:
+            loop.call_soon_threadsafe(lambda: _resolve(future, **outcome))
+        except RuntimeError:
+            # The event loop has already been closed; nobody is waiting any more
+            pass
+
+    threading.Thread(target=worker, daemon=True).start()
+    return await future
+
+async def run_cancellable(func):
+    """
+    Runs a blocking call that supports cooperative cancellation in a daemon thread.
+
+    :param func: A callable taking a `threading.Event` that is set when the awaiting task is cancelled.
+    :return: The callable's return value.
+    """
+    cancel_event = threading.Event()
+    try:
+        return await run_in_thread(func, cancel_event)
+    except asyncio.CancelledError:
+        cancel_event.set()
+        raise
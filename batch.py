@@ -0,0 +1,280 @@
+import asyncio
+import json
+import sys
+import time
+from async_utils import run_in_thread
+from command_resolver import extract_install_calls, find_missing_executables, default_resolver
+from output_chunking import is_worth_summarizing
+from output_parsers import parse_result, PARSED_RENDER_MAX_LINES
+from plan_executor import parse_plan, execute_plan
+from platform_utils import get_os_type, stream_command_on_host
+from response_cache import cache_key
+
+DEFAULT_WORKERS = 4
+
+def read_batch_requests(source: str) -> list:
+    """
+    Reads batch requests from a file, or from stdin when `source` is "-".
+
+    Each non-empty line is one request. Lines starting with "#" are comments,
+    and lines holding a JSON object use its "request" field.
+
+    :param source: A file path or "-".
+    :return: The list of request strings.
+    """
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+
+    requests = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            try:
+                line = str(json.loads(line).get("request", "")).strip()
+            except (json.JSONDecodeError, AttributeError):
+                pass
+        if line:
+            requests.append(line)
+    return requests
+
+class BatchRunner:
+    """
+    Runs many requests through the generate -> execute -> summarize pipeline
+    with a bounded pool of concurrent workers and no interactive output.
+
+    Every request produces one JSON record with the command, its output and
+    exit status, the locally parsed output of known tools, the summary and
+    per-stage timings.
+    """
+
+    def __init__(self, tool_catalog, llm_client, summary_policy: dict, plan_policy: dict = None, response_cache=None, workers: int = DEFAULT_WORKERS,
+                 max_retries: int = 3, llm_timeout: float = None, command_timeout: float = None, summary_timeout: float = None):
+        """
+        :param tool_catalog: The catalog providing the current tool definitions.
+        :param llm_client: The LLM client shared by all workers.
+        :param summary_policy: The summarization policy (see `main.summary_policy_from_config`); "background" behaves like "inline"
+            in batch mode, and the output parser settings default to on.
+        :param plan_policy: Optional multi-step plan settings ("enabled" and "max_parallel"); plans are off without it.
+        :param response_cache: Optional cache of previously generated commands.
+        :param workers: The number of requests processed concurrently.
+        :param max_retries: Max attempts for the LLM to fix a command.
+        :param llm_timeout: Hard timeout in seconds for each LLM request (None disables it).
+        :param command_timeout: Hard timeout in seconds for each command (None disables it).
+        :param summary_timeout: Hard timeout in seconds for each summary (None disables it).
+        """
+        self.tool_catalog = tool_catalog
+        self.llm_client = llm_client
+        self.summary_policy = {"parsers": True, "render_max_lines": PARSED_RENDER_MAX_LINES, **summary_policy}
+        self.plan_policy = plan_policy or {"enabled": False, "max_parallel": 1}
+        self.response_cache = response_cache
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.llm_timeout = llm_timeout
+        self.command_timeout = command_timeout
+        self.summary_timeout = summary_timeout
+
+    async def run(self, requests: list, output, on_record=None) -> dict:
+        """
+        Processes all requests and writes one JSON line per request to `output`.
+
+        Records are written in completion order; their "index" field refers to
+        the position of the request in the input.
+
+        :param requests: The request strings.
+        :param output: A writable text file object.
+        :param on_record: Optional callback receiving each record, e.g. for progress output.
+        :return: Counts of succeeded and failed requests and the total wall-clock time.
+        """
+        queue = asyncio.Queue()
+        for index, user_input in enumerate(requests):
+            queue.put_nowait((index, user_input))
+
+        counts = {"total": len(requests), "succeeded": 0, "failed": 0}
+        start = time.monotonic()
+
+        async def worker():
+            while True:
+                try:
+                    index, user_input = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                record = await self.process(index, user_input)
+                counts["succeeded" if record["success"] else "failed"] += 1
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                if on_record:
+                    on_record(record)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, len(requests)) or 1)))
+        counts["duration"] = round(time.monotonic() - start, 3)
+        return counts
+
+    async def process(self, index: int, user_input: str) -> dict:
+        """
+        Runs a single request to completion.
+
+        :return: The JSON-serializable result record.
+        """
+        # Imported on first use: it pulls in requests, which the interactive prompt does not need yet
+        from llm_handler import get_command_from_llm_async, summarize_output_with_llm_async
+        record = {
+            "index": index,
+            "request": user_input,
+            "success": False,
+            "attempts": 0,
+            "thought": None,
+            "command": None,
+            "steps": None,
+            "cached": False,
+            "exit_code": None,
+            "timed_out": False,
+            "output": None,
+            "output_lines": 0,
+            "output_truncated": False,
+            "stderr": None,
+            "parsed": None,
+            "summary": None,
+            "missing_packages": None,
+            "unresolved_commands": None,
+            "error": None,
+            "timings": {"llm": 0.0, "execute": 0.0, "parse": 0.0, "summary": 0.0, "total": 0.0},
+        }
+        timings = record["timings"]
+        start = time.monotonic()
+        current_context = None
+
+        try:
+            for attempt in range(self.max_retries):
+                record["attempts"] = attempt + 1
+                key = None
+                cached = None
+                if self.response_cache is not None:
+                    key = cache_key(user_input, self.tool_catalog.definitions, get_os_type(), self.llm_client.model_name, current_context)
+                    cached = self.response_cache.get(key)
+
+                stage_start = time.monotonic()
+                try:
+                    if cached is not None:
+                        thought, command = cached
+                    else:
+                        thought, command = await asyncio.wait_for(get_command_from_llm_async(
+                            user_input, self.tool_catalog.definitions, self.llm_client, context=current_context,
+                            plans=self.plan_policy["enabled"]), self.llm_timeout)
+                except asyncio.TimeoutError:
+                    current_context = "The previous LLM request timed out."
+                    record["error"] = current_context
+                    continue
+                finally:
+                    timings["llm"] += time.monotonic() - stage_start
+
+                record.update(thought=thought, command=command, cached=cached is not None)
+                if not command:
+                    current_context = "LLM did not provide a command."
+                    record["error"] = thought or current_context
+                    continue
+
+                try:
+                    plan = parse_plan(command)
+                except ValueError as e:
+                    current_context = f"Your plan was invalid: {e}."
+                    record["error"] = current_context
+                    continue
+
+                # Steps are plain shell commands; only the executables they need are checked
+                packages, command = extract_install_calls(command) if plan is None else ([], command)
+                packages, unresolved = await self.find_missing_packages(
+                    packages, command if plan is None else "\n".join(step.command for step in plan))
+                if packages or unresolved:
+                    # Nothing is installed without a user to confirm it, and retrying would not change that
+                    record.update(missing_packages=packages or None, unresolved_commands=unresolved or None)
+                    record["error"] = describe_missing(packages, unresolved)
+                    break
+
+                stage_start = time.monotonic()
+                if plan is None:
+                    result = await stream_command_on_host(command, timeout=self.command_timeout)
+                else:
+                    result = await execute_plan(plan, max_parallel=self.plan_policy["max_parallel"], timeout=self.command_timeout)
+                    record["steps"] = result.step_records()
+                timings["execute"] += time.monotonic() - stage_start
+                try:
+                    record.update(
+                        exit_code=result.exit_code,
+                        timed_out=result.timed_out,
+                        output=result.output,
+                        output_lines=result.line_count,
+                        output_truncated=result.truncated,
+                        stderr=result.stderr
+                    )
+                    if not result.succeeded:
+                        current_context = result.describe_failure()
+                        record["error"] = current_context
+                        if cached is not None:
+                            self.response_cache.discard(key)
+                        continue
+
+                    record.update(success=True, error=None)
+                    if self.response_cache is not None and cached is None:
+                        self.response_cache.put(key, thought, command)
+
+                    policy = self.summary_policy
+                    if policy["mode"] != "off" and is_worth_summarizing(result.output, result.line_count, policy["min_lines"], policy["min_chars"]):
+                        stage_start = time.monotonic()
+                        parsed = await run_in_thread(parse_result, result) if policy["parsers"] else None
+                        timings["parse"] += time.monotonic() - stage_start
+                        if parsed is not None:
+                            record["parsed"] = parsed.text
+                            if parsed.is_short(policy["render_max_lines"]):
+                                # Short enough to stand in for the summary
+                                break
+                        stage_start = time.monotonic()
+                        try:
+                            record["summary"] = await asyncio.wait_for(summarize_output_with_llm_async(
+                                user_input, parsed.text if parsed is not None else result.iter_output_lines(), self.llm_client), self.summary_timeout)
+                        except asyncio.TimeoutError:
+                            record["error"] = "Summarization timed out."
+                        finally:
+                            timings["summary"] += time.monotonic() - stage_start
+                    break
+                finally:
+                    result.cleanup()
+        except Exception as e:
+            record["error"] = f"Unexpected error: {e}"
+
+        timings["total"] = time.monotonic() - start
+        for stage in timings:
+            timings[stage] = round(timings[stage], 3)
+        return record
+
+    async def find_missing_packages(self, packages: list, command: str) -> (list, list):
+        """
+        Works out what a generated command needs installed before it can run.
+
+        :param packages: The packages the command asked for via `platform_utils.install_package(...)`.
+        :param command: The shell command (or the plan's step commands) to check for missing executables.
+        :return: A tuple of (packages to install, executables no package was found for).
+        """
+        missing = find_missing_executables(command) if command else []
+        resolved = await run_in_thread(default_resolver().resolve_all, missing) if missing else {}
+        unresolved = [binary for binary in missing if not resolved.get(binary)]
+        packages = list(dict.fromkeys(packages + [package for package in resolved.values() if package]))
+        return packages, unresolved
+
+def describe_missing(packages: list, unresolved: list) -> str:
+    """
+    Describes why a command was not run because something it needs is not installed.
+
+    :param packages: The packages that would have to be installed.
+    :param unresolved: The executables no package was found for.
+    """
+    reasons = []
+    if packages:
+        reasons.append(f"it needs packages that are not installed: {', '.join(packages)}")
+    if unresolved:
+        reasons.append(f"it uses commands that are not installed and no package provides: {', '.join(unresolved)}")
+    return f"The command was not run: {'; '.join(reasons)}. Batch mode does not install packages."
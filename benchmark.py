@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from batch import BatchRunner
+from llm_client import LLMClient
+from llm_handler import get_command_from_llm_async
+from output_parsers import PARSED_RENDER_MAX_LINES
+from platform_utils import run_command_on_host_async, stream_command_on_host
+from telemetry import percentiles, telemetry
+from tool_discovery import discover_tools_on_host, ToolCatalog
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+BENCHMARK_REQUESTS = 40 # Requests driven through the full pipeline
+BENCHMARK_WORKERS = 4
+LLM_SAMPLES = 20 # Command-generation calls per mode (streaming / non-streaming)
+EXECUTE_SAMPLES = 20 # Short commands timed for process start-up overhead
+EXECUTE_LINES = 200000 # Lines produced by the bulk output benchmark
+STARTUP_SAMPLES = 3
+BENCHMARK_COMMAND = "seq 1 200" # Long enough to be summarized
+REGRESSION_TOLERANCE = 0.2 # Allowed slowdown against a baseline before failing
+
+# Metrics compared against a baseline: (section, metric, key)
+GATED_METRICS = [
+    ("startup", "import", "p50"),
+    ("discovery", "cold", "p50"),
+    ("discovery", "cached", "p50"),
+    ("llm", "complete", "p95"),
+    ("llm", "stream_first_thought", "p95"),
+    ("execute", "spawn", "p95"),
+    ("pipeline", "total", "p95"),
+]
+
+def start_mock_server(args) -> (subprocess.Popen, str):
+    """
+    Starts mock_llm_server.py in its own process so it does not compete with the
+    agent for the GIL or show up in its memory figures.
+
+    :return: The server process and its base URL.
+    """
+    command = [
+        sys.executable, os.path.join(REPO_DIR, "mock_llm_server.py"),
+        "--latency", str(args.latency),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--error-rate", str(args.error_rate),
+        "--command", BENCHMARK_COMMAND,
+        "--seed", str(args.seed),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url:
+        process.kill()
+        raise RuntimeError("The mock LLM server failed to start.")
+    return process, url
+
+def measure_startup(samples: int = STARTUP_SAMPLES) -> dict:
+    """Times a fresh interpreter importing the agent's modules."""
+    durations = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], cwd=REPO_DIR, check=True)
+        durations.append(time.perf_counter() - start)
+    return {"import": percentiles(durations)}
+
+async def measure_discovery(samples: int) -> (dict, str):
+    """
+    Times tool discovery with and without the on-disk cache.
+
+    :return: The results and the discovered tool definitions.
+    """
+    cold, cached = [], []
+    definitions = "[]"
+    for _ in range(samples):
+        start = time.perf_counter()
+        definitions = await discover_tools_on_host(verbose=False, use_cache=False)
+        cold.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        await discover_tools_on_host(verbose=False, use_cache=True)
+        cached.append(time.perf_counter() - start)
+    return {"cold": percentiles(cold), "cached": percentiles(cached), "tools": len(json.loads(definitions))}, definitions
+
+async def measure_llm(llm_client: LLMClient, tool_definitions: str, samples: int) -> dict:
+    """Times command generation, streaming and non-streaming."""
+    complete, stream_total, first_thought = [], [], []
+    for _ in range(samples):
+        start = time.perf_counter()
+        await get_command_from_llm_async("list the numbers from 1 to 200", tool_definitions, llm_client)
+        complete.append(time.perf_counter() - start)
+
+    for _ in range(samples):
+        start = time.perf_counter()
+        seen = []
+
+        def on_thought(thought):
+            if not seen:
+                seen.append(time.perf_counter() - start)
+
+        await get_command_from_llm_async("list the numbers from 1 to 200", tool_definitions, llm_client, stream=True, on_thought=on_thought)
+        stream_total.append(time.perf_counter() - start)
+        first_thought.extend(seen)
+    return {"complete": percentiles(complete), "stream": percentiles(stream_total), "stream_first_thought": percentiles(first_thought)}
+
+async def measure_execute(samples: int, lines: int) -> dict:
+    """Times process start-up and bulk output streaming."""
+    spawn = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        await run_command_on_host_async("true")
+        spawn.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    result = await stream_command_on_host(f"seq 1 {lines}")
+    duration = time.perf_counter() - start
+    result.cleanup()
+    return {
+        "spawn": percentiles(spawn),
+        "bulk": {"lines": result.line_count, "bytes": result.byte_count, "seconds": round(duration, 4),
+                 "lines_per_second": round(result.line_count / duration) if duration else None},
+    }
+
+async def measure_pipeline(llm_client: LLMClient, tool_definitions: str, requests: int, workers: int) -> dict:
+    """Drives requests through generate -> execute -> summarize, as batch mode does."""
+    runner = BatchRunner(
+        ToolCatalog(tool_definitions), llm_client,
+        {"mode": "inline", "min_lines": 0, "min_chars": 0, "parsers": True, "render_max_lines": PARSED_RENDER_MAX_LINES},
+        workers=workers, max_retries=3, llm_timeout=60, command_timeout=60, summary_timeout=60
+    )
+    with open(os.devnull, 'w') as output:
+        records = []
+        counts = await runner.run([f"list the numbers up to 200 (#{i})" for i in range(requests)], output, on_record=records.append)
+
+    stages = {stage: percentiles([record["timings"][stage] for record in records]) for stage in ("llm", "execute", "parse", "summary", "total")}
+    stages["succeeded"] = counts["succeeded"]
+    stages["failed"] = counts["failed"]
+    stages["duration"] = counts["duration"]
+    stages["throughput"] = round(counts["total"] / counts["duration"], 2) if counts["duration"] else None
+    return stages
+
+async def run_benchmarks(args) -> dict:
+    server, url = start_mock_server(args)
+    llm_client = LLMClient({"name": "mock", "url": url, "api_key": None, "model_name": "mock"}, pool_size=max(args.workers, 4))
+    report = {
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "settings": {key: getattr(args, key) for key in ("requests", "workers", "latency", "tokens_per_second", "error_rate", "seed")},
+    }
+    try:
+        report["startup"] = measure_startup()
+        report["discovery"], tool_definitions = await measure_discovery(args.discovery_samples)
+        report["llm"] = await measure_llm(llm_client, tool_definitions, args.llm_samples)
+        report["execute"] = await measure_execute(EXECUTE_SAMPLES, args.execute_lines)
+        report["pipeline"] = await measure_pipeline(llm_client, tool_definitions, args.requests, args.workers)
+        # Read before the memory pass, which is traced and would add to both figures
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report["tokens"] = telemetry.summary()["tokens"]
+
+        # tracemalloc slows every allocation down, so the peak is taken in a separate, untimed pipeline pass
+        tracemalloc.start()
+        try:
+            await measure_pipeline(llm_client, tool_definitions, args.requests, args.workers)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        llm_client.close()
+        server.terminate()
+        server.wait()
+
+    report["memory"] = {
+        "python_peak_bytes": peak,
+        # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+        "max_rss_bytes": max_rss if sys.platform == "darwin" else max_rss * 1024,
+    }
+    return report
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Lists the gated metrics that got slower than the baseline allows.
+
+    :return: One message per regression.
+    """
+    regressions = []
+    for section, metric, key in GATED_METRICS:
+        current = report.get(section, {}).get(metric, {}).get(key)
+        previous = baseline.get(section, {}).get(metric, {}).get(key)
+        if current is None or not previous:
+            continue
+        if current > previous * (1 + tolerance):
+            regressions.append(f"{section}.{metric}.{key}: {current:.4f}s vs. baseline {previous:.4f}s")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the agent against a local mock LLM server (no network needed).")
+    parser.add_argument("--requests", type=int, default=BENCHMARK_REQUESTS, help="Requests driven through the full pipeline.")
+    parser.add_argument("--workers", type=int, default=BENCHMARK_WORKERS, help="Concurrent pipeline workers.")
+    parser.add_argument("--llm-samples", type=int, default=LLM_SAMPLES, help="Command-generation calls per mode.")
+    parser.add_argument("--discovery-samples", type=int, default=3, help="Tool discovery runs.")
+    parser.add_argument("--execute-lines", type=int, default=EXECUTE_LINES, help="Lines produced by the bulk output benchmark.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock server latency before the first token, in seconds.")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="Mock server generation speed.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock requests failing with HTTP 503.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the error injection.")
+    parser.add_argument("--output", default="-", metavar="FILE", help="Where the JSON report is written (default: stdout).")
+    parser.add_argument("--baseline", metavar="FILE", help="A previous report; exit with status 1 if a gated metric regressed.")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="Allowed slowdown against the baseline (0.2 = 20%%).")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    output_path = args.output if args.output == "-" else os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    # Keep the discovery cache of the run out of the working directory
+    working_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="hacker-agent-bench-") as scratch_dir:
+        os.chdir(scratch_dir)
+        try:
+            report = asyncio.run(run_benchmarks(args))
+        finally:
+            os.chdir(working_dir)
+
+    text = json.dumps(report, indent=4)
+    if output_path == "-":
+        print(text)
+    else:
+        with open(output_path, 'w') as f:
+            f.write(text + "\n")
+
+    if baseline_path:
+        with open(baseline_path, 'r') as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
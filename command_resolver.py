@@ -0,0 +1,351 @@
+import glob
+import gzip
+import json
+import lzma
+import os
+import re
+import shlex
+import sqlite3
+import subprocess
+from functools import lru_cache
+from platform_utils import get_package_manager, APT_LISTS_DIR
+from tool_discovery import scan_path
+
+BINARY_PACKAGES_FILE = "binary_packages.json" # Binary-to-package index built from apt's Contents files
+COMMAND_NOT_FOUND_DB = "/var/lib/command-not-found/commands.db"
+HOMEBREW_EXECUTABLES_FILES = [
+    "api/internal/executables.txt", # Relative to HOMEBREW_CACHE
+    "/opt/homebrew/Library/Taps/homebrew/homebrew-command-not-found/executables.txt",
+    "/usr/local/Homebrew/Library/Taps/homebrew/homebrew-command-not-found/executables.txt",
+]
+BINARY_DIRS = ("usr/bin/", "usr/sbin/", "bin/", "sbin/", "usr/games/", "usr/local/bin/")
+
+# Binaries whose package is named differently: binary -> (apt package, brew formula)
+KNOWN_PACKAGES = {
+    "msfconsole": ("metasploit-framework", "metasploit"),
+    "msfvenom": ("metasploit-framework", "metasploit"),
+    "dig": ("dnsutils", "bind"),
+    "nslookup": ("dnsutils", "bind"),
+    "host": ("bind9-host", "bind"),
+    "ifconfig": ("net-tools", None),
+    "netstat": ("net-tools", None),
+    "arp": ("net-tools", None),
+    "route": ("net-tools", None),
+    "ip": ("iproute2", "iproute2mac"),
+    "ss": ("iproute2", None),
+    "tshark": ("tshark", "wireshark"),
+    "airodump-ng": ("aircrack-ng", "aircrack-ng"),
+    "aireplay-ng": ("aircrack-ng", "aircrack-ng"),
+    "airmon-ng": ("aircrack-ng", "aircrack-ng"),
+    "nc": ("netcat-openbsd", "netcat"),
+    "ncat": ("ncat", "nmap"),
+    "john": ("john", "john-jumbo"),
+    "searchsploit": ("exploitdb", "exploitdb"),
+    "smbclient": ("smbclient", "samba"),
+    "7z": ("p7zip-full", "p7zip"),
+}
+
+# Words that start a command but are not executables on PATH
+SHELL_BUILTINS = {
+    "alias", "bg", "break", "builtin", "cd", "continue", "declare", "echo", "eval", "exit", "export", "false",
+    "fg", "hash", "jobs", "let", "local", "popd", "printf", "pushd", "pwd", "read", "readonly", "return",
+    "set", "shift", "source", ".", ":", "test", "[", "[[", "]]", "trap", "true", "type", "ulimit", "umask",
+    "unalias", "unset", "wait", "kill",
+}
+# Keywords after which the next word is again a command
+COMMAND_KEYWORDS = {"if", "then", "else", "elif", "while", "until", "do", "!", "{", "}", "time", "fi", "done", "esac"}
+# Keywords whose following words are not commands (up to the next separator)
+ARGUMENT_KEYWORDS = {"for", "case", "select", "function", "in"}
+# Commands that run another command: wrapper -> options taking a value
+WRAPPERS = {
+    "sudo": {"-u", "-g", "-C", "-D", "-h", "-p", "-r", "-t", "-U"},
+    "env": {"-u", "-C", "-S"},
+    "nice": {"-n"},
+    "ionice": {"-c", "-n", "-p"},
+    "nohup": set(),
+    "command": set(),
+    "exec": {"-a"},
+    "xargs": {"-I", "-n", "-P", "-d", "-E", "-L", "-s"},
+    "stdbuf": {"-i", "-o", "-e"},
+    "timeout": {"-s", "-k"},
+    "watch": {"-n", "-d"},
+    "proxychains": {"-f"},
+    "proxychains4": {"-f"},
+    "torsocks": set(),
+}
+WRAPPERS_WITH_OPERAND = {"timeout"} # The first non-option argument is not the command (e.g. the duration)
+REDIRECTIONS = {">", ">>", "<", "<<", "<<<", "&>", "&>>", ">&", "<&", "<>", ">|"}
+ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+INSTALL_CALL = re.compile(r"""platform_utils\.install_package\(\s*["']([^"']+)["']\s*\)\s*(?:&&|;|\n)?\s*""")
+
+def extract_install_calls(command: str) -> (list, str):
+    """
+    Splits `platform_utils.install_package("<name>")` calls off a generated command.
+
+    The system prompt lets the LLM request installs this way, but they are not
+    shell commands, so the agent performs them itself.
+
+    :param command: The generated command.
+    :return: A tuple of (package names, the remaining shell command).
+    """
+    packages = INSTALL_CALL.findall(command)
+    remaining = INSTALL_CALL.sub("", command).strip()
+    remaining = re.sub(r"^(?:&&|;)\s*|\s*(?:&&|;)$", "", remaining).strip()
+    return packages, remaining
+
+def _tokenize(command: str) -> list:
+    lexer = shlex.shlex(command.replace("\n", " ; "), posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    try:
+        return list(lexer)
+    except ValueError:
+        # Unbalanced quotes; fall back to a plain split
+        return command.split()
+
+def command_executables(command: str) -> list:
+    """
+    Lists the executables a shell command invokes.
+
+    Pipelines, lists, subshells and command substitutions are followed; shell
+    builtins, keywords, variable assignments and wrappers such as `sudo` or
+    `timeout` are looked through, so `sudo -u root nmap ... | grep open`
+    yields ["sudo", "nmap", "grep"].
+
+    :param command: The shell command.
+    :return: The executable names (or paths), in order of appearance, without duplicates.
+    """
+    executables = []
+    expect_command = True
+    skip_next = False
+    heredoc_pending = False
+    heredoc = None # (delimiter, inside body)
+    wrapper = None # (name, options taking a value, operand still pending)
+
+    for token in _tokenize(command):
+        if heredoc is not None and heredoc[1]:
+            # The here-document body is data, up to the line holding only the delimiter
+            if token == heredoc[0]:
+                heredoc = None
+            continue
+        if skip_next:
+            skip_next = False
+            if heredoc_pending:
+                heredoc = (token.lstrip("-"), False)
+                heredoc_pending = False
+            continue
+        if token and all(ch in "();<>|&" for ch in token):
+            if token in REDIRECTIONS or token[-1] in "<>" or token.endswith(">&"):
+                skip_next = True
+                heredoc_pending = token == "<<"
+            else:
+                if token == ";" and heredoc is not None:
+                    # End of the line that started the here-document
+                    heredoc = (heredoc[0], True)
+                expect_command = True
+                wrapper = None
+            continue
+        if not expect_command:
+            continue
+
+        if wrapper is not None:
+            name, value_options, operand_pending = wrapper
+            if token.startswith("-"):
+                skip_next = token in value_options
+                continue
+            if name == "env" and ASSIGNMENT.match(token):
+                continue
+            if operand_pending:
+                wrapper = (name, value_options, False)
+                continue
+            wrapper = None
+
+        if ASSIGNMENT.match(token) or token in COMMAND_KEYWORDS:
+            continue
+        if token in ARGUMENT_KEYWORDS:
+            expect_command = False
+            continue
+        if "$" in token or "`" in token:
+            # Dynamic commands cannot be checked statically
+            expect_command = False
+            continue
+        if token not in SHELL_BUILTINS and token not in executables:
+            executables.append(token)
+        name = os.path.basename(token)
+        if name in WRAPPERS:
+            wrapper = (name, WRAPPERS[name], name in WRAPPERS_WITH_OPERAND)
+            continue
+        expect_command = False
+    return executables
+
+def find_missing_executables(command: str, path_index: dict = None) -> list:
+    """
+    Returns the executables of a command that are not installed.
+
+    :param command: The shell command.
+    :param path_index: A `scan_path` result; PATH is scanned if omitted.
+    :return: The missing executable names.
+    """
+    if path_index is None:
+        path_index = scan_path()
+    missing = []
+    for executable in command_executables(command):
+        if "/" in executable:
+            if os.path.isabs(executable) and not os.access(executable, os.X_OK):
+                missing.append(executable)
+        elif executable not in path_index:
+            missing.append(executable)
+    return missing
+
+class PackageResolver:
+    """
+    Maps binary names to the packages that provide them, without asking the LLM.
+
+    Sources, in order: a built-in map for tools whose package is named
+    differently, Ubuntu's command-not-found database, an index built from apt's
+    Contents files (as downloaded by apt-file), Homebrew's executables list, and
+    finally a package of the same name if the package manager knows one.
+    """
+
+    def __init__(self, pm: str = None):
+        """
+        :param pm: The package manager ("apt" or "brew"); detected if omitted.
+        """
+        self.pm = pm or get_package_manager()
+        self._index = None
+
+    def resolve(self, binary: str):
+        """
+        Finds the package providing a binary.
+
+        :param binary: The binary name, e.g. "dig".
+        :return: The package name, or None if no source knows it.
+        """
+        binary = os.path.basename(binary)
+        known = KNOWN_PACKAGES.get(binary)
+        if known is not None:
+            package = known[0] if self.pm == "apt" else known[1]
+            if package:
+                return package
+
+        package = self._from_command_not_found(binary) if self.pm == "apt" else None
+        if package:
+            return package
+        if self._index is None:
+            self._index = self._load_index()
+        package = self._index.get(binary)
+        if package:
+            return package
+        return binary if self._package_exists(binary) else None
+
+    def resolve_all(self, binaries: list) -> dict:
+        """
+        Resolves several binaries.
+
+        :return: A dictionary mapping each binary to its package (or None).
+        """
+        return {binary: self.resolve(binary) for binary in binaries}
+
+    def _from_command_not_found(self, binary: str):
+        if not os.path.exists(COMMAND_NOT_FOUND_DB):
+            return None
+        try:
+            with sqlite3.connect(f"file:{COMMAND_NOT_FOUND_DB}?mode=ro", uri=True) as db:
+                row = db.execute(
+                    "SELECT packages.name FROM commands JOIN packages ON commands.pkgID = packages.pkgID "
+                    "WHERE commands.command = ? ORDER BY packages.priority DESC LIMIT 1", (binary,)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def _load_index(self) -> dict:
+        if self.pm == "brew":
+            return self._load_homebrew_executables()
+        return self._load_apt_contents()
+
+    def _load_apt_contents(self) -> dict:
+        """
+        Builds (or loads the cached) binary-to-package index from apt's Contents files.
+        """
+        sources = sorted(glob.glob(os.path.join(APT_LISTS_DIR, "*Contents-*")))
+        if not sources:
+            return {}
+        signature = [[path, os.path.getmtime(path)] for path in sources]
+        try:
+            with open(BINARY_PACKAGES_FILE, 'r') as f:
+                cached = json.load(f)
+            if cached.get("signature") == signature:
+                return cached["binaries"]
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError, KeyError):
+            pass
+
+        binaries = {}
+        for path in sources:
+            for line in _read_lines(path):
+                if not line.startswith(BINARY_DIRS):
+                    continue
+                fields = line.rstrip("\n").rsplit(None, 1)
+                if len(fields) != 2:
+                    continue
+                file_path, locations = fields
+                name = os.path.basename(file_path)
+                if name and name not in binaries:
+                    # "net/nmap,universe/net/nmap-extra" -> "nmap"
+                    binaries[name] = locations.split(",")[0].rsplit("/", 1)[-1]
+
+        temp_path = f"{BINARY_PACKAGES_FILE}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"signature": signature, "binaries": binaries}, f)
+        os.replace(temp_path, BINARY_PACKAGES_FILE)
+        return binaries
+
+    def _load_homebrew_executables(self) -> dict:
+        cache_dir = os.environ.get("HOMEBREW_CACHE") or os.path.expanduser("~/Library/Caches/Homebrew")
+        binaries = {}
+        for path in HOMEBREW_EXECUTABLES_FILES:
+            path = os.path.join(cache_dir, path)
+            try:
+                with open(path, 'r') as f:
+                    for line in f:
+                        # "formula(1.2.3):exe1 exe2"
+                        formula, _, executables = line.partition(":")
+                        formula = formula.split("(")[0].strip()
+                        for executable in executables.split():
+                            binaries.setdefault(executable, formula)
+            except OSError:
+                continue
+            break
+        return binaries
+
+    def _package_exists(self, name: str) -> bool:
+        if self.pm == "apt":
+            command = ["apt-cache", "show", "--no-all-versions", name]
+        else:
+            command = ["brew", "info", "--formula", name]
+        try:
+            return subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30).returncode == 0
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+
+@lru_cache(maxsize=1)
+def default_resolver() -> PackageResolver:
+    """Returns the session's resolver, so its index is only loaded once."""
+    return PackageResolver()
+
+def _read_lines(path: str):
+    """Reads a possibly compressed Contents file line by line."""
+    if path.endswith(".lz4"):
+        try:
+            process = subprocess.Popen(["lz4cat", path], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, errors="replace")
+        except OSError:
+            return
+        with process.stdout:
+            yield from process.stdout
+        process.wait()
+        return
+    opener = gzip.open if path.endswith(".gz") else lzma.open if path.endswith(".xz") else open
+    try:
+        with opener(path, 'rt', errors="replace") as f:
+            yield from f
+    except (OSError, EOFError, lzma.LZMAError):
+        return
@@ -0,0 +1,98 @@
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+
+INSTALLED_TOOLS_FILE = "installed_tools.json"
+STORE_VERSION = 2 # Version 1 was a plain JSON list of package names
+
+class InstalledToolsStore:
+    """
+    The record of packages installed by the agent.
+
+    Every update is a read-modify-write under an exclusive lock on a sidecar
+    lock file, and the new contents replace the old file atomically, so several
+    agent sessions on the same host cannot lose each other's changes or leave a
+    truncated file behind. Each package keeps metadata such as its install time,
+    version and installed size.
+
+    The old format, a plain list of package names, is migrated on first write.
+    """
+
+    def __init__(self, path: str = INSTALLED_TOOLS_FILE):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    def packages(self) -> dict:
+        """
+        Returns the recorded packages.
+
+        :return: A dictionary mapping package names to their metadata, oldest install first.
+        """
+        with self._locked(fcntl.LOCK_SH):
+            tools = self._load()
+        return dict(sorted(tools.items(), key=lambda item: item[1].get("installed_at") or 0))
+
+    def names(self) -> list:
+        """Returns the names of the recorded packages, oldest install first."""
+        return list(self.packages())
+
+    def add(self, metadata: dict):
+        """
+        Records installed packages.
+
+        :param metadata: A dictionary mapping package names to their metadata (e.g. version and size_bytes).
+        """
+        if not metadata:
+            return
+        now = time.time()
+        with self._transaction() as tools:
+            for name, details in metadata.items():
+                entry = tools.get(name, {})
+                entry.update({key: value for key, value in details.items() if value is not None})
+                # A reinstall keeps its place in the install order
+                entry.setdefault("installed_at", now)
+                tools[name] = entry
+
+    def remove(self, names: list):
+        """Forgets uninstalled packages."""
+        with self._transaction() as tools:
+            for name in names:
+                tools.pop(name, None)
+
+    @contextmanager
+    def _locked(self, mode: int):
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _transaction(self):
+        with self._locked(fcntl.LOCK_EX):
+            tools = self._load()
+            yield tools
+            self._save(tools)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if isinstance(data, list):
+            # Version 1: only the names were recorded
+            return {name: {"installed_at": None} for name in data if isinstance(name, str)}
+        if isinstance(data, dict) and isinstance(data.get("tools"), dict):
+            return data["tools"]
+        return {}
+
+    def _save(self, tools: dict):
+        # Write to a temporary file first so a crash cannot leave a truncated store behind
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"version": STORE_VERSION, "tools": tools}, f, indent=4)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,101 @@
+import json
+import random
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# Responses worth retrying: rate limiting and transient server-side failures.
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_HTTP_RETRIES = 3 # Transport-level retries, independent of the agent's MAX_RETRIES
+BACKOFF_BASE = 0.5 # Seconds
+BACKOFF_MAX = 8.0 # Seconds
+REQUEST_TIMEOUT = 60 # Seconds
+
+class LLMClient:
+    """
+    A pooled, keep-alive HTTP client for a single LLM configuration.
+
+    The client is built once per session, so the headers, endpoint URL and the
+    underlying connections are reused by every request instead of paying the
+    TCP and TLS handshakes again. Rate limiting, transient server errors and
+    connection resets are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, llm_config: dict, pool_size: int = 4, max_retries: int = MAX_HTTP_RETRIES, timeout: float = REQUEST_TIMEOUT):
+        """
+        :param llm_config: A dictionary containing the LLM configuration (url, api_key, model_name).
+        :param pool_size: The maximum number of connections kept alive to the endpoint.
+        :param max_retries: How many times a failed request is retried before giving up.
+        :param timeout: The timeout in seconds for a single HTTP request.
+        """
+        self.config = llm_config
+        self.name = llm_config.get('name', llm_config['model_name'])
+        self.model_name = llm_config['model_name']
+        self.api_url = llm_config['url'].rstrip('/') + '/chat/completions'
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        # Add API key if it exists (for OpenAI-compatible APIs)
+        if llm_config.get("api_key"):
+            self.session.headers["Authorization"] = f"Bearer {llm_config['api_key']}"
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def chat(self, messages: list, stream: bool = False, **params) -> requests.Response:
+        """
+        Sends a chat completion request, retrying transient failures.
+
+        :param messages: The chat messages to send.
+        :param stream: If True, requests a server-sent event stream and returns before the body is read.
+        :param params: Additional request parameters such as temperature or max_tokens.
+        :return: The successful `requests` response.
+        :raises requests.exceptions.RequestException: If the request still fails after all retries.
+        """
+        data = {"model": self.model_name, "messages": messages, **params}
+        if stream:
+            data["stream"] = True
+            # Ask for token usage in the final event; servers rejecting the option can opt out
+            if self.config.get("stream_usage", True):
+                data["stream_options"] = {"include_usage": True}
+        body = json.dumps(data)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.api_url, data=body, timeout=self.timeout, stream=stream)
+            except requests.exceptions.ConnectionError:
+                # Covers refused connections, resets and connect timeouts
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._retry_after(response)
+                response.close()
+                time.sleep(delay if delay is not None else self._backoff(attempt))
+                continue
+
+            response.raise_for_status()
+            return response
+
+    def close(self):
+        """Closes all pooled connections."""
+        self.session.close()
+
+    def _backoff(self, attempt: int) -> float:
+        """Returns a full-jitter exponential backoff delay for the given attempt."""
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+    def _retry_after(self, response: requests.Response):
+        """Returns the server-requested delay from a Retry-After header, if any."""
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return min(BACKOFF_MAX, max(0.0, float(value)))
+        except ValueError:
+            return None
@@ -1,19 +1,43 @@
+import contextvars
 import requests
 import json
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from async_utils import run_cancellable
+from output_chunking import compact_lines, split_into_chunks
 from platform_utils import get_os_type
+from telemetry import telemetry
+from tool_index import format_tool_catalog
 
-def get_command_from_llm(user_input: str, tool_definitions: str, llm_config: dict, context: str = None) -> (str, str):
+SUMMARY_CONCURRENCY = 4 # Chunk summaries requested in parallel for large outputs
+CHUNK_SUMMARY_MAX_TOKENS = 256
+STREAM_DRAIN_TIMEOUT = 30 # Seconds spent reading the rest of a stream for its token usage after the command is complete
+
+# Appended to the system prompt when multi-step plans are enabled
+PLAN_INSTRUCTIONS = """
+    **MULTI-STEP PLANS**: If the request needs several shell commands and some of them do not depend on each other (for example `whois`, `dig` and `ping` against different targets), answer with a <plan> tag INSTEAD of the <command> tag. The plan is a JSON array of steps; steps without dependencies run in parallel, and a step runs only after all steps in its `depends_on` have succeeded:
+    <plan>
+    [
+        {"id": "whois", "command": "whois example.com", "depends_on": []},
+        {"id": "dns", "command": "dig +short example.com", "depends_on": []},
+        {"id": "ping", "command": "ping -c 3 example.com", "depends_on": ["dns"]}
+    ]
+    </plan>
+    Every step must be a plain shell command. Use a single <command> for simple requests, for commands that must share state (e.g. pipes or `cd`), and for `platform_utils.install_package` calls.
     """
-    Gets a command from the LLM, separating thought process from the command.
 
-    :param user_input: The user's natural language input.
-    :param tool_definitions: A JSON string of available tool definitions.
-    :param llm_config: A dictionary containing the LLM configuration (url, api_key, model_name).
-    :param context: A string containing context from the previous turn's execution, like an error.
-    :return: A tuple containing (thought_process, command).
+@lru_cache(maxsize=None)
+def _command_system_prompt(os_type: str, plans: bool = False) -> str:
+    """
+    Returns the system prompt for command generation.
+
+    It only depends on the OS type and whether plans are enabled, so it is
+    byte-identical across calls and servers with prefix caching can reuse its
+    processed form.
     """
-    os_type = get_os_type()
     package_manager = "brew" if os_type == "macos" else "apt"
 
     system_prompt = f"""
@@ -27,11 +51,13 @@ def get_command_from_llm(user_input: str, tool_definitions: str, llm_config: dic
 
     You will be given:
     1. The user's current request.
-    2. A list of available tools.
+    2. A list of available tools relevant to the request, followed by the names of the other installed tools.
     3. A `context` which may contain the result or error from the PREVIOUS command you ran.
+    4. Optionally, the earlier requests of this session with their commands and results. Use them to resolve follow-up requests such as "now do the same for the other host", but do not repeat earlier commands unless asked to.
+    5. Optionally, lines from the stored output of earlier commands that match the request. If they already answer the request, do NOT run the command again: give the answer inside an <answer> XML tag INSTEAD of the <command> tag.
 
     **CRITICAL RULE: If the `context` contains a "command not found" error, your ONLY priority is to fix it.**
-    To fix it, you must first find the correct package name using `{package_manager} search <command>` (or `apt-cache search` on Linux, `brew search` on macOS), and then install it using `platform_utils.install_package("<package_name>")`. You may need to run `sudo apt-get update` first on Linux.
+    To fix it, you must first find the correct package name using `{package_manager} search <command>` (or `apt-cache search` on Linux, `brew search` on macOS), and then install it using `platform_utils.install_package("<package_name>")`. `install_package` refreshes the package index itself when needed, so do not run `apt-get update` or `brew update` first.
 
     General Workflow:
     1. Analyze the user's request and the `context`.
@@ -47,102 +73,407 @@ def get_command_from_llm(user_input: str, tool_definitions: str, llm_config: dic
     <command>
     The final command(s) here.
     </command>
-
-    Available Tools:
-    {tool_definitions}
     """
+    if plans:
+        system_prompt += PLAN_INSTRUCTIONS
+    return system_prompt
 
-    headers = {
-        "Content-Type": "application/json",
-    }
-    # Add API key if it exists (for OpenAI-compatible APIs)
-    if llm_config.get("api_key"):
-        headers["Authorization"] = f"Bearer {llm_config['api_key']}"
+def _build_command_messages(user_input: str, tool_definitions: str, context: str = None, plans: bool = False, history: str = None, references: str = None) -> list:
+    """
+    Builds the chat messages used to ask the LLM for a command.
 
-    # Construct the full API endpoint URL
-    api_url = llm_config['url'].rstrip('/') + '/chat/completions'
+    The static instructions come first, then the session history (whose older
+    part changes rarely, see `SessionMemory`), and the per-request parts (stored
+    output matching the request, the tools relevant to it and the request
+    itself) last.
+    """
+    query = f"{user_input} {context}" if context else user_input
+    # The history leads the user message so its stable part extends the cached prefix
+    preamble = f"{history or ''}{references or ''}Available Tools:\n{format_tool_catalog(tool_definitions, query)}\n\n"
 
     messages = [
-        {"role": "system", "content": system_prompt}
+        {"role": "system", "content": _command_system_prompt(get_os_type(), plans)}
     ]
     if context:
-        messages.append({"role": "user", "content": f"My last command failed with this context: {context}. My new request is: {user_input}"})
+        messages.append({"role": "user", "content": f"{preamble}My last command failed with this context: {context}. My new request is: {user_input}"})
     else:
-        messages.append({"role": "user", "content": user_input})
+        messages.append({"role": "user", "content": f"{preamble}{user_input}"})
+    return messages
+
+def _build_summary_messages(user_request: str, command_output: str) -> list:
+    """
+    Builds the chat messages used to ask the LLM for a summary of a command's output.
+    """
+    system_prompt = f"""
+    You are a helpful assistant. Your task is to summarize the output of a command in a concise and easy-to-understand manner.
+    Respond in the same language as the user's original request.
+    The user's original request was: "{user_request}"
+    The command output is provided below. Please extract the key information and present it clearly.
+    """
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Command Output:\n```\n{command_output}\n```"}
+    ]
+
+def _build_chunk_summary_messages(user_request: str, chunk: str, index: int, total: int) -> list:
+    """
+    Builds the chat messages used to summarize one chunk of a large command output.
+    """
+    system_prompt = f"""
+    You are a helpful assistant. You are given part {index} of {total} of a command's output, which was too large to summarize at once.
+    The user's original request was: "{user_request}"
+    List the key facts from this part that are relevant to the request (hosts, ports, versions, errors, counts, anomalies).
+    Be terse and do not add an introduction or conclusion; your notes will be merged with the notes from the other parts.
+    """
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Command Output (part {index}/{total}):\n```\n{chunk}\n```"}
+    ]
 
-    data = {
-        "model": llm_config['model_name'],
-        "messages": messages,
-        "temperature": 0,
-        "top_p": 1,
-        "max_tokens": 1024
-    }
+def _build_reduce_messages(user_request: str, partial_summaries: list, omitted_chunks: int) -> list:
+    """
+    Builds the chat messages used to merge the partial summaries of a large command output.
+    """
+    system_prompt = f"""
+    You are a helpful assistant. Your task is to summarize the output of a command in a concise and easy-to-understand manner.
+    Respond in the same language as the user's original request.
+    The user's original request was: "{user_request}"
+    The output was too large to read at once, so it was split into parts and each part was condensed into notes.
+    Merge the notes below into one clear summary, removing repetition.
+    """
+
+    notes = "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(partial_summaries))
+    if omitted_chunks:
+        notes += f"\n\n({omitted_chunks} parts from the middle of the output were skipped.)"
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Notes:\n{notes}"}
+    ]
+
+def _build_summary_request(user_request: str, command_output, llm_client, cancel_event=None) -> list:
+    """
+    Prepares the final summarization messages for an output of any size.
+
+    The output is compacted first; if it still exceeds the per-request token
+    budget it is split into chunks that are summarized concurrently (map), and
+    the returned messages merge those partial summaries (reduce).
+
+    :param command_output: The output as a string, or an iterable of lines.
+    :return: The chat messages for the final summarization request.
+    """
+    lines = command_output.splitlines() if isinstance(command_output, str) else command_output
+    chunks, omitted = split_into_chunks(compact_lines(lines))
+    if len(chunks) <= 1:
+        return _build_summary_messages(user_request, chunks[0] if chunks else "")
+
+    def summarize_chunk(index_and_chunk):
+        index, chunk = index_and_chunk
+        if cancel_event is not None and cancel_event.is_set():
+            return ""
+        messages = _build_chunk_summary_messages(user_request, chunk, index + 1, len(chunks))
+        response = llm_client.chat(messages, temperature=0, top_p=1, max_tokens=CHUNK_SUMMARY_MAX_TOKENS)
+        data = response.json()
+        telemetry.record_usage(data.get("usage"))
+        return data["choices"][0]["message"]["content"].strip()
+
+    # Each chunk runs in its own copy of the caller's context so token usage is attributed to the caller's span
+    contexts = [contextvars.copy_context() for _ in chunks]
+    with ThreadPoolExecutor(max_workers=SUMMARY_CONCURRENCY) as executor:
+        partial_summaries = list(executor.map(
+            lambda item: contexts[item[0]].run(summarize_chunk, item), enumerate(chunks)))
+    return _build_reduce_messages(user_request, partial_summaries, omitted)
+
+def _parse_command_response(full_response: str) -> (str, str):
+    """
+    Splits a raw LLM response into its thought process and command.
+
+    A multi-step plan is returned as the command, still wrapped in its <plan>
+    tag (see `plan_executor.parse_plan`), and so is an answer taken from earlier
+    output, in its <answer> tag (see `artifact_store.parse_answer`).
+    """
+    thought = re.search(r'<think>(.*?)</think>', full_response, re.DOTALL)
+    command = re.search(r'<command>(.*?)</command>', full_response, re.DOTALL)
+    plan = re.search(r'<plan>(.*?)</plan>', full_response, re.DOTALL)
+    answer = re.search(r'<answer>(.*?)</answer>', full_response, re.DOTALL)
+
+    thought_text = thought.group(1).strip() if thought else "(No thought process provided)"
+    command_text = command.group(1).strip() if command else ""
+    if not command_text and plan:
+        command_text = f"<plan>\n{plan.group(1).strip()}\n</plan>"
+    elif not command_text and answer:
+        command_text = f"<answer>\n{answer.group(1).strip()}\n</answer>"
+
+    if not command_text and thought_text == "(No thought process provided)":
+        return full_response, ""
+
+    return thought_text, command_text
+
+def _partial_thought(buffer: str) -> str:
+    """
+    Extracts the thought process received so far from a partially streamed response.
+
+    :param buffer: The response text accumulated so far.
+    :return: The text inside the (possibly still open) <think> tag.
+    """
+    start = buffer.find("<think>")
+    if start == -1:
+        return ""
+    start += len("<think>")
+    end = buffer.find("</think>", start)
+    if end == -1:
+        end = len(buffer)
+        # Hide a closing tag that has only partially arrived, e.g. "</thi"
+        tag_start = buffer.rfind("<", start)
+        if tag_start != -1 and "</think>".startswith(buffer[tag_start:]):
+            end = tag_start
+    return buffer[start:end].strip()
+
+def _iter_stream_content(response):
+    """
+    Yields the content deltas of an OpenAI-compatible server-sent event stream.
+
+    Token usage, if the server reports it in the final event, is recorded in the
+    telemetry once the stream has been read to the end.
+
+    :param response: A streaming `requests` response for a chat completion with `stream: true`.
+    """
+    usage = None
+    try:
+        lines = response.iter_lines()
+        for line in lines:
+            if not line:
+                continue
+            line = line.decode('utf-8')
+            if not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                # The body ends right after; reading it to the end lets the connection go back to the pool
+                for _ in lines:
+                    pass
+                break
+            event = json.loads(payload)
+            usage = event.get("usage") or usage
+            choices = event.get("choices") or []
+            if not choices:
+                continue
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+    finally:
+        # A stream abandoned early (e.g. on cancellation) has no usage to report
+        telemetry.record_usage(usage)
 
+def _drain_stream(response, deltas, deadline: float):
+    """Reads the rest of a stream whose content is no longer needed, so its final usage event is recorded."""
     try:
-        response = requests.post(api_url, headers=headers, data=json.dumps(data), timeout=60)
-        response.raise_for_status()
+        for _ in deltas:
+            if time.monotonic() > deadline:
+                break
+    except (requests.exceptions.RequestException, ValueError):
+        pass
+    finally:
+        deltas.close()
+        response.close()
 
-        full_response = response.json()["choices"][0]["message"]["content"]
-        
-        thought = re.search(r'<think>(.*?)</think>', full_response, re.DOTALL)
-        command = re.search(r'<command>(.*?)</command>', full_response, re.DOTALL)
+def get_command_from_llm(user_input: str, tool_definitions: str, llm_client, context: str = None, plans: bool = False, history: str = None, references: str = None) -> (str, str):
+    """
+    Gets a command from the LLM, separating thought process from the command.
 
-        thought_text = thought.group(1).strip() if thought else "(No thought process provided)"
-        command_text = command.group(1).strip() if command else ""
+    :param user_input: The user's natural language input.
+    :param tool_definitions: A JSON string of available tool definitions.
+    :param llm_client: The session's `LLMClient` for the selected LLM configuration.
+    :param context: A string containing context from the previous turn's execution, like an error.
+    :param plans: If True, the LLM may answer with a multi-step <plan> instead of a single command.
+    :param history: Optional session history (see `SessionMemory.render`) placed before the request.
+    :param references: Optional stored output of earlier commands matching the request (see `artifact_store.format_references`).
+    :return: A tuple containing (thought_process, command).
+    """
+    messages = _build_command_messages(user_input, tool_definitions, context, plans, history, references)
 
-        if not command_text and thought_text == "(No thought process provided)":
-            return full_response, ""
+    try:
+        response = llm_client.chat(messages, temperature=0, top_p=1, max_tokens=1024)
 
-        return thought_text, command_text
+        data = response.json()
+        telemetry.record_usage(data.get("usage"))
+        full_response = data["choices"][0]["message"]["content"]
+        return _parse_command_response(full_response)
 
     except requests.exceptions.RequestException as e:
         return f"Error connecting to LLM: {e}", ""
     except (KeyError, IndexError):
         return "Error: Invalid response format from LLM.", ""
 
-def summarize_output_with_llm(user_request: str, command_output: str, llm_config: dict) -> str:
+def stream_command_from_llm(user_input: str, tool_definitions: str, llm_client, context: str = None, on_thought=None, cancel_event=None, plans: bool = False, history: str = None, references: str = None) -> (str, str):
+    """
+    Streams a command from the LLM token by token.
+
+    The thought process is reported through `on_thought` as it arrives, and the
+    function returns as soon as the closing </command> (or </plan> or </answer>) tag has
+    been received instead of waiting for the end of the stream; the rest of the
+    stream is read in a background thread so its token usage is still recorded.
+
+    :param user_input: The user's natural language input.
+    :param tool_definitions: A JSON string of available tool definitions.
+    :param llm_client: The session's `LLMClient` for the selected LLM configuration.
+    :param context: A string containing context from the previous turn's execution, like an error.
+    :param on_thought: Optional callback receiving the thought process received so far.
+    :param cancel_event: Optional `threading.Event`; when set, the stream is abandoned at the next chunk.
+    :param plans: If True, the LLM may answer with a multi-step <plan> instead of a single command.
+    :param history: Optional session history (see `SessionMemory.render`) placed before the request.
+    :param references: Optional stored output of earlier commands matching the request (see `artifact_store.format_references`).
+    :return: A tuple containing (thought_process, command).
+    """
+    messages = _build_command_messages(user_input, tool_definitions, context, plans, history, references)
+
+    try:
+        response = llm_client.chat(messages, stream=True, temperature=0, top_p=1, max_tokens=1024)
+        deltas = _iter_stream_content(response)
+        try:
+            full_response = ""
+            shown_thought = ""
+            for delta in deltas:
+                if cancel_event is not None and cancel_event.is_set():
+                    return "Cancelled.", ""
+                # Only the tail can contain a newly completed closing tag
+                search_from = max(0, len(full_response) - len("</command>"))
+                full_response += delta
+
+                if on_thought:
+                    thought = _partial_thought(full_response)
+                    if thought != shown_thought:
+                        shown_thought = thought
+                        on_thought(thought)
+
+                if any(full_response.find(tag, search_from) != -1 for tag in ("</command>", "</plan>", "</answer>")):
+                    # The command is complete; hand it over and read the rest of the stream, which carries
+                    # the token usage, in the background (in this context, so it counts for this span)
+                    context = contextvars.copy_context()
+                    threading.Thread(target=context.run, args=(_drain_stream, response, deltas, time.monotonic() + STREAM_DRAIN_TIMEOUT),
+                                     daemon=True).start()
+                    response = None
+                    break
+        finally:
+            if response is not None:
+                deltas.close()
+                response.close()
+
+        return _parse_command_response(full_response)
+
+    except requests.exceptions.RequestException as e:
+        return f"Error connecting to LLM: {e}", ""
+    except (KeyError, IndexError, ValueError):
+        return "Error: Invalid response format from LLM.", ""
+
+def summarize_output_with_llm(user_request: str, command_output, llm_client) -> str:
     """
     Summarizes the command output using the LLM.
 
     :param user_request: The original user request.
-    :param command_output: The raw output from the executed command.
-    :param llm_config: A dictionary containing the LLM configuration.
+    :param command_output: The raw output from the executed command, as a string or an iterable of lines.
+    :param llm_client: The session's `LLMClient` for the selected LLM configuration.
     :return: A summarized string of the output.
     """
-    system_prompt = f"""
-    You are a helpful assistant. Your task is to summarize the output of a command in a concise and easy-to-understand manner.
-    Respond in the same language as the user's original request.
-    The user's original request was: "{user_request}"
-    The command output is provided below. Please extract the key information and present it clearly.
+    try:
+        messages = _build_summary_request(user_request, command_output, llm_client)
+        # A bit more creative for summarization; 512 tokens are sufficient for summaries
+        response = llm_client.chat(messages, temperature=0.2, top_p=1, max_tokens=512)
+        data = response.json()
+        telemetry.record_usage(data.get("usage"))
+        summary = data["choices"][0]["message"]["content"].strip()
+        return summary
+    except requests.exceptions.RequestException as e:
+        return f"Error summarizing output: {e}"
+    except (KeyError, IndexError):
+        return "Error: Invalid response format from LLM during summarization."
+
+def stream_summary_with_llm(user_request: str, command_output, llm_client, cancel_event=None):
     """
+    Streams a summary of the command output from the LLM.
 
-    headers = {
-        "Content-Type": "application/json",
-    }
-    if llm_config.get("api_key"):
-        headers["Authorization"] = f"Bearer {llm_config['api_key']}"
+    For large outputs the chunk summaries are gathered first and only the final,
+    merged summary is streamed.
 
-    api_url = llm_config['url'].rstrip('/') + '/chat/completions'
+    :param user_request: The original user request.
+    :param command_output: The raw output from the executed command, as a string or an iterable of lines.
+    :param llm_client: The session's `LLMClient` for the selected LLM configuration.
+    :param cancel_event: Optional `threading.Event`; when set, the stream is abandoned at the next chunk.
+    :return: A generator yielding the summary text as it arrives.
+    """
+    try:
+        messages = _build_summary_request(user_request, command_output, llm_client, cancel_event=cancel_event)
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        with llm_client.chat(messages, stream=True, temperature=0.2, top_p=1, max_tokens=512) as response:
+            for delta in _iter_stream_content(response):
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                yield delta
+    except requests.exceptions.RequestException as e:
+        yield f"Error summarizing output: {e}"
+    except (KeyError, IndexError, ValueError):
+        yield "Error: Invalid response format from LLM during summarization."
 
+def warm_up_llm(llm_client, plans: bool = False) -> bool:
+    """
+    Sends a minimal request that starts with the command-generation system prompt.
+
+    Local servers such as Ollama load the model on the first request, servers
+    with prefix caching process the static system prompt, and the pooled
+    connection is opened, so the user's first request does not pay for any of
+    it.
+
+    :param llm_client: An `LLMClient` (a router's backends are warmed up one by one).
+    :param plans: Whether the session's system prompt includes the plan instructions.
+    :return: True if the endpoint answered.
+    """
     messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Command Output:\n```\n{command_output}\n```"}
+        {"role": "system", "content": _command_system_prompt(get_os_type(), plans)},
+        {"role": "user", "content": "Reply with OK."}
     ]
+    try:
+        response = llm_client.chat(messages, temperature=0, max_tokens=1)
+        telemetry.record_usage(response.json().get("usage"))
+        return True
+    except (requests.exceptions.RequestException, ValueError):
+        return False
 
-    data = {
-        "model": llm_config['model_name'],
-        "messages": messages,
-        "temperature": 0.2, # A bit more creative for summarization
-        "top_p": 1,
-        "max_tokens": 512 # Sufficient for summaries
-    }
+async def get_command_from_llm_async(user_input: str, tool_definitions: str, llm_client, context: str = None, stream: bool = False, on_thought=None, plans: bool = False, history: str = None, references: str = None) -> (str, str):
+    """
+    Gets a command from the LLM without blocking the event loop.
 
-    try:
-        response = requests.post(api_url, headers=headers, data=json.dumps(data), timeout=60)
-        response.raise_for_status()
-        summary = response.json()["choices"][0]["message"]["content"].strip()
-        return summary
-    except requests.exceptions.RequestException as e:
-        return f"Error summarizing output: {e}"
-    except (KeyError, IndexError):
-        return "Error: Invalid response format from LLM during summarization."
\ No newline at end of file
+    Cancelling the awaiting task returns immediately; a streaming request is
+    also abandoned at its next chunk so the connection is released early.
+
+    :param user_input: The user's natural language input.
+    :param tool_definitions: A JSON string of available tool definitions.
+    :param llm_client: The session's `LLMClient` for the selected LLM configuration.
+    :param context: A string containing context from the previous turn's execution, like an error.
+    :param stream: If True, the response is streamed and `on_thought` receives the thought process as it arrives.
+    :param on_thought: Optional callback receiving the thought process received so far.
+    :param plans: If True, the LLM may answer with a multi-step <plan> instead of a single command.
+    :param history: Optional session history (see `SessionMemory.render`) placed before the request.
+    :param references: Optional stored output of earlier commands matching the request (see `artifact_store.format_references`).
+    :return: A tuple containing (thought_process, command).
+    """
+    if stream:
+        return await run_cancellable(lambda cancel_event: stream_command_from_llm(
+            user_input, tool_definitions, llm_client, context=context, on_thought=on_thought, cancel_event=cancel_event, plans=plans, history=history, references=references))
+    return await run_cancellable(lambda cancel_event: get_command_from_llm(user_input, tool_definitions, llm_client, context=context, plans=plans, history=history, references=references))
+
+async def summarize_output_with_llm_async(user_request: str, command_output, llm_client, render=None) -> str:
+    """
+    Summarizes the command output without blocking the event loop.
+
+    :param user_request: The original user request.
+    :param command_output: The raw output from the executed command, as a string or an iterable of lines.
+    :param llm_client: The session's `LLMClient` for the selected LLM configuration.
+    :param render: Optional callable (e.g. `ui.print_summary`) that consumes the streamed summary chunks and returns the full text.
+    :return: A summarized string of the output.
+    """
+    if render is not None:
+        return await run_cancellable(lambda cancel_event: render(
+            stream_summary_with_llm(user_request, command_output, llm_client, cancel_event=cancel_event)))
+    return await run_cancellable(lambda cancel_event: summarize_output_with_llm(user_request, command_output, llm_client))
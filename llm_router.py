@@ -0,0 +1,170 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from llm_client import LLMClient
+
+LATENCY_EWMA_WEIGHT = 0.3 # Weight of the newest sample in the moving averages
+ERROR_EWMA_WEIGHT = 0.2
+MAX_COOLDOWN = 60.0 # Seconds a failing backend is skipped at most
+BACKEND_RETRIES = 1 # Transport retries per backend; the router fails over instead of retrying longer
+
+class BackendStats:
+    """
+    Latency and error statistics for one backend.
+    """
+
+    def __init__(self):
+        self.latency = {} # Moving average per request kind ("stream" or "complete")
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.hedges_won = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def record_success(self, kind: str, latency: float):
+        self.requests += 1
+        previous = self.latency.get(kind)
+        self.latency[kind] = latency if previous is None else (1 - LATENCY_EWMA_WEIGHT) * previous + LATENCY_EWMA_WEIGHT * latency
+        self.error_rate *= (1 - ERROR_EWMA_WEIGHT)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def record_failure(self, now: float):
+        self.requests += 1
+        self.errors += 1
+        self.error_rate = (1 - ERROR_EWMA_WEIGHT) * self.error_rate + ERROR_EWMA_WEIGHT
+        self.consecutive_failures += 1
+        self.cooldown_until = now + min(MAX_COOLDOWN, 2 ** self.consecutive_failures)
+
+class LLMRouter:
+    """
+    Routes chat requests across several LLM configurations.
+
+    Each request goes to the fastest healthy backend, based on moving averages
+    of its observed latency. Failing backends are put into an exponentially
+    growing cooldown and the request fails over to the next one. Optionally, a
+    request that has not answered within `hedge_after` seconds is hedged: a
+    second copy is sent to the next backend and whichever answers first wins.
+
+    The router has the same interface as `LLMClient`, so it can be passed
+    anywhere a client is expected.
+    """
+
+    def __init__(self, llm_configs: list, hedge_after: float = None, pool_size: int = 4):
+        """
+        :param llm_configs: The LLM configurations to route across.
+        :param hedge_after: Seconds after which a slow request is duplicated to another backend (None disables hedging).
+        :param pool_size: The connection pool size of each backend's client.
+        """
+        if not llm_configs:
+            raise ValueError("At least one LLM configuration is required for routing.")
+        self.backends = [LLMClient(config, pool_size=pool_size, max_retries=BACKEND_RETRIES) for config in llm_configs]
+        self.stats = {backend.name: BackendStats() for backend in self.backends}
+        self.hedge_after = hedge_after
+        # Options such as streaming or caching are taken from the first configuration
+        self.config = llm_configs[0]
+        self.name = "Router (" + ", ".join(backend.name for backend in self.backends) + ")"
+        self.model_name = "+".join(sorted({backend.model_name for backend in self.backends}))
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(self.backends)), thread_name_prefix="llm-router")
+
+    def chat(self, messages: list, stream: bool = False, **params) -> requests.Response:
+        """
+        Sends a chat completion request to the best available backend.
+
+        :param messages: The chat messages to send.
+        :param stream: If True, requests a server-sent event stream.
+        :param params: Additional request parameters such as temperature or max_tokens.
+        :return: The first successful `requests` response.
+        :raises requests.exceptions.RequestException: If every backend failed.
+        """
+        kind = "stream" if stream else "complete"
+        candidates = self._ranked_backends(kind)
+        last_error = None
+
+        while candidates:
+            primary = candidates.pop(0)
+            futures = {self._executor.submit(self._timed_chat, primary, kind, messages, stream, params): primary}
+            hedged = False
+            while futures:
+                timeout = self.hedge_after if (self.hedge_after is not None and not hedged and candidates) else None
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # The primary is slow; race it against the next backend
+                    hedge = candidates.pop(0)
+                    futures[self._executor.submit(self._timed_chat, hedge, kind, messages, stream, params)] = hedge
+                    hedged = True
+                    continue
+                for future in done:
+                    backend = futures.pop(future)
+                    try:
+                        response = future.result()
+                    except requests.exceptions.RequestException as e:
+                        last_error = e
+                        continue
+                    if backend is not primary:
+                        with self._lock:
+                            self.stats[backend.name].hedges_won += 1
+                    for loser in futures:
+                        loser.add_done_callback(_close_response)
+                    return response
+        raise last_error or requests.exceptions.ConnectionError("No LLM backend is available.")
+
+    def close(self):
+        """Closes every backend's connections."""
+        self._executor.shutdown(wait=False)
+        for backend in self.backends:
+            backend.close()
+
+    def backend_stats(self) -> list:
+        """
+        Returns a snapshot of each backend's routing statistics.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "name": backend.name,
+                "model_name": backend.model_name,
+                "healthy": self.stats[backend.name].healthy(now),
+                "latency": dict(self.stats[backend.name].latency),
+                "error_rate": self.stats[backend.name].error_rate,
+                "requests": self.stats[backend.name].requests,
+                "errors": self.stats[backend.name].errors,
+                "hedges_won": self.stats[backend.name].hedges_won,
+            } for backend in self.backends]
+
+    def _ranked_backends(self, kind: str) -> list:
+        """
+        Orders the backends by preference: healthy before cooling down, then by
+        latency. Backends without a latency sample yet are tried first so every
+        backend gets measured.
+        """
+        now = time.monotonic()
+        with self._lock:
+            def preference(backend):
+                stats = self.stats[backend.name]
+                latency = stats.latency.get(kind)
+                return (not stats.healthy(now), latency is not None, latency or 0.0, stats.error_rate)
+            return sorted(self.backends, key=preference)
+
+    def _timed_chat(self, backend: LLMClient, kind: str, messages: list, stream: bool, params: dict) -> requests.Response:
+        start = time.monotonic()
+        try:
+            response = backend.chat(messages, stream=stream, **params)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self.stats[backend.name].record_failure(time.monotonic())
+            raise
+        with self._lock:
+            self.stats[backend.name].record_success(kind, time.monotonic() - start)
+        return response
+
+def _close_response(future):
+    """Releases the connection of a hedged request that lost the race."""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
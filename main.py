@@ -1,53 +1,655 @@
-
-
+import time
+STARTUP_TIME = time.perf_counter() # Taken before the other imports, for --profile-startup
+import argparse
 import asyncio
+import importlib
+import re
+import signal
+import sqlite3
 import sys
 import json
-from llm_handler import get_command_from_llm, summarize_output_with_llm
-from tool_discovery import discover_tools_on_host
-from platform_utils import run_command_on_host, get_installed_by_agent, uninstall_package
+from rich.markup import escape
+from async_utils import run_in_thread
+from batch import BatchRunner, read_batch_requests, DEFAULT_WORKERS
+from command_resolver import extract_install_calls, find_missing_executables, default_resolver
+from tool_discovery import discover_tools_on_host, ToolCatalog
+from response_cache import ResponseCache, cache_key
+from session_memory import SessionMemory, RECENT_TURNS, MEMORY_TOKEN_BUDGET
+from artifact_store import ArtifactStore, parse_answer, format_references, ARTIFACTS_FILE
+from telemetry import telemetry, StartupProfile
+from plan_executor import parse_plan, execute_plan, PLAN_PARALLELISM
+from output_chunking import is_worth_summarizing, estimate_tokens, SUMMARY_MIN_LINES, SUMMARY_MIN_CHARS
+from output_parsers import parse_result, PARSED_RENDER_MAX_LINES
+from platform_utils import (
+    get_os_type, stream_command_on_host, get_installed_by_agent, get_installed_tool_details, install_packages, uninstall_packages,
+    set_package_index_max_age, PACKAGE_INDEX_MAX_AGE
+)
 from ui import (
-    console, print_welcome, get_llm_config_from_user, choose_llm_config,
-    print_thought_process, print_command_to_execute, print_command_output, print_error, Prompt, print_summary
+    console, err_console, print_welcome, get_llm_config_from_user, choose_llm_config,
+    print_thought_process, print_command_to_execute, print_command_result, print_error, prompt_async, print_summary,
+    print_plan, print_plan_result, page_output, CommandOutputView,
+    print_background_summary, print_backend_stats, print_stats, print_installed_tools, print_session_memory, LiveThoughtProcess,
+    print_startup_profile, print_startup_event, print_artifacts, print_artifact, print_artifact_stats, print_related_artifacts,
+    print_parsed_output
 )
 
 CONFIG_FILE = "config.json"
 MAX_RETRIES = 3 # Max attempts for LLM to fix a command
 
-async def main():
+# Modules that pull in requests; they are imported while the user picks a configuration
+LLM_MODULES = ("llm_client", "llm_router", "llm_handler")
+
+# Hard per-stage timeouts in seconds (None disables the limit)
+LLM_TIMEOUT = 180
+COMMAND_TIMEOUT = None # Long-running scans are only bounded by Ctrl-C
+SUMMARY_TIMEOUT = 120
+
+# Summaries running in the background; references are kept so the tasks are not garbage collected
+_background_tasks = set()
+
+def preload_llm_modules():
+    """Imports the LLM modules ahead of their first use; meant to run in a worker thread."""
+    for name in LLM_MODULES:
+        importlib.import_module(name)
+
+async def _summarize_in_background(user_input: str, command_output, llm_client, on_summary=None):
+    from llm_handler import summarize_output_with_llm_async
+    try:
+        with telemetry.span("summary", mode="background"):
+            summary = await asyncio.wait_for(summarize_output_with_llm_async(user_input, command_output, llm_client), SUMMARY_TIMEOUT)
+    except asyncio.TimeoutError:
+        print_error(f"Summarization did not finish within {SUMMARY_TIMEOUT} seconds.")
+        return
+    if on_summary is not None:
+        on_summary(summary)
+    print_background_summary(summary)
+
+def start_background_summary(user_input: str, command_output, llm_client, on_summary=None) -> asyncio.Task:
     """
-    The main function for the hacker agent.
+    Starts summarizing a command's output while the agent moves on.
+
+    The summary is printed as soon as it is ready, even if the user is already
+    typing the next request.
+
+    :param command_output: The output to summarize, as a string or an iterable of lines.
+    :param on_summary: Optional callback receiving the finished summary, e.g. to store it in the session memory.
     """
-    print_welcome()
+    task = asyncio.create_task(_summarize_in_background(user_input, command_output, llm_client, on_summary))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
 
-    # --- LLM Configuration Management ---
-    llm_configs = []
+async def resolve_missing_commands(command: str, tool_catalog: ToolCatalog) -> (str, str):
+    """
+    Installs what a generated command needs before it runs, without another LLM round trip.
+
+    `platform_utils.install_package(...)` calls in the command are performed by
+    the agent, and executables that are not on PATH are mapped to packages
+    locally. The user confirms the install once for all packages.
+
+    :param command: The generated command.
+    :param tool_catalog: The catalog to refresh after an install.
+    :return: A tuple of (the shell command left to run, context for the next attempt if it should not run).
+    """
+    packages, command = extract_install_calls(command)
+    missing = find_missing_executables(command) if command else []
+    resolved = {}
+    if missing:
+        with console.status("[bold green]Looking up packages for missing commands...[/bold green]"):
+            resolved = await run_in_thread(default_resolver().resolve_all, missing)
+    unresolved = [binary for binary in missing if not resolved.get(binary)]
+    if unresolved:
+        console.print(f"[bold yellow]Not installed, and no package providing it was found: {escape(', '.join(unresolved))}[/bold yellow]")
+
+    to_install = list(dict.fromkeys(packages + [package for package in resolved.values() if package]))
+    if not to_install:
+        return command, None
+    for binary, package in resolved.items():
+        if package:
+            console.print(f"[bold yellow]{escape(binary)} is not installed; it is provided by the package {escape(package)}.[/bold yellow]")
+
+    names = ', '.join(to_install)
+    confirm = await prompt_async(f"[bold blue]Install {escape(names)} now? (yes/no)[/bold blue]")
+    if confirm.lower() != 'yes':
+        return "", f"The user declined to install {names}. Use a tool that is already installed."
+    try:
+        # No spinner: sudo may need to ask for a password
+        with telemetry.span("install", packages=to_install):
+            await run_in_thread(install_packages, to_install)
+    except Exception as e:
+        print_error(f"Failed to install {names}: {e}")
+        return "", f"Installing {names} failed: {e}"
+    console.print(f"[bold green]{escape(names)} installed successfully.[/bold green]")
+    tool_catalog.refresh()
+
+    if not command:
+        return "", f"Installed {names}. Now provide the command for the original request."
+    return command, None
+
+async def archive_result(artifact_store: ArtifactStore, user_input: str, result) -> int:
+    """
+    Stores an executed command's output so it can be searched and recalled later.
+
+    :return: The artifact id, or None if there is no store or storing failed.
+    """
+    if artifact_store is None:
+        return None
+    try:
+        with telemetry.span("archive") as span:
+            artifact_id = await run_in_thread(artifact_store.add, user_input, result)
+            span["artifact"] = artifact_id
+        return artifact_id
+    except sqlite3.Error as e:
+        print_error(f"Could not store the command output: {e}")
+        return None
+
+async def process_request(user_input: str, tool_catalog: ToolCatalog, llm_client, streaming: bool, response_cache: ResponseCache = None, summary_policy: dict = None, plan_policy: dict = None,
+                          session_memory: SessionMemory = None, artifact_store: ArtifactStore = None, artifact_context: bool = True):
+    """
+    Runs one user request through the generate -> execute -> summarize pipeline.
+
+    :param user_input: The user's natural language request.
+    :param tool_catalog: The catalog providing the current tool definitions.
+    :param llm_client: The session's `LLMClient` (or `LLMRouter`).
+    :param streaming: If True, LLM responses are streamed to the terminal as they arrive.
+    :param response_cache: Optional cache of previously generated commands.
+    :param summary_policy: Optional overrides for when and how output is summarized (see `summary_policy_from_config`).
+    :param plan_policy: Optional settings for multi-step plans (see `plan_policy_from_config`); plans are off without it.
+    :param session_memory: Optional history of the session; it is sent with the request and receives the finished turn.
+    :param artifact_store: Optional store receiving the output of every executed command.
+    :param artifact_context: If True, stored output matching the request is sent with it, so the LLM can answer without running a command again.
+    :return: The `CommandResult` (or `PlanResult`) of the last command executed for the request, or None if none ran. It is
+        returned even if it failed, so `show output` can page through its output; check `succeeded`. The caller cleans it up.
+    """
+    # The first discovery run may still be going if the user was quick
+    await wait_for_discovery(tool_catalog)
+    executed = []
+    with telemetry.turn(user_input) as turn:
+        try:
+            result = await _run_attempts(user_input, tool_catalog, llm_client, streaming, response_cache, summary_policy, plan_policy, session_memory,
+                                         artifact_store, artifact_context, turn, executed)
+        except BaseException:
+            for earlier in executed:
+                earlier.cleanup()
+            raise
+        turn["success"] = result is not None or "answered_from" in turn
+    # Only the last attempt keeps its spooled output
+    for earlier in executed[:-1]:
+        earlier.cleanup()
+    return executed[-1] if executed else None
+
+async def _run_attempts(user_input: str, tool_catalog: ToolCatalog, llm_client, streaming: bool, response_cache: ResponseCache,
+                        summary_policy: dict, plan_policy: dict, session_memory: SessionMemory, artifact_store: ArtifactStore, artifact_context: bool, turn: dict,
+                        executed: list):
+    """
+    The retry loop of `process_request`; `turn` is the telemetry record of the request, and the result of every
+    executed attempt is appended to `executed`. Returns the successful result, or None.
+    """
+    from llm_handler import get_command_from_llm_async, summarize_output_with_llm_async
+    current_context = None
+    last_command = None
+    plan_policy = plan_policy or plan_policy_from_config({})
+    history = session_memory.render() if session_memory is not None else None
+    if history:
+        turn["history_tokens"] = estimate_tokens(history)
+    references = None
+    if artifact_store is not None and artifact_context:
+        try:
+            with telemetry.span("recall"):
+                related = await run_in_thread(artifact_store.related, user_input)
+        except sqlite3.Error as e:
+            print_error(f"Could not search the stored outputs: {e}")
+            related = []
+        if related:
+            references = format_references(related)
+            turn["references"] = [hit["id"] for hit in related]
+            print_related_artifacts(related)
+
+    for attempt in range(MAX_RETRIES):
+        turn["attempts"] = attempt + 1
+        key = None
+        cached = None
+        if response_cache is not None:
+            # Stored output sent along is left out: it changes with every run, and answers drawn from it are not cached
+            key = cache_key(user_input, tool_catalog.definitions, get_os_type(), llm_client.model_name, current_context, history)
+            cached = response_cache.get(key)
+
+        # Get thought process and command from LLM, providing context from the last error
+        status_message = f"[bold green]Asking LLM for the command (Attempt {attempt + 1}/{MAX_RETRIES})...[/bold green]"
+        try:
+            with telemetry.span("llm", attempt=attempt + 1, cached=cached is not None, stream=streaming):
+                if cached is not None:
+                    thought, command = cached
+                    thought_shown = False
+                elif streaming:
+                    with LiveThoughtProcess(status_message) as live_thought:
+                        thought, command = await asyncio.wait_for(get_command_from_llm_async(
+                            user_input, tool_catalog.definitions, llm_client, context=current_context,
+                            stream=True, on_thought=live_thought.update, plans=plan_policy["enabled"], history=history, references=references), LLM_TIMEOUT)
+                    thought_shown = live_thought.rendered
+                else:
+                    with console.status(status_message):
+                        thought, command = await asyncio.wait_for(get_command_from_llm_async(
+                            user_input, tool_catalog.definitions, llm_client, context=current_context, plans=plan_policy["enabled"], history=history, references=references), LLM_TIMEOUT)
+                    thought_shown = False
+        except asyncio.TimeoutError:
+            print_error(f"LLM did not respond within {LLM_TIMEOUT} seconds. Retrying...")
+            current_context = "The previous LLM request timed out."
+            continue
+
+        if thought and not thought_shown:
+            print_thought_process(thought, cached=cached is not None)
+
+        if not command:
+            print_error("LLM did not provide a command. Retrying...")
+            current_context = "LLM did not provide a command." # Provide context for retry
+            continue
+
+        answer = parse_answer(command)
+        if answer is not None:
+            # The stored output already answers the request; nothing needs to run. The answer is not cached,
+            # as it is only valid for the output it was drawn from
+            print_summary(answer)
+            turn["answered_from"] = turn.get("references", [])
+            if session_memory is not None:
+                session_memory.record(user_input)["summary"] = answer
+            return None
+
+        try:
+            plan = parse_plan(command)
+        except ValueError as e:
+            print_error(f"LLM provided an invalid plan: {e}. Retrying...")
+            current_context = f"Your plan was invalid: {e}."
+            continue
+
+        if plan is None:
+            print_command_to_execute(command)
+            command, preflight_context = await resolve_missing_commands(command, tool_catalog)
+        else:
+            print_plan(plan)
+            # Steps are plain shell commands; only the executables they need are checked
+            _, preflight_context = await resolve_missing_commands("\n".join(step.command for step in plan), tool_catalog)
+        if preflight_context:
+            current_context = preflight_context
+            continue
+
+        last_command = command
+        # Execute command on host, streaming its output as it arrives
+        with telemetry.span("execute", attempt=attempt + 1) as span:
+            # Only the start and the end of a long output are drawn; `show output` pages through the rest
+            if plan is None:
+                with CommandOutputView("[bold green]Executing command...[/bold green]") as view:
+                    result = await stream_command_on_host(command, on_line=view.write, timeout=COMMAND_TIMEOUT)
+            else:
+                # Independent steps run concurrently; each output line is prefixed with its step
+                span["steps"] = len(plan)
+                with CommandOutputView(f"[bold green]Executing plan ({len(plan)} steps)...[/bold green]") as view:
+                    result = await execute_plan(plan, max_parallel=plan_policy["max_parallel"], on_line=view.write_step, timeout=COMMAND_TIMEOUT)
+            span.update(exit_code=result.exit_code, timed_out=result.timed_out, lines=result.line_count, bytes=result.byte_count)
+        executed.append(result)
+        if plan is None:
+            print_command_result(result)
+        else:
+            print_plan_result(result)
+
+        artifact_id = await archive_result(artifact_store, user_input, result)
+        if not result.succeeded:
+            print_error(f"Command execution failed: {result.describe_failure()}")
+            current_context = result.describe_failure() # Save the error for the next retry
+            if cached is not None:
+                # The cached command no longer works on this host
+                response_cache.discard(key)
+            continue
+
+        if response_cache is not None and cached is None:
+            response_cache.put(key, thought, command)
+        memory_turn = session_memory.record(user_input, result.command, result) if session_memory is not None else None
+
+        def remember_summary(summary):
+            if memory_turn is not None:
+                memory_turn["summary"] = summary
+            if artifact_id is not None:
+                try:
+                    artifact_store.set_summary(artifact_id, summary)
+                except sqlite3.Error as e:
+                    print_error(f"Could not store the summary: {e}")
+
+        # Summarize output unless it is too short or simple to be worth a round trip
+        policy = summary_policy or summary_policy_from_config({})
+        if policy["mode"] == "off" or not is_worth_summarizing(result.output, result.line_count, policy["min_lines"], policy["min_chars"]):
+            return result
+
+        # Known tools (nmap, ss, dig, ...) are condensed locally; only that is sent to the LLM
+        parsed = None
+        if policy["parsers"]:
+            with telemetry.span("parse") as span:
+                parsed = await run_in_thread(parse_result, result)
+                if parsed is not None:
+                    span.update(tool=parsed.tool, raw_lines=parsed.raw_lines, lines=parsed.line_count)
+        if parsed is not None and parsed.is_short(policy["render_max_lines"]):
+            # Short enough to read as it is; no summary needed
+            print_parsed_output(parsed)
+            remember_summary(parsed.text)
+            return result
+        command_output = parsed.text if parsed is not None else result.iter_output_lines()
+
+        if policy["mode"] == "background":
+            start_background_summary(user_input, command_output, llm_client, remember_summary)
+        else:
+            # Inline: the full spooled output is chunked as needed and the summary is awaited
+            try:
+                with telemetry.span("summary", mode="inline"):
+                    if streaming:
+                        summary = await asyncio.wait_for(summarize_output_with_llm_async(user_input, command_output, llm_client, render=print_summary), SUMMARY_TIMEOUT)
+                    else:
+                        with console.status("[bold green]Summarizing output...[/bold green]"):
+                            summary = await asyncio.wait_for(summarize_output_with_llm_async(user_input, command_output, llm_client), SUMMARY_TIMEOUT)
+                        print_summary(summary)
+                remember_summary(summary)
+            except asyncio.TimeoutError:
+                print_error(f"Summarization did not finish within {SUMMARY_TIMEOUT} seconds.")
+
+        return result # Command executed successfully, exit retry loop
+
+    print_error(f"Failed to execute command after {MAX_RETRIES} attempts. Please refine your request or check the environment.")
+    if session_memory is not None:
+        session_memory.record(user_input, last_command, error=current_context)
+    return None
+
+def summary_policy_from_config(llm_config: dict) -> dict:
+    """
+    Reads the summarization policy from an LLM configuration.
+
+    - `summary_mode`: "background" (default) summarizes while the agent moves on to the next prompt,
+      "inline" waits for (and streams) the summary, "off" never summarizes.
+    - `summary_min_lines` / `summary_min_chars`: outputs below both limits are not summarized.
+    - `output_parsers`: set to false to send the raw output of known tools (nmap, ss, dig, ...) instead of their locally parsed form.
+    - `parsed_render_max_lines`: parsed output up to this many lines is shown instead of being summarized (0 always summarizes).
+    """
+    return {
+        "mode": llm_config.get("summary_mode", "background"),
+        "min_lines": llm_config.get("summary_min_lines", SUMMARY_MIN_LINES),
+        "min_chars": llm_config.get("summary_min_chars", SUMMARY_MIN_CHARS),
+        "parsers": llm_config.get("output_parsers", True),
+        "render_max_lines": llm_config.get("parsed_render_max_lines", PARSED_RENDER_MAX_LINES),
+    }
+
+def plan_policy_from_config(llm_config: dict) -> dict:
+    """
+    Reads the multi-step plan settings from an LLM configuration.
+
+    - `plans`: if true, the LLM may answer with a plan of steps and dependencies instead of one command.
+    - `plan_parallelism`: the maximum number of plan steps running at the same time.
+    """
+    return {
+        "enabled": bool(llm_config.get("plans", False)),
+        "max_parallel": max(1, int(llm_config.get("plan_parallelism", PLAN_PARALLELISM))),
+    }
+
+def session_memory_from_config(llm_config: dict) -> SessionMemory:
+    """
+    Creates the session history from an LLM configuration.
+
+    - `session_memory`: set to false to send every request without the earlier turns.
+    - `memory_recent_turns`: the number of most recent turns sent verbatim.
+    - `memory_token_budget`: the size limit, in estimated tokens, of the digest of older turns.
+
+    :return: A `SessionMemory`, or None if it is disabled.
+    """
+    if not llm_config.get("session_memory", True):
+        return None
+    return SessionMemory(
+        recent_turns=llm_config.get("memory_recent_turns", RECENT_TURNS),
+        token_budget=llm_config.get("memory_token_budget", MEMORY_TOKEN_BUDGET)
+    )
+
+def artifact_store_from_config(llm_config: dict) -> ArtifactStore:
+    """
+    Creates the store of command outputs from an LLM configuration.
+
+    - `artifact_store`: "session" (default) keeps the outputs in a temporary database for this session,
+      "persistent" keeps them in artifacts.db across sessions, "off" does not store them.
+
+    :return: An `ArtifactStore`, or None if it is disabled.
+    """
+    mode = llm_config.get("artifact_store", "session")
+    if mode == "off":
+        return None
+    return ArtifactStore(ARTIFACTS_FILE if mode == "persistent" else None)
+
+def apply_package_index_policy(llm_config: dict):
+    """
+    Reads `package_index_max_age_hours` from an LLM configuration: installs only
+    refresh the package index (apt-get update / brew update) once it is older than this.
+    """
+    set_package_index_max_age(llm_config.get("package_index_max_age_hours", PACKAGE_INDEX_MAX_AGE / 3600) * 3600)
+
+def load_llm_configs() -> list:
+    """
+    Loads the saved LLM configurations.
+    """
     try:
         with open(CONFIG_FILE, 'r') as f:
-            llm_configs = json.load(f)
+            return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
-        llm_configs = []
+        return []
+
+def create_llm_client(llm_configs: list, hedge_after: float = None, pool_size: int = 4):
+    """
+    Creates the client for one configuration, or a router across several.
+
+    :param llm_configs: The configurations to use; more than one enables latency-aware routing.
+    :param hedge_after: Seconds after which the router duplicates a slow request to another backend.
+    :param pool_size: The connection pool size per endpoint.
+    :return: An `LLMClient` or an `LLMRouter`.
+    """
+    from llm_client import LLMClient
+    from llm_router import LLMRouter
+    if len(llm_configs) > 1:
+        return LLMRouter(llm_configs, hedge_after=hedge_after, pool_size=pool_size)
+    return LLMClient(llm_configs[0], pool_size=pool_size)
+
+def find_llm_config(llm_configs: list, name_or_index: str) -> dict:
+    """
+    Picks an LLM configuration by name or by its 1-based index.
+
+    :raises ValueError: If no configuration matches.
+    """
+    for config in llm_configs:
+        if config.get('name') == name_or_index:
+            return config
+    if name_or_index.isdigit() and 1 <= int(name_or_index) <= len(llm_configs):
+        return llm_configs[int(name_or_index) - 1]
+    raise ValueError(f"No LLM configuration named '{name_or_index}' in {CONFIG_FILE}.")
+
+async def run_batch_mode(args) -> int:
+    """
+    Runs the requests from a file or stdin without the interactive prompt.
+
+    Results go to `args.output` as JSON lines; progress is reported on stderr.
+
+    :return: The process exit code (0 if every request succeeded).
+    """
+    llm_configs = load_llm_configs()
+    if not llm_configs:
+        err_console.print(f"[bold red]No LLM configurations found. Run the agent interactively once to create {CONFIG_FILE}.[/bold red]")
+        return 2
+    try:
+        if args.route:
+            selected_configs = llm_configs
+        else:
+            selected_configs = [find_llm_config(llm_configs, args.config) if args.config else llm_configs[0]]
+        selected_llm_config = selected_configs[0]
+        requests = read_batch_requests(args.batch)
+    except (ValueError, OSError) as e:
+        err_console.print(f"[bold red]Error: {escape(str(e))}[/bold red]")
+        return 2
+
+    llm_client = create_llm_client(selected_configs, hedge_after=args.hedge_after, pool_size=max(args.workers, 4))
+    apply_package_index_policy(selected_llm_config)
+    err_console.print(f"[bold green]Using LLM: {escape(llm_client.name)} ({escape(llm_client.model_name)})[/bold green]")
+    tool_catalog = ToolCatalog(await discover_tools_on_host(verbose=False))
+    runner = BatchRunner(
+        tool_catalog, llm_client, summary_policy_from_config(selected_llm_config),
+        plan_policy=plan_policy_from_config(selected_llm_config),
+        response_cache=ResponseCache() if selected_llm_config.get("cache_responses", False) else None,
+        workers=args.workers, max_retries=MAX_RETRIES,
+        llm_timeout=LLM_TIMEOUT, command_timeout=COMMAND_TIMEOUT, summary_timeout=SUMMARY_TIMEOUT
+    )
+
+    done = 0
+    def report(record):
+        nonlocal done
+        done += 1
+        status = "[green]ok[/green]" if record["success"] else "[red]failed[/red]"
+        err_console.print(f"{escape(f'[{done}/{len(requests)}]')} {status} #{record['index']}: {escape(record['request'])}", markup=True, highlight=False)
+
+    output = sys.stdout if args.output == "-" else open(args.output, 'w', encoding='utf-8')
+    try:
+        counts = await runner.run(requests, output, on_record=report)
+    finally:
+        llm_client.close()
+        if output is not sys.stdout:
+            output.close()
+
+    err_console.print(f"[bold blue]Batch finished: {counts['succeeded']} succeeded, {counts['failed']} failed in {counts['duration']:.1f}s.[/bold blue]")
+    return 0 if counts["failed"] == 0 else 1
+
+def start_warm_up(llm_client, plans: bool) -> asyncio.Future:
+    """
+    Warms up every LLM endpoint in the background (see `llm_handler.warm_up_llm`).
+
+    :return: A future resolving to True if at least one endpoint answered.
+    """
+    from llm_handler import warm_up_llm
+
+    def warm_up_all():
+        with telemetry.span("warmup"):
+            results = [warm_up_llm(backend, plans) for backend in getattr(llm_client, "backends", [llm_client])]
+        return any(results)
+
+    return asyncio.ensure_future(run_in_thread(warm_up_all))
+
+async def wait_for_discovery(tool_catalog: ToolCatalog):
+    """Waits for the first discovery run if the user got to a request before it finished."""
+    if not tool_catalog.loading:
+        return
+    try:
+        with console.status("[bold green]Waiting for tool discovery to finish...[/bold green]"):
+            await tool_catalog.wait()
+    except Exception as e:
+        print_error(f"Tool discovery failed: {e}")
+
+async def main(hedge_after: float = None, trace_path: str = None, profile_startup: bool = False):
+    """
+    The main function for the hacker agent.
+
+    Tool discovery and the import of the LLM modules start before the user
+    picks a configuration, and the LLM endpoint is warmed up while the user
+    types the first request, so none of them delay the prompt.
+
+    :param hedge_after: Seconds after which a slow LLM request is duplicated to another endpoint when routing.
+    :param trace_path: Optional JSONL file receiving a trace of every turn.
+    :param profile_startup: If True, the duration of each startup phase is printed.
+    """
+    startup = StartupProfile(STARTUP_TIME)
+    startup.mark("imports")
+    print_welcome()
+    if trace_path:
+        telemetry.enable_trace(trace_path)
+
+    # Work that does not depend on the chosen configuration starts right away
+    startup_reported = False
+
+    def background_phase_done(phase):
+        offset = startup.mark(phase)
+        if profile_startup and startup_reported:
+            print_startup_event(phase, offset)
+
+    preload = asyncio.ensure_future(run_in_thread(preload_llm_modules))
+    tool_catalog = ToolCatalog()
+    tool_catalog.refresh().add_done_callback(lambda task: background_phase_done("tool discovery (background)"))
+
+    # --- LLM Configuration Management ---
+    llm_configs = load_llm_configs()
+    startup.mark("config loaded")
 
     if not llm_configs:
-        new_config = get_llm_config_from_user()
+        with startup.waiting_for_user():
+            new_config = await run_in_thread(get_llm_config_from_user)
         llm_configs.append(new_config)
         with open(CONFIG_FILE, 'w') as f:
             json.dump(llm_configs, f, indent=4)
-        selected_llm_config = new_config
+        selected_configs = [new_config]
     else:
-        selected_llm_config = choose_llm_config(llm_configs)
+        with startup.waiting_for_user():
+            selected_llm_config = await run_in_thread(choose_llm_config, llm_configs)
+        # No single choice means routing across every configuration
+        selected_configs = [selected_llm_config] if selected_llm_config else llm_configs
+    selected_llm_config = selected_configs[0]
+    startup.mark("config chosen")
 
-    console.print(f"[bold green]Using LLM: {selected_llm_config['name']} ({selected_llm_config['model_name']})[/bold green]\n")
+    await preload
+    startup.mark("LLM modules imported")
+    # One pooled, keep-alive client (or router) is shared by every LLM call in this session
+    llm_client = create_llm_client(selected_configs, hedge_after=hedge_after)
+    startup.mark("LLM client created")
+    console.print(f"[bold green]Using LLM: {llm_client.name} ({llm_client.model_name})[/bold green]\n")
+    # Stream responses token by token unless the configuration opts out
+    streaming = selected_llm_config.get("stream", True)
+    # Reuse commands generated for identical requests if the configuration opts in
+    response_cache = ResponseCache()
+    cache_enabled = selected_llm_config.get("cache_responses", False)
+    summary_policy = summary_policy_from_config(selected_llm_config)
+    plan_policy = plan_policy_from_config(selected_llm_config)
+    session_memory = session_memory_from_config(selected_llm_config)
+    try:
+        artifact_store = artifact_store_from_config(selected_llm_config)
+    except sqlite3.Error as e:
+        print_error(f"Could not open the store of command outputs: {e}")
+        artifact_store = None
+    artifact_context = selected_llm_config.get("artifact_context", True)
+    apply_package_index_policy(selected_llm_config)
+
+    # Load the model and open the connection while the user types the first request
+    def warm_up_done(future):
+        succeeded = not future.cancelled() and future.exception() is None and future.result()
+        background_phase_done("LLM warm-up (background)" if succeeded else "LLM warm-up failed (background)")
+
+    if selected_llm_config.get("warm_up", True):
+        start_warm_up(llm_client, plan_policy["enabled"]).add_done_callback(warm_up_done)
 
-    # --- Dynamic Tool Discovery ---
-    tool_defs = await discover_tools_on_host()
     console.print("[bold green]Agent is ready. Type your commands or 'exit' to quit. Type 'help' for a list of commands.[/bold green]")
+    startup.mark("first prompt")
+    if profile_startup:
+        print_startup_profile(startup.report(), startup.user_wait)
+        startup_reported = True
+
+    # Ctrl-C cancels the running step; at the prompt it ends the session
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    current_step = None
+    last_result = None
+
+    def handle_interrupt():
+        if current_step is not None and not current_step.done():
+            current_step.cancel()
+        else:
+            main_task.cancel()
+
+    loop.add_signal_handler(signal.SIGINT, handle_interrupt)
+
+    async def page(lines):
+        # The pager handles Ctrl-C itself; it must not cancel the session meanwhile
+        loop.add_signal_handler(signal.SIGINT, lambda: None)
+        try:
+            await run_in_thread(page_output, lines)
+        finally:
+            loop.add_signal_handler(signal.SIGINT, handle_interrupt)
 
     try:
-        loop = asyncio.get_running_loop()
         while True:
-            user_input = await loop.run_in_executor(
-                None, lambda: Prompt.ask("[bold cyan]>>>[/bold cyan]"))
+            user_input = await prompt_async("[bold cyan]>>>[/bold cyan]")
             user_input = user_input.strip()
 
             if user_input.lower() == 'exit':
@@ -58,16 +660,97 @@ async def main():
                 console.print("  - [cyan]exit[/cyan]: Exit the Agent.")
                 console.print("  - [cyan]list tools[/cyan]: List tools installed by the Agent.")
                 console.print("  - [cyan]list all known tools[/cyan]: List all tools the Agent is aware of on your system.")
-                console.print("  - [cyan]uninstall <tool_name>[/cyan]: Uninstall a specific tool installed by the Agent.")
+                console.print("  - [cyan]uninstall <tool_name> [...][/cyan]: Uninstall specific tools installed by the Agent.")
                 console.print("  - [cyan]uninstall all[/cyan]: Uninstall all tools installed by the Agent.")
+                console.print("  - [cyan]cache stats[/cyan]: Show response cache statistics.")
+                console.print("  - [cyan]cache clear[/cyan]: Remove all cached responses.")
+                console.print("  - [cyan]stats[/cyan]: Show where the time went this session (per-stage latencies and token usage).")
+                console.print("  - [cyan]show output[/cyan]: Page through the full output of the last command.")
+                console.print("  - [cyan]history[/cyan]: Show the session history sent with each request.")
+                console.print("  - [cyan]history clear[/cyan]: Forget the session history.")
+                console.print("  - [cyan]artifacts[/cyan]: List the most recent stored command outputs.")
+                console.print("  - [cyan]artifacts search <words>[/cyan]: Search the stored command outputs, e.g. 'artifacts search 22 open'.")
+                console.print("  - [cyan]recall <id>[/cyan]: Show a stored command output in full without running the command again.")
+                console.print("  - [cyan]backends[/cyan]: Show latency and error statistics of the LLM endpoints (routing mode).")
                 console.print("  - [cyan]help[/cyan]: Display this help message.")
+                console.print("  - [cyan]Ctrl-C[/cyan]: Cancel the running step without leaving the session.")
+                continue
+
+            if user_input.lower() == 'cache stats':
+                stats = response_cache.stats()
+                state = "enabled" if cache_enabled else "disabled (set \"cache_responses\": true in config.json)"
+                console.print(f"[bold green]Response cache:[/bold green] {state}")
+                console.print(f"  - Entries: [cyan]{stats['entries']}[/cyan] / {stats['max_entries']} (expire after {stats['ttl_hours']:.0f}h)")
+                console.print(f"  - This session: [cyan]{stats['hits']}[/cyan] hits, [cyan]{stats['misses']}[/cyan] misses")
+                continue
+
+            if user_input.lower() == 'cache clear':
+                removed = response_cache.clear()
+                console.print(f"[bold green]Removed {removed} cached responses.[/bold green]")
+                continue
+
+            if user_input.lower() == 'stats':
+                print_stats(telemetry.summary())
+                continue
+
+            if user_input.lower() == 'show output':
+                if last_result is None:
+                    console.print("[bold yellow]There is no command output to show yet.[/bold yellow]")
+                    continue
+                await page(last_result.iter_output_lines())
+                continue
+
+            if user_input.lower() == 'artifacts' or user_input.lower().startswith('artifacts search ') or re.fullmatch(r'recall #?\d+', user_input.lower()):
+                if artifact_store is None:
+                    console.print("[bold yellow]Command outputs are not stored (\"artifact_store\": \"off\" in config.json).[/bold yellow]")
+                elif user_input.lower() == 'artifacts':
+                    artifacts = artifact_store.recent()
+                    if artifacts:
+                        print_artifacts(artifacts, "Most recent command outputs")
+                    print_artifact_stats(artifact_store.stats())
+                elif user_input.lower().startswith('artifacts search '):
+                    query = user_input.split(' ', 2)[2]
+                    hits = await run_in_thread(artifact_store.search, query)
+                    if hits:
+                        print_artifacts(hits, f"Command outputs matching '{escape(query)}'")
+                    else:
+                        console.print(f"[bold yellow]No stored output matches '{escape(query)}'.[/bold yellow]")
+                else:
+                    try:
+                        artifact = artifact_store.get(int(user_input.split()[1].lstrip('#')))
+                    except (OverflowError, sqlite3.Error):
+                        artifact = None # Ids beyond SQLite's 64-bit integers cannot exist
+                    if artifact is None:
+                        console.print("[bold yellow]There is no stored output with this id; 'artifacts' lists them.[/bold yellow]")
+                    else:
+                        print_artifact(artifact)
+                        await page(artifact_store.iter_output_lines(artifact["id"]))
+                continue
+
+            if user_input.lower() in ('history', 'history clear'):
+                if session_memory is None:
+                    console.print("[bold yellow]Session memory is off (\"session_memory\": false in config.json).[/bold yellow]")
+                elif user_input.lower() == 'history clear':
+                    session_memory.clear()
+                    console.print("[bold green]Session history cleared.[/bold green]")
+                else:
+                    print_session_memory(session_memory.render(), session_memory.stats())
+                continue
+
+            if user_input.lower() == 'backends':
+                from llm_router import LLMRouter
+                if isinstance(llm_client, LLMRouter):
+                    print_backend_stats(llm_client.backend_stats())
+                else:
+                    console.print("[bold yellow]Routing is off; choose \"All\" at startup to route across every configuration.[/bold yellow]")
                 continue
 
             if user_input.lower() == 'list all known tools':
-                if tool_defs:
+                await wait_for_discovery(tool_catalog)
+                if tool_catalog.definitions:
                     console.print("[bold green]All known tools on your system:[/bold green]")
-                    # tool_defs is a JSON string, need to parse it
-                    parsed_tool_defs = json.loads(tool_defs)
+                    # tool_catalog.definitions is a JSON string, need to parse it
+                    parsed_tool_defs = json.loads(tool_catalog.definitions)
                     for tool in parsed_tool_defs:
                         console.print(f"  - [cyan]{tool['tool_name']}[/cyan]: {tool['description']}")
                 else:
@@ -75,11 +758,9 @@ async def main():
                 continue
 
             if user_input.lower() == 'list tools':
-                installed_tools = get_installed_by_agent()
+                installed_tools = get_installed_tool_details()
                 if installed_tools:
-                    console.print("[bold green]Tools installed by Agent:[/bold green]")
-                    for tool in installed_tools:
-                        console.print(f"  - [cyan]{tool}[/cyan]")
+                    print_installed_tools(installed_tools)
                 else:
                     console.print("[bold yellow]No tools have been installed by the Agent yet.[/bold yellow]")
                 continue
@@ -89,89 +770,96 @@ async def main():
                 if not installed_tools:
                     console.print("[bold yellow]No tools installed by the agent to uninstall.[/bold yellow]")
                     continue
-                confirm = Prompt.ask(f"[bold red]Are you sure you want to uninstall ALL {len(installed_tools)} tools installed by the agent? (yes/no)[/bold red]")
+                confirm = await prompt_async(f"[bold red]Are you sure you want to uninstall ALL {len(installed_tools)} tools installed by the agent? (yes/no)[/bold red]")
                 if confirm.lower() == 'yes':
-                    for tool in installed_tools:
-                        try:
-                            console.print(f"[bold blue]Uninstalling {tool}...[/bold blue]")
-                            uninstall_package(tool)
-                            console.print(f"[bold green]{tool} uninstalled successfully.[/bold green]")
-                        except Exception as e:
-                            print_error(f"Failed to uninstall {tool}: {e}")
+                    # All packages go to a single package-manager invocation
+                    try:
+                        console.print(f"[bold blue]Uninstalling {', '.join(installed_tools)}...[/bold blue]")
+                        await run_in_thread(uninstall_packages, installed_tools)
+                        console.print(f"[bold green]{len(installed_tools)} tools uninstalled successfully.[/bold green]")
+                    except Exception as e:
+                        print_error(str(e))
+                    # The toolset changed; rediscover it while the user keeps working
+                    tool_catalog.refresh()
                 continue
 
             if user_input.lower().startswith('uninstall '):
-                tool_to_uninstall = user_input.split(' ', 1)[1].strip()
-                if not tool_to_uninstall:
+                tools_to_uninstall = user_input.split(' ', 1)[1].split()
+                if not tools_to_uninstall:
                     print_error("Please specify a tool to uninstall.")
                     continue
                 installed_tools = get_installed_by_agent()
-                if tool_to_uninstall not in installed_tools:
-                    console.print(f"[bold yellow]{tool_to_uninstall} was not installed by the agent.[/bold yellow]")
+                unknown_tools = [tool for tool in tools_to_uninstall if tool not in installed_tools]
+                if unknown_tools:
+                    console.print(f"[bold yellow]{', '.join(unknown_tools)} was not installed by the agent.[/bold yellow]")
                     continue
-                confirm = Prompt.ask(f"[bold red]Are you sure you want to uninstall {tool_to_uninstall}? (yes/no)[/bold red]")
+                names = ', '.join(tools_to_uninstall)
+                confirm = await prompt_async(f"[bold red]Are you sure you want to uninstall {names}? (yes/no)[/bold red]")
                 if confirm.lower() == 'yes':
                     try:
-                        console.print(f"[bold blue]Uninstalling {tool_to_uninstall}...[/bold blue]")
-                        uninstall_package(tool_to_uninstall)
-                        console.print(f"[bold green]{tool_to_uninstall} uninstalled successfully.[/bold green]")
+                        console.print(f"[bold blue]Uninstalling {names}...[/bold blue]")
+                        await run_in_thread(uninstall_packages, tools_to_uninstall)
+                        console.print(f"[bold green]{names} uninstalled successfully.[/bold green]")
                     except Exception as e:
-                        print_error(f"Failed to uninstall {tool_to_uninstall}: {e}")
+                        print_error(f"Failed to uninstall {names}: {e}")
+                    tool_catalog.refresh()
                 continue
 
             if not user_input:
                 continue
 
-            current_context = None
-            command_executed_successfully = False
-
-            for attempt in range(MAX_RETRIES):
-                # Get thought process and command from LLM, providing context from the last error
-                with console.status(f"[bold green]Asking LLM for the command (Attempt {attempt + 1}/{MAX_RETRIES})...[/bold green]"):
-                    thought, command = get_command_from_llm(user_input, tool_defs, selected_llm_config, context=current_context)
+            if last_result is not None:
+                # Only the most recent command keeps its spooled output
+                last_result.cleanup()
+                last_result = None
 
-                if thought:
-                    print_thought_process(thought)
+            current_step = asyncio.create_task(process_request(
+                user_input, tool_catalog, llm_client, streaming, response_cache if cache_enabled else None, summary_policy, plan_policy, session_memory,
+                artifact_store, artifact_context))
+            try:
+                last_result = await current_step
+            except asyncio.CancelledError:
+                if not current_step.cancelled():
+                    # The session itself is being cancelled, not just the step
+                    raise
+                console.print("\n[bold yellow]Step cancelled. The session is still running.[/bold yellow]")
+            finally:
+                current_step = None
 
-                if not command:
-                    print_error("LLM did not provide a command. Retrying...")
-                    current_context = "LLM did not provide a command." # Provide context for retry
-                    continue
-
-                print_command_to_execute(command)
-                
-                # Execute command on host
-                try:
-                    with console.status("[bold green]Executing command...[/bold green]"):
-                        output = run_command_on_host(command)
-                    print_command_output(output + "\n")
-                    
-                    # Summarize output if it's not an error
-                    if "command not found" not in output and output.strip():
-                        with console.status("[bold green]Summarizing output...[/bold green]"):
-                            summary = summarize_output_with_llm(user_input, output, selected_llm_config)
-                        print_summary(summary)
-
-                    command_executed_successfully = True
-                    break # Command executed successfully, exit retry loop
-
-                except RuntimeError as e:
-                    print_error(f"Command execution failed: {e}")
-                    current_context = str(e) # Save the error for the next retry
-            
-            if not command_executed_successfully:
-                print_error(f"Failed to execute command after {MAX_RETRIES} attempts. Please refine your request or check the environment.")
-
-    except (KeyboardInterrupt, EOFError):
+    except (KeyboardInterrupt, EOFError, asyncio.CancelledError):
         console.print("\n[bold yellow]Caught interrupt or EOF, shutting down...[/bold yellow]")
     except Exception as e:
         print_error(f"An unexpected error occurred: {e}")
     finally:
+        loop.remove_signal_handler(signal.SIGINT)
+        for task in list(_background_tasks):
+            task.cancel()
+        if last_result is not None:
+            last_result.cleanup()
+        if artifact_store is not None:
+            artifact_store.close()
+        llm_client.close()
+        telemetry.close()
         console.print("[bold blue]Agent session ended.[/bold blue]")
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="AI Hacker Agent")
+    parser.add_argument("--batch", metavar="FILE", help="Run the requests in FILE (one per line, '-' for stdin) non-interactively.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Requests processed concurrently in batch mode (default: {DEFAULT_WORKERS}).")
+    parser.add_argument("--output", default="-", metavar="FILE", help="Where batch mode writes its JSONL results (default: stdout).")
+    parser.add_argument("--config", metavar="NAME", help="Name or 1-based index of the LLM configuration to use in batch mode.")
+    parser.add_argument("--route", action="store_true", help="Route batch requests across all LLM configurations instead of using one.")
+    parser.add_argument("--hedge-after", type=float, metavar="SECONDS",
+                        help="When routing, send a slow LLM request to a second endpoint after this many seconds.")
+    parser.add_argument("--trace", metavar="FILE", help="Append a JSONL trace of every turn (per-stage timings and token usage) to FILE.")
+    parser.add_argument("--profile-startup", action="store_true", help="Print how long each startup phase took.")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        asyncio.run(main())
+        if args.batch:
+            sys.exit(asyncio.run(run_batch_mode(args)))
+        asyncio.run(main(hedge_after=args.hedge_after, trace_path=args.trace, profile_startup=args.profile_startup))
     except Exception as e:
         print_error(f"Failed to start agent: {e}")
-
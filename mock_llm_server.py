@@ -0,0 +1,178 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_LATENCY = 0.05 # Seconds before the first token
+DEFAULT_TOKENS_PER_SECOND = 200
+CHARS_PER_TOKEN = 4
+DEFAULT_COMMAND = "echo hello"
+
+class MockLLMServer:
+    """
+    A local stand-in for an OpenAI-compatible chat completions endpoint.
+
+    Command-generation requests are answered with a fixed <think>/<command>
+    response and every other request with a short summary, so the agent's full
+    pipeline can run without network access or a real model. Latency, token
+    rate and injected errors are configurable to reproduce slow or flaky
+    backends.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = DEFAULT_LATENCY,
+                 tokens_per_second: float = DEFAULT_TOKENS_PER_SECOND, error_rate: float = 0.0,
+                 error_status: int = 503, command: str = DEFAULT_COMMAND, seed: int = None):
+        """
+        :param host: The address to listen on.
+        :param port: The port to listen on (0 picks a free port).
+        :param latency: Seconds before the first token of every response.
+        :param tokens_per_second: The generation speed; responses take proportionally longer to complete.
+        :param error_rate: The fraction of requests answered with `error_status` instead.
+        :param error_status: The HTTP status used for injected errors.
+        :param command: The shell command returned for command-generation requests; a "<plan>...</plan>" or "<answer>...</answer>" is returned as is.
+        :param seed: Seed for the error injection, for reproducible runs.
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.command = command
+        self.request_count = 0
+        self.error_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """The base URL to put into an LLM configuration."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Serves requests on a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond_to(self, messages: list) -> str:
+        """Picks the canned answer for a request."""
+        system_prompt = messages[0].get("content", "") if messages else ""
+        if "<command>" in system_prompt and self.command.startswith(("<plan>", "<answer>")):
+            return f"<think>\nThe request needs several independent commands, or none.\n</think>\n{self.command}"
+        if "<command>" in system_prompt:
+            return f"<think>\nThe request maps directly to a single command.\n</think>\n<command>\n{self.command}\n</command>"
+        return "The command completed successfully. The output lists the requested values without errors."
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.request_count += 1
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            if failed:
+                self.error_count += 1
+            return failed
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if server._should_fail():
+                    self._send_json(server.error_status, {"error": {"message": "Injected error", "type": "server_error"}})
+                    return
+
+                text = server.respond_to(body.get("messages", []))
+                tokens = [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+                usage = {"prompt_tokens": sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // CHARS_PER_TOKEN,
+                         "completion_tokens": len(tokens)}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                time.sleep(server.latency)
+
+                if not body.get("stream"):
+                    time.sleep(len(tokens) / server.tokens_per_second)
+                    self._send_json(200, {
+                        "object": "chat.completion",
+                        "model": body.get("model"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                        "usage": usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for token in tokens:
+                        self._send_event({"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": token}}]})
+                        time.sleep(1 / server.tokens_per_second)
+                    if body.get("stream_options", {}).get("include_usage"):
+                        self._send_event({"object": "chat.completion.chunk", "choices": [], "usage": usage})
+                    self._send_chunk(b"data: [DONE]\n\n")
+                    self._send_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stops reading once it has the complete command
+                    pass
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_event(self, payload):
+                self._send_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+            def _send_chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+        return Handler
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local mock of an OpenAI-compatible chat completions endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="Port to listen on (default: a free port).")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="Seconds before the first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=DEFAULT_TOKENS_PER_SECOND, help="Generation speed.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error.")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected errors.")
+    parser.add_argument("--command", default=DEFAULT_COMMAND, help="Command returned for command-generation requests.")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible error injection.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = MockLLMServer(args.host, args.port, args.latency, args.tokens_per_second,
+                           args.error_rate, args.error_status, args.command, args.seed)
+    # The first line tells callers (e.g. benchmark.py) where to connect
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
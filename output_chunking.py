@@ -0,0 +1,129 @@
+from collections import deque
+
+SUMMARY_CHUNK_TOKENS = 3000 # Token budget for the output sent in one summarization request
+MAX_SUMMARY_CHUNKS = 8 # Beyond this, only the head and tail of the output are summarized
+
+# Outputs below both limits are shown as-is instead of being summarized
+SUMMARY_MIN_LINES = 5
+SUMMARY_MIN_CHARS = 400
+TRIVIAL_LIST_MAX_LINES = 30 # A list of single values up to this length is not summarized either
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens in a text without a tokenizer.
+
+    ASCII text averages roughly four characters per token, while CJK and other
+    non-ASCII characters are usually a token each.
+
+    :param text: The text to measure.
+    :return: The estimated token count.
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii) // 4 + non_ascii + 1
+
+def shorten(text: str, limit: int) -> str:
+    """
+    Collapses whitespace and cuts text down to `limit` characters, marking the cut with "...".
+    """
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+def compact_lines(lines):
+    """
+    Collapses repetitive output before it is sent to the LLM.
+
+    Runs of identical lines are folded into one line with a repeat count. Lines
+    that repeat further apart are kept: in output such as an nmap scan, an
+    identical "22/tcp open ssh" line belongs to a different host each time.
+
+    :param lines: An iterable of output lines.
+    :return: A generator yielding the compacted lines.
+    """
+    previous = None
+    repeats = 0
+
+    def flush():
+        if repeats > 1 and previous:
+            return f"{previous}  [repeated {repeats} times]"
+        return previous
+
+    for line in lines:
+        line = line.rstrip()
+        if line == previous:
+            repeats += 1
+            continue
+        if previous is not None:
+            yield flush()
+        previous = line
+        repeats = 1
+
+    if previous is not None:
+        yield flush()
+
+def split_into_chunks(lines, max_tokens: int = SUMMARY_CHUNK_TOKENS, max_chunks: int = MAX_SUMMARY_CHUNKS) -> (list, int):
+    """
+    Splits output lines into chunks that each fit the given token budget.
+
+    When the output needs more than `max_chunks` chunks, only the first and last
+    chunks are kept so memory and the number of LLM requests stay bounded.
+
+    :param lines: An iterable of output lines.
+    :param max_tokens: The token budget per chunk.
+    :param max_chunks: The maximum number of chunks returned.
+    :return: A tuple of (chunks, number of chunks omitted from the middle).
+    """
+    head = []
+    tail = deque(maxlen=max(max_chunks - max_chunks // 2, 1))
+    head_size = max_chunks // 2
+    total = 0
+
+    current = []
+    current_tokens = 0
+
+    def emit(chunk):
+        nonlocal total
+        total += 1
+        if len(head) < head_size:
+            head.append(chunk)
+        else:
+            tail.append(chunk)
+
+    for line in lines:
+        line_tokens = estimate_tokens(line)
+        if line_tokens > max_tokens:
+            # A single huge line is cut down so it cannot exceed the budget alone
+            line = line[:max_tokens * 4] + " ...[line truncated]"
+            line_tokens = max_tokens
+        if current and current_tokens + line_tokens > max_tokens:
+            emit("\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        emit("\n".join(current))
+
+    chunks = head + list(tail)
+    return chunks, total - len(chunks)
+
+def is_worth_summarizing(output: str, line_count: int, min_lines: int = SUMMARY_MIN_LINES, min_chars: int = SUMMARY_MIN_CHARS) -> bool:
+    """
+    Decides whether a command's output warrants an LLM summary.
+
+    Short outputs (e.g. `whoami`) and short lists of single values (e.g. a few
+    IP addresses or file names) are already as readable as a summary would be,
+    so the round trip is skipped for them.
+
+    :param output: The (buffered) output of the command.
+    :param line_count: The total number of output lines.
+    :param min_lines: Outputs with fewer lines than this...
+    :param min_chars: ...and fewer characters than this are not summarized.
+    :return: True if the output should be summarized.
+    """
+    if not output.strip():
+        return False
+    if line_count < min_lines and len(output) < min_chars:
+        return False
+    if line_count <= TRIVIAL_LIST_MAX_LINES and all(len(line.split()) <= 1 for line in output.splitlines()):
+        return False
+    return True
@@ -0,0 +1,480 @@
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from collections import Counter
+from dataclasses import dataclass
+from command_resolver import command_executables, WRAPPERS
+from output_chunking import compact_lines, shorten
+
+MAX_PARSE_LINES = 500000 # Longer outputs are summarized raw rather than parsed in memory
+PARSED_RENDER_MAX_LINES = 25 # Parsed output up to this length is shown instead of being summarized
+RENDER_LINE_CHARS = 120 # Average line length assumed by that limit
+MAX_GROUPS = 30 # Rows kept in aggregated tables (connections, tshark fields)
+MAX_SCRIPT_LINES = 4 # nmap script output lines kept per host
+MAX_VALUE_CHARS = 160
+
+# Tool name -> parsers tried in order; see `output_parser`
+_PARSERS = {}
+
+@dataclass
+class ParsedOutput:
+    """A command's output condensed by a local parser."""
+    tool: str
+    text: str # The first line is a one-line overview
+    raw_lines: int
+
+    @property
+    def line_count(self) -> int:
+        return self.text.count("\n") + 1
+
+    def is_short(self, max_lines: int = PARSED_RENDER_MAX_LINES) -> bool:
+        """True if the parsed output is short enough to be read instead of a summary."""
+        return self.line_count <= max_lines and len(self.text) <= max_lines * RENDER_LINE_CHARS
+
+def output_parser(*tools):
+    """
+    Registers a parser for the output of the given tools.
+
+    The decorated function is called as `parse(command, lines)` with the
+    executed command and its output lines, and returns the condensed text, or
+    None if the output is not in a form it understands (the raw output is then
+    used as before).
+    """
+    def register(parse):
+        for tool in tools:
+            _PARSERS.setdefault(tool, []).append(parse)
+        return parse
+    return register
+
+def command_tool(command: str):
+    """
+    Identifies the tool whose output a command prints.
+
+    :return: The tool name, or None for pipelines and command lists, whose output is no longer the tool's own.
+    """
+    try:
+        executables = [os.path.basename(name) for name in command_executables(command)]
+    except ValueError:
+        return None
+    tools = [name for name in executables if name not in WRAPPERS]
+    return tools[0] if len(tools) == 1 else None
+
+def parse_output(command: str, lines) -> ParsedOutput:
+    """
+    Condenses the output of a known tool.
+
+    :param command: The executed command.
+    :param lines: The output lines, e.g. `CommandResult.iter_output_lines()`.
+    :return: A `ParsedOutput`, or None if no parser recognizes the command and its output.
+    """
+    tool = command_tool(command)
+    if tool not in _PARSERS:
+        return None
+    collected = []
+    for line in lines:
+        if len(collected) >= MAX_PARSE_LINES:
+            return None
+        collected.append(line)
+    raw_size = sum(len(line) + 1 for line in collected)
+    for parse in _PARSERS[tool]:
+        text = parse(command, collected)
+        if text:
+            # Short outputs can grow once tabulated; those are used as they are
+            return ParsedOutput(tool, text, len(collected)) if len(text) < raw_size else None
+    return None
+
+def parse_result(result) -> ParsedOutput:
+    """
+    Condenses the output of a `CommandResult` or, step by step, a `PlanResult`.
+
+    Plan steps without a parser keep their (compacted) raw output under their
+    step header.
+
+    :return: A `ParsedOutput`, or None if nothing could be parsed.
+    """
+    if not hasattr(result, "steps"):
+        return parse_output(result.command, result.iter_output_lines())
+
+    parts = []
+    tools = []
+    raw_lines = 0
+    for step in result.steps:
+        step_result = result.results.get(step.id)
+        if step_result is None:
+            parts.append(f"### Step {step.id} was skipped: {step.command}")
+            continue
+        parts.append(f"### Step {step.id} (exit code {step_result.exit_code}): {step.command}")
+        raw_lines += step_result.line_count
+        parsed = parse_output(step.command, step_result.iter_output_lines())
+        if parsed is None:
+            parts.extend(compact_lines(step_result.iter_output_lines()))
+        else:
+            tools.append(parsed.tool)
+            parts.append(parsed.text)
+    if not tools:
+        return None
+    return ParsedOutput(", ".join(dict.fromkeys(tools)), f"plan: {len(result.steps)} steps\n" + "\n".join(parts), raw_lines)
+
+def _table(headers: list, rows: list) -> list:
+    """Formats rows as left-aligned, space-separated columns."""
+    widths = [max(len(str(row[i])) for row in [headers] + rows) for i in range(len(headers))]
+    return [
+        "  ".join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip()
+        for row in [headers] + rows
+    ]
+
+def _split_host_port(address: str):
+    # "10.0.0.5:22", "[::]:22", "*:22", and BSD netstat's "10.0.0.5.22" / "*.22"
+    if ":" in address:
+        host, _, port = address.rpartition(":")
+    else:
+        host, _, port = address.rpartition(".")
+    return host.strip("[]") or "*", port
+
+# --- nmap ---
+
+def _render_nmap(overview: str, hosts: list, down: int) -> str:
+    """
+    Lists each service once, then the hosts grouped by the ports they have,
+    so a scan of many similar hosts costs little more than a scan of one.
+
+    :param hosts: Dictionaries with a "label", "ports" as (port, state, service, version) tuples and "notes".
+    """
+    lines = [overview]
+    services = Counter(port for host in hosts for port in host["ports"])
+    if services:
+        rows = [[port, state, service or "-", shorten(version, 60) or "-", count]
+                for (port, state, service, version), count in sorted(services.items(), key=lambda item: _port_number(item[0][0]))]
+        lines.extend(_table(["PORT", "STATE", "SERVICE", "VERSION", "HOSTS"], rows))
+
+    groups = {}
+    for host in hosts:
+        key = tuple(port if state == "open" else f"{port} {state}" for port, state, _, _ in host["ports"])
+        groups.setdefault(key, []).append(host["label"])
+    lines.append("Hosts by ports:")
+    for ports, labels in sorted(groups.items(), key=lambda item: -len(item[1])):
+        lines.append(f"- {', '.join(ports) or 'no ports listed'} ({len(labels)} host{'s' if len(labels) != 1 else ''}): {', '.join(labels)}")
+
+    # Details shared by several hosts (e.g. "Not shown: 997 closed tcp ports") are listed once
+    notes = Counter(note for host in hosts for note in dict.fromkeys(host["notes"]))
+    shared = [note for note, count in notes.items() if count > 1]
+    if shared or len(notes) > len(shared):
+        lines.append("Details:")
+    lines.extend(f"  {note} ({notes[note]} hosts)" for note in shared)
+    for host in hosts:
+        own = [note for note in host["notes"] if notes[note] == 1]
+        if own:
+            lines.append(f"  {host['label']}:")
+            lines.extend(f"    {note}" for note in own)
+    if down:
+        lines.append(f"({down} host{'s' if down != 1 else ''} down)")
+    return "\n".join(lines)
+
+def _port_number(port: str) -> int:
+    number = port.split("/", 1)[0]
+    return int(number) if number.isdigit() else 0
+
+def _host_label(address: str, name: str = None, vendor: str = None) -> str:
+    extras = [extra for extra in (name, vendor) if extra]
+    return f"{address} ({', '.join(extras)})" if extras else address
+
+@output_parser("nmap")
+def parse_nmap_xml(command: str, lines: list) -> str:
+    """Parses `nmap -oX -` output."""
+    if not lines or not lines[0].startswith("<?xml"):
+        return None
+    try:
+        root = ElementTree.fromstring("\n".join(lines))
+    except ElementTree.ParseError:
+        return None
+    if root.tag != "nmaprun":
+        return None
+
+    hosts = []
+    down = 0
+    for host in root.iter("host"):
+        status = host.find("status")
+        if status is not None and status.get("state") != "up":
+            down += 1
+            continue
+        addresses = {address.get("addrtype"): address for address in host.iter("address")}
+        address = addresses.get("ipv4", addresses.get("ipv6"))
+        mac = addresses.get("mac")
+        names = [name.get("name") for name in host.iter("hostname") if name.get("name")]
+        label = _host_label(address.get("addr") if address is not None else "?", names[0] if names else None,
+                            (mac.get("vendor") or mac.get("addr")) if mac is not None else None)
+        ports = []
+        notes = []
+        for port in host.iter("port"):
+            state = port.find("state")
+            service = port.find("service")
+            version = " ".join(filter(None, (service.get("product"), service.get("version")))) if service is not None else ""
+            ports.append((f"{port.get('portid')}/{port.get('protocol')}", state.get("state") if state is not None else "?",
+                          service.get("name", "") if service is not None else "", version))
+            for script in port.iter("script"):
+                notes.append(shorten(f"{port.get('portid')} {script.get('id')}: {script.get('output', '')}", MAX_VALUE_CHARS))
+        for osmatch in host.iter("osmatch"):
+            notes.append(f"OS: {osmatch.get('name')} ({osmatch.get('accuracy')}%)")
+            break
+        hosts.append({"label": label, "ports": ports, "notes": notes[:MAX_SCRIPT_LINES + 1]})
+
+    finished = root.find("runstats/finished")
+    overview = f"nmap: {finished.get('summary')}" if finished is not None and finished.get("summary") else f"nmap: {len(hosts)} hosts up"
+    return _render_nmap(overview, hosts, down)
+
+NMAP_REPORT = re.compile(r"^Nmap scan report for (\S+)(?: \((\S+)\))?( \[host down\])?")
+NMAP_PORT = re.compile(r"^(\d+/(?:tcp|udp|sctp))\s+(\S+)\s+(\S+)(?:\s+(.*))?$")
+NMAP_MAC = re.compile(r"^MAC Address: (\S+)(?: \((.*)\))?")
+NMAP_NOTES = ("OS details:", "Running:", "Service Info:", "Not shown:")
+
+@output_parser("nmap")
+def parse_nmap_text(command: str, lines: list) -> str:
+    """Parses nmap's normal (human-readable) output."""
+    hosts = []
+    down = 0
+    overview = None
+    host = None
+    for line in lines:
+        report = NMAP_REPORT.match(line)
+        if report:
+            name, address, is_down = report.groups()
+            if is_down:
+                down += 1
+                host = None
+                continue
+            host = {"address": address or name, "name": name if address else None, "vendor": None, "ports": [], "notes": [], "scripts": 0}
+            hosts.append(host)
+            continue
+        if line.startswith("Nmap done:"):
+            overview = "nmap: " + line[len("Nmap done:"):].strip()
+            continue
+        if host is None:
+            continue
+        port = NMAP_PORT.match(line)
+        mac = NMAP_MAC.match(line)
+        if port:
+            host["ports"].append((port.group(1), port.group(2), port.group(3), (port.group(4) or "").strip()))
+        elif mac:
+            host["vendor"] = mac.group(2) if mac.group(2) and mac.group(2) != "Unknown" else mac.group(1)
+        elif line.startswith("|") and host["scripts"] < MAX_SCRIPT_LINES:
+            host["notes"].append(shorten(line.lstrip("|_ "), MAX_VALUE_CHARS))
+            host["scripts"] += 1
+        elif line.startswith(NMAP_NOTES):
+            host["notes"].append(shorten(line, MAX_VALUE_CHARS))
+    if not hosts and overview is None:
+        return None
+    for host in hosts:
+        host["label"] = _host_label(host["address"], host["name"], host["vendor"])
+    return _render_nmap(overview or f"nmap: {len(hosts)} hosts up", hosts, down)
+
+# --- ss / netstat ---
+
+SS_PROCESS = re.compile(r'\("([^"]+)"')
+
+@output_parser("ss", "netstat")
+def parse_sockets(command: str, lines: list) -> str:
+    """Parses the socket tables of `ss` and `netstat`, grouping listeners and connections."""
+    layout = None
+    listeners = {} # (protocol, port, process) -> local addresses
+    connections = Counter() # (state, local port, peer host, process) -> count
+    states = Counter()
+    unix_sockets = 0
+    in_unix_section = False
+
+    for line in lines:
+        if line.startswith("Active UNIX domain sockets"):
+            in_unix_section = True
+            continue
+        if in_unix_section:
+            unix_sockets += 1
+            continue
+        if line.startswith(("Netid", "State", "Proto")):
+            layout = line.split()[0]
+            continue
+        fields = line.split()
+        if layout is None or len(fields) < 4:
+            continue
+
+        if layout == "Proto":
+            if len(fields) < 5 or fields[0].startswith("unix"):
+                continue
+            protocol, local, peer = fields[0], fields[3], fields[4]
+            rest = fields[5:]
+            state = rest.pop(0) if rest and rest[0].isupper() else ""
+            if not state and peer in ("0.0.0.0:*", "*:*", ":::*", "*.*"):
+                state = "UNCONN"
+            process = rest[-1].split("/", 1)[-1] if rest and "/" in rest[-1] else ""
+        else:
+            if layout == "Netid":
+                if len(fields) < 6:
+                    continue
+                protocol, state, local, peer, rest = fields[0], fields[1], fields[4], fields[5], fields[6:]
+            else:
+                if len(fields) < 5:
+                    continue
+                protocol, state, local, peer, rest = "", fields[0], fields[3], fields[4], fields[5:]
+            process = ",".join(dict.fromkeys(SS_PROCESS.findall(" ".join(rest))))
+        protocol = protocol.rstrip("46")
+        state = state.upper()
+        local_host, local_port = _split_host_port(local)
+
+        if state in ("LISTEN", "UNCONN"):
+            listeners.setdefault((protocol, local_port, process), []).append(local_host)
+        else:
+            states[state] += 1
+            connections[(state, local_port, _split_host_port(peer)[0], process)] += 1
+
+    if layout is None or (not listeners and not connections):
+        return None
+    tool = command_tool(command) or "sockets"
+    overview = f"{tool}: {len(listeners)} listening sockets, {sum(states.values())} connections"
+    if states:
+        overview += " (" + ", ".join(f"{state} {count}" for state, count in states.most_common()) + ")"
+    if unix_sockets:
+        overview += f", {unix_sockets} UNIX socket lines omitted"
+    lines = [overview]
+    if listeners:
+        lines.append("Listening:")
+        rows = [
+            [protocol or "-", port, process or "-", ", ".join(dict.fromkeys(hosts))]
+            for (protocol, port, process), hosts in sorted(listeners.items(), key=lambda item: (item[0][0], int(item[0][1]) if item[0][1].isdigit() else 0))
+        ]
+        lines.extend(_table(["PROTO", "PORT", "PROCESS", "ADDRESSES"], rows))
+    if connections:
+        lines.append("Connections:")
+        rows = [[state, port, peer, process or "-", count] for (state, port, peer, process), count in connections.most_common(MAX_GROUPS)]
+        lines.extend(_table(["STATE", "LOCAL PORT", "PEER", "PROCESS", "COUNT"], rows))
+        if len(connections) > MAX_GROUPS:
+            lines.append(f"({len(connections) - MAX_GROUPS} smaller groups omitted)")
+    return "\n".join(lines)
+
+# --- dig ---
+
+DIG_SECTION = re.compile(r"^;; (\w+) SECTION:")
+DIG_STATUS = re.compile(r"status: (\w+)")
+
+@output_parser("dig")
+def parse_dig(command: str, lines: list) -> str:
+    """Parses dig's full output, merging the records of each name and type."""
+    section = "RECORDS" # +trace output has no section headers
+    records = {} # (section, name, type) -> (values, lowest TTL)
+    statuses = []
+    details = []
+    for line in lines:
+        header = DIG_SECTION.match(line)
+        if header:
+            section = header.group(1)
+            continue
+        if line.startswith(";"):
+            status = DIG_STATUS.search(line)
+            if status:
+                statuses.append(status.group(1))
+            elif line.startswith((";; SERVER:", ";; Query time:")):
+                details.append(line[3:].strip())
+            continue
+        fields = line.split(None, 4)
+        if len(fields) < 5 or not fields[1].isdigit() or section == "QUESTION":
+            continue
+        name, ttl, _, record_type, value = fields
+        values, lowest_ttl = records.get((section, name, record_type), ([], int(ttl)))
+        if value not in values:
+            values.append(value)
+        records[(section, name, record_type)] = (values, min(lowest_ttl, int(ttl)))
+
+    if not records and not statuses:
+        return None # e.g. +short, which is already compact
+    overview = "dig: status " + ", ".join(dict.fromkeys(statuses)) if statuses else "dig"
+    if details:
+        overview += "; " + "; ".join(dict.fromkeys(details))
+    lines = [overview]
+    current = None
+    rows = []
+    for (section, name, record_type), (values, ttl) in records.items():
+        if section != current:
+            if rows:
+                lines.extend(_table(["NAME", "TYPE", "TTL", "VALUES"], rows))
+                rows = []
+            lines.append(f"{section}:")
+            current = section
+        rows.append([name, record_type, ttl, shorten(", ".join(values), MAX_VALUE_CHARS * 2)])
+    if rows:
+        lines.extend(_table(["NAME", "TYPE", "TTL", "VALUES"], rows))
+    return "\n".join(lines)
+
+# --- whois ---
+
+WHOIS_FIELD = re.compile(r"^\s*([A-Za-z][\w /().&-]{0,48}?):\s+(\S.*)$")
+WHOIS_BOILERPLATE = (">>>", "NOTICE", "TERMS OF USE", "URL of the ICANN", "For more information", "The Registrar of Record")
+WHOIS_WITHHELD = re.compile(r"redacted|withheld|not disclosed|please query|data protected", re.IGNORECASE)
+
+@output_parser("whois")
+def parse_whois(command: str, lines: list) -> str:
+    """Parses whois records into one line per field, dropping comments, legal notices and redacted values."""
+    fields = {} # Lowercase key -> (key as written, values)
+    dropped = 0
+    for line in lines:
+        stripped = line.strip()
+        match = WHOIS_FIELD.match(line)
+        if not stripped or stripped.startswith(("%", "#")) or stripped.startswith(WHOIS_BOILERPLATE) or not match:
+            dropped += bool(stripped)
+            continue
+        key, value = match.group(1).strip(), match.group(2).strip()
+        # "clientTransferProhibited https://icann.org/epp#clientTransferProhibited" -> "clientTransferProhibited"
+        value = re.sub(r"\s+\(?https?://\S+$", "", value)
+        if WHOIS_WITHHELD.search(value):
+            dropped += 1
+            continue
+        _, values = fields.setdefault(key.lower(), (key, []))
+        if value.lower() not in (known.lower() for known in values):
+            values.append(value)
+        else:
+            dropped += 1
+    if len(fields) < 2:
+        return None
+    lines = [f"whois: {len(fields)} fields ({dropped} comment, notice, redacted or duplicate lines dropped)"]
+    lines.extend(f"{key}: {shorten(', '.join(values), MAX_VALUE_CHARS * 2)}" for key, values in fields.values())
+    return "\n".join(lines)
+
+# --- tshark ---
+
+TSHARK_FIELD = re.compile(r"(?:^|\s)-e\s*(\S+)")
+TSHARK_PACKET = re.compile(r"^\s*\d+\s+[\d.]+\s+(\S+)\s+(?:→|->)\s+(\S+)\s+(\S+)\s+(\d+)\b")
+
+@output_parser("tshark")
+def parse_tshark(command: str, lines: list) -> str:
+    """
+    Parses tshark output: `-T fields` rows are counted per distinct row, and
+    the default one-line packet summaries are grouped into conversations.
+    """
+    if re.search(r"-T\s*fields", command):
+        names = TSHARK_FIELD.findall(command)
+        rows = Counter(tuple(line.split("\t")) for line in lines if line.strip())
+        if not rows:
+            return None
+        width = max(len(row) for row in rows)
+        headers = (names + [f"field {i + 1}" for i in range(len(names), width)])[:width]
+        result = [f"tshark: {sum(rows.values())} packets, {len(rows)} distinct rows"]
+        result.extend(_table(["COUNT"] + headers, [[count] + [shorten(value, MAX_VALUE_CHARS) for value in row] + [""] * (width - len(row))
+                                                    for row, count in rows.most_common(MAX_GROUPS)]))
+        if len(rows) > MAX_GROUPS:
+            result.append(f"({len(rows) - MAX_GROUPS} rarer rows omitted)")
+        return "\n".join(result)
+
+    conversations = Counter()
+    sizes = Counter()
+    packets = 0
+    for line in lines:
+        match = TSHARK_PACKET.match(line)
+        if match:
+            source, destination, protocol, length = match.groups()
+            conversations[(source, destination, protocol)] += 1
+            sizes[(source, destination, protocol)] += int(length)
+            packets += 1
+    if not packets:
+        return None
+    result = [f"tshark: {packets} packets in {len(conversations)} conversations (source, destination, protocol)"]
+    result.extend(_table(["SOURCE", "DESTINATION", "PROTOCOL", "PACKETS", "BYTES"],
+                         [[*key, count, sizes[key]] for key, count in conversations.most_common(MAX_GROUPS)]))
+    if len(conversations) > MAX_GROUPS:
+        result.append(f"({len(conversations) - MAX_GROUPS} smaller conversations omitted)")
+    return "\n".join(result)
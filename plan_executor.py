@@ -0,0 +1,241 @@
+import asyncio
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from platform_utils import stream_command_on_host
+from telemetry import telemetry
+
+PLAN_PARALLELISM = 4 # Plan steps running at the same time
+MAX_PLAN_STEPS = 16
+
+@dataclass
+class PlanStep:
+    """One command of a multi-step plan."""
+    id: str
+    command: str
+    depends_on: list = field(default_factory=list)
+
+def is_plan(command: str) -> bool:
+    """True if a generated command is a <plan> rather than a single shell command."""
+    return bool(command) and command.lstrip().startswith("<plan>")
+
+def parse_plan(command: str) -> list:
+    """
+    Parses a plan produced by the LLM.
+
+    A plan is a JSON array of steps inside a <plan> tag, e.g.
+    `[{"id": "dns", "command": "dig example.com", "depends_on": []}, ...]`.
+
+    :param command: The generated command.
+    :return: The `PlanStep`s in the order given, or None if the command is not a plan.
+    :raises ValueError: If the plan is malformed, refers to unknown steps or has a dependency cycle.
+    """
+    if not is_plan(command):
+        return None
+    match = re.search(r'<plan>(.*?)(?:</plan>|$)', command, re.DOTALL)
+    try:
+        data = json.loads(match.group(1))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"the plan is not valid JSON ({e})")
+    if isinstance(data, dict):
+        data = data.get("steps")
+    if not isinstance(data, list) or not data:
+        raise ValueError("the plan must be a non-empty JSON array of steps")
+    if len(data) > MAX_PLAN_STEPS:
+        raise ValueError(f"the plan has {len(data)} steps; at most {MAX_PLAN_STEPS} are allowed")
+
+    steps = []
+    for position, item in enumerate(data, 1):
+        if not isinstance(item, dict) or not str(item.get("command") or "").strip():
+            raise ValueError(f"step {position} has no command")
+        depends_on = item.get("depends_on") or []
+        if isinstance(depends_on, str):
+            depends_on = [depends_on]
+        steps.append(PlanStep(str(item.get("id") or position), item["command"].strip(), [str(dep) for dep in depends_on]))
+
+    ids = [step.id for step in steps]
+    duplicates = sorted({step_id for step_id in ids if ids.count(step_id) > 1})
+    if duplicates:
+        raise ValueError(f"duplicate step ids: {', '.join(duplicates)}")
+    for step in steps:
+        unknown = [dep for dep in step.depends_on if dep not in ids]
+        if unknown:
+            raise ValueError(f"step {step.id} depends on unknown steps: {', '.join(unknown)}")
+
+    # Kahn's algorithm: every step must become runnable at some point
+    remaining = {step.id: set(step.depends_on) for step in steps}
+    while remaining:
+        ready = [step_id for step_id, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"the dependencies of steps {', '.join(remaining)} form a cycle")
+        for step_id in ready:
+            del remaining[step_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return steps
+
+class PlanResult:
+    """
+    The outcome of an executed plan.
+
+    It offers the same interface as `platform_utils.CommandResult`, so the
+    retry, display and summarization code handles single commands and plans
+    alike; the output of each step is introduced by a header naming the step.
+    """
+
+    def __init__(self, steps: list):
+        self.steps = steps
+        self.command = "\n".join(step.command for step in steps)
+        self.results = {} # Step id -> CommandResult
+        self.skipped = {} # Step id -> reason the step did not run
+        self.duration = 0.0
+
+    @property
+    def succeeded(self) -> bool:
+        return not self.skipped and all(result.succeeded for result in self.results.values())
+
+    @property
+    def exit_code(self) -> int:
+        """0 if every step succeeded, otherwise the first failing step's exit code (1 for skipped steps)."""
+        for step in self.steps:
+            result = self.results.get(step.id)
+            if result is not None and result.exit_code != 0:
+                return result.exit_code
+        return 1 if self.skipped else 0
+
+    @property
+    def timed_out(self) -> bool:
+        return any(result.timed_out for result in self.results.values())
+
+    @property
+    def line_count(self) -> int:
+        return sum(result.line_count for result in self.results.values())
+
+    @property
+    def byte_count(self) -> int:
+        return sum(result.byte_count for result in self.results.values())
+
+    @property
+    def truncated(self) -> bool:
+        return any(result.truncated for result in self.results.values())
+
+    @property
+    def output(self) -> str:
+        """The buffered stdout of every step, each under its header."""
+        return "\n".join(self._iter_lines(lambda result: result.output.splitlines())).strip()
+
+    @property
+    def stderr(self) -> str:
+        return "\n".join(
+            f"[{step.id}] {self.results[step.id].stderr}" for step in self.steps
+            if step.id in self.results and self.results[step.id].stderr
+        )
+
+    def iter_output_lines(self):
+        """Yields the complete spooled stdout of every step, each under its header."""
+        yield from self._iter_lines(lambda result: result.iter_output_lines())
+
+    def _iter_lines(self, lines_of):
+        for step in self.steps:
+            if step.id in self.skipped:
+                yield f"### Step {step.id} was skipped ({self.skipped[step.id]}): {step.command}"
+                continue
+            result = self.results.get(step.id)
+            if result is None:
+                continue
+            status = "timed out" if result.timed_out else f"exit code {result.exit_code}"
+            yield f"### Step {step.id} ({status}): {step.command}"
+            yield from lines_of(result)
+
+    def step_records(self) -> list:
+        """Returns a JSON-serializable status of every step."""
+        records = []
+        for step in self.steps:
+            result = self.results.get(step.id)
+            records.append({
+                "id": step.id,
+                "command": step.command,
+                "depends_on": step.depends_on,
+                "exit_code": result.exit_code if result else None,
+                "timed_out": result.timed_out if result else False,
+                "output_lines": result.line_count if result else 0,
+                "duration": round(result.duration, 3) if result else 0.0,
+                "skipped": self.skipped.get(step.id),
+            })
+        return records
+
+    def describe_failure(self) -> str:
+        """Describes the failed and skipped steps for the next attempt."""
+        failures = []
+        for step in self.steps:
+            result = self.results.get(step.id)
+            if result is not None and not result.succeeded:
+                failures.append(f"Plan step {step.id} failed. {result.describe_failure()}")
+            elif step.id in self.skipped:
+                failures.append(f"Plan step {step.id} was skipped: {self.skipped[step.id]}.")
+        succeeded = [step.id for step in self.steps if step.id in self.results and self.results[step.id].succeeded]
+        if succeeded:
+            failures.append(f"Steps that succeeded: {', '.join(succeeded)}.")
+        return "\n".join(failures)
+
+    def cleanup(self):
+        """Deletes the spool files of every step."""
+        for result in self.results.values():
+            result.cleanup()
+
+async def execute_plan(steps: list, max_parallel: int = PLAN_PARALLELISM, on_line=None, on_step_done=None, timeout: float = None) -> PlanResult:
+    """
+    Runs the steps of a plan as a dependency graph.
+
+    Each step starts as soon as the steps it depends on have succeeded, and at
+    most `max_parallel` steps run at the same time, so independent commands
+    take about as long as the slowest of them instead of their sum. A step
+    whose dependency failed is skipped; unrelated steps still run.
+
+    :param steps: The `PlanStep`s, as returned by `parse_plan`.
+    :param max_parallel: The maximum number of steps running concurrently.
+    :param on_line: Optional callback `on_line(step_id, line, is_stderr)` invoked for every output line.
+    :param on_step_done: Optional callback `on_step_done(step, result)`; `result` is None for a skipped step.
+    :param timeout: Optional wall-clock limit in seconds for each step.
+    :return: A `PlanResult`. Failing steps are reported in the result, not raised.
+    """
+    plan_result = PlanResult(steps)
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+    tasks = {}
+
+    async def run_step(step: PlanStep) -> bool:
+        for dep in step.depends_on:
+            if not await tasks[dep]:
+                plan_result.skipped[step.id] = f"step {dep} did not succeed"
+                if on_step_done:
+                    on_step_done(step, None)
+                return False
+        async with semaphore:
+            with telemetry.span("step", step=step.id) as span:
+                result = await stream_command_on_host(
+                    step.command,
+                    on_line=(lambda line, is_stderr: on_line(step.id, line, is_stderr)) if on_line else None,
+                    timeout=timeout
+                )
+                span.update(exit_code=result.exit_code, timed_out=result.timed_out, lines=result.line_count)
+        plan_result.results[step.id] = result
+        if on_step_done:
+            on_step_done(step, result)
+        return result.succeeded
+
+    start = time.monotonic()
+    # Every task exists before any of them runs, so dependents can always await their dependencies
+    for step in steps:
+        tasks[step.id] = asyncio.ensure_future(run_step(step))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        plan_result.cleanup()
+        raise
+    finally:
+        plan_result.duration = time.monotonic() - start
+    return plan_result
@@ -1,11 +1,32 @@
 
 
+import asyncio
 import platform
 import subprocess
 import json
 import os
+import shlex
+import signal
+import tempfile
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from installed_tools import InstalledToolsStore
 
-INSTALLED_TOOLS_FILE = "installed_tools.json"
+OUTPUT_BUFFER_LINES = 2000 # Lines of stdout kept in memory; the full stream is spooled to disk
+STDERR_BUFFER_LINES = 200
+MAX_LINE_LENGTH = 4096 # Longer lines are truncated in memory (but not in the spool file)
+READ_CHUNK_SIZE = 64 * 1024
+FAILURE_CONTEXT_LINES = 50 # Lines of stdout included when a failure is reported back to the LLM
+
+# Package index freshness
+PACKAGE_INDEX_MAX_AGE = 24 * 3600 # Seconds before installs refresh the package index first
+PACKAGE_INDEX_STAMP_FILE = "package_index.json" # When the agent last refreshed the index itself
+APT_LISTS_DIR = "/var/lib/apt/lists"
+APT_UPDATE_STAMP = "/var/lib/apt/periodic/update-success-stamp"
+HOMEBREW_REPOSITORIES = ["/opt/homebrew", "/usr/local/Homebrew"]
+# Install errors meaning the package is unknown to a possibly outdated index
+PACKAGE_NOT_FOUND_ERRORS = ("Unable to locate package", "has no installation candidate", "No available formula", "No formulae or casks found")
 
 def get_os_type():
     """Returns 'macos' or 'linux' based on the operating system."""
@@ -51,71 +72,462 @@ def run_command_on_host(command: str, check_output: bool = True, shell: bool = T
     except FileNotFoundError:
         raise RuntimeError(f"Command not found: {command.split()[0]}")
 
-def _load_installed_tools():
+async def run_command_on_host_async(command: str, check_output: bool = True, timeout: float = None) -> str:
     """
-    Loads the list of tools installed by the agent from a JSON file.
+    Runs a shell command on the host system without blocking the event loop.
+
+    If the awaiting task is cancelled or the timeout expires, the command is
+    terminated so that a single step can be aborted without ending the session.
+
+    :param command: The command string to execute.
+    :param check_output: If True, raises an exception for non-zero exit codes.
+    :param timeout: Optional wall-clock limit in seconds.
+    :return: The stdout of the command.
     """
-    if not os.path.exists(INSTALLED_TOOLS_FILE):
-        return []
+    process = await asyncio.create_subprocess_shell(
+        command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
     try:
-        with open(INSTALLED_TOOLS_FILE, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return []
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        await _terminate_process(process)
+        raise RuntimeError(f"Command timed out after {timeout} seconds: {command}")
+    except asyncio.CancelledError:
+        await _terminate_process(process)
+        raise
+
+    stdout = stdout.decode('utf-8', errors='replace')
+    stderr = stderr.decode('utf-8', errors='replace')
+    if check_output and process.returncode != 0:
+        raise RuntimeError(f"Command failed: {command}\nStdout: {stdout}\nStderr: {stderr}")
+    return stdout.strip()
 
-def _save_installed_tools(tools):
+@dataclass
+class CommandResult:
     """
-    Saves the list of tools installed by the agent to a JSON file.
+    The outcome of a command run with `stream_command_on_host`.
+
+    Only the last `OUTPUT_BUFFER_LINES` lines of stdout are kept in memory;
+    the complete stdout is spooled to `spool_path`.
     """
-    with open(INSTALLED_TOOLS_FILE, 'w') as f:
-        json.dump(tools, f, indent=4)
+    command: str
+    exit_code: int = None
+    stdout_tail: deque = field(default_factory=deque)
+    stderr_tail: deque = field(default_factory=deque)
+    spool_path: str = None
+    line_count: int = 0
+    byte_count: int = 0
+    duration: float = 0.0
+    timed_out: bool = False
 
-def install_package(package_name: str) -> str:
+    @property
+    def output(self) -> str:
+        """The buffered stdout of the command."""
+        return "\n".join(self.stdout_tail).strip()
+
+    @property
+    def stderr(self) -> str:
+        """The buffered stderr of the command."""
+        return "\n".join(self.stderr_tail).strip()
+
+    @property
+    def succeeded(self) -> bool:
+        return self.exit_code == 0 and not self.timed_out
+
+    @property
+    def truncated(self) -> bool:
+        """True if older stdout lines were dropped from the in-memory buffer."""
+        return self.line_count > len(self.stdout_tail)
+
+    def iter_output_lines(self):
+        """
+        Yields every stdout line from the spool file without loading it all into memory.
+        """
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            yield from self.stdout_tail
+            return
+        with open(self.spool_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+    def describe_failure(self) -> str:
+        """Describes a failed run in the same form as `run_command_on_host` errors."""
+        if self.timed_out:
+            reason = f"Command timed out after {self.duration:.1f} seconds: {self.command}"
+        else:
+            reason = f"Command failed: {self.command}\nExit code: {self.exit_code}"
+        # Keep the error context small; the end of the output is what explains a failure
+        stdout = "\n".join(list(self.stdout_tail)[-FAILURE_CONTEXT_LINES:]).strip()
+        return f"{reason}\nStdout: {stdout}\nStderr: {self.stderr}"
+
+    def cleanup(self):
+        """Deletes the spool file."""
+        if self.spool_path and os.path.exists(self.spool_path):
+            os.remove(self.spool_path)
+        self.spool_path = None
+
+async def stream_command_on_host(command: str, on_line=None, timeout: float = None, max_buffer_lines: int = OUTPUT_BUFFER_LINES) -> CommandResult:
     """
-    Installs a package using the detected package manager.
+    Runs a shell command on the host system, streaming its output as it arrives.
+
+    Memory use stays flat regardless of how much the command prints: stdout is
+    kept in a bounded ring buffer and spooled in full to a temporary file.
+
+    :param command: The command string to execute.
+    :param on_line: Optional callback `on_line(line, is_stderr)` invoked for every output line.
+    :param timeout: Optional wall-clock limit in seconds.
+    :param max_buffer_lines: How many of the most recent stdout lines are kept in memory.
+    :return: A `CommandResult`. Non-zero exit codes are reported in the result, not raised.
     """
-    pm = get_package_manager()
+    result = CommandResult(
+        command=command,
+        stdout_tail=deque(maxlen=max_buffer_lines),
+        stderr_tail=deque(maxlen=STDERR_BUFFER_LINES)
+    )
+    spool = tempfile.NamedTemporaryFile(mode='wb', prefix='hacker-agent-', suffix='.log', delete=False)
+    result.spool_path = spool.name
+    start = time.monotonic()
+
+    async def pump(stream, tail, is_stderr):
+        pending = b""
+        overlong = False # The start of the current line was already emitted; the rest is dropped
+        while True:
+            chunk = await stream.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            if not is_stderr:
+                spool.write(chunk)
+                result.byte_count += len(chunk)
+            lines = chunk.split(b"\n")
+            rest = lines.pop()
+            for line in lines:
+                if not overlong:
+                    _emit(pending + line, tail, is_stderr)
+                pending = b""
+                overlong = False
+            if overlong:
+                continue
+            pending += rest
+            if len(pending) > MAX_LINE_LENGTH:
+                _emit(pending, tail, is_stderr)
+                pending = b""
+                overlong = True
+        if pending:
+            _emit(pending, tail, is_stderr)
+
+    def _emit(raw_line, tail, is_stderr):
+        line = raw_line[:MAX_LINE_LENGTH].decode('utf-8', errors='replace').rstrip("\r")
+        tail.append(line)
+        if not is_stderr:
+            result.line_count += 1
+        if on_line:
+            on_line(line, is_stderr)
+
+    try:
+        process = await asyncio.create_subprocess_shell(
+            command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            await asyncio.wait_for(asyncio.gather(
+                pump(process.stdout, result.stdout_tail, False),
+                pump(process.stderr, result.stderr_tail, True),
+                process.wait()
+            ), timeout)
+        except asyncio.TimeoutError:
+            result.timed_out = True
+            await _terminate_process(process)
+        except asyncio.CancelledError:
+            await _terminate_process(process)
+            raise
+        result.exit_code = process.returncode
+    except BaseException:
+        spool.close()
+        result.cleanup()
+        raise
+    finally:
+        result.duration = time.monotonic() - start
+
+    spool.close()
+    return result
+
+def _process_tree(pid: int) -> list:
+    """
+    Returns the pid of a process followed by the pids of all its descendants.
+    """
+    try:
+        children = subprocess.run(["pgrep", "-P", str(pid)], capture_output=True, text=True).stdout.split()
+    except FileNotFoundError:
+        children = []
+    pids = [pid]
+    for child in children:
+        pids.extend(_process_tree(int(child)))
+    return pids
+
+def _signal_process_tree(pids: list, sig: int):
+    for pid in pids:
+        try:
+            os.kill(pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+async def _terminate_process(process, grace_period: float = 2.0):
+    """
+    Stops a running shell command together with the processes it spawned,
+    escalating from SIGTERM to SIGKILL.
+
+    The shell's children hold on to the output pipes, so they have to be
+    stopped as well for the subprocess to finish.
+    """
+    if process.returncode is None:
+        pids = _process_tree(process.pid)
+        _signal_process_tree(pids, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), grace_period)
+        except asyncio.TimeoutError:
+            _signal_process_tree(pids + _process_tree(process.pid)[1:], signal.SIGKILL)
+            await process.wait()
+
+_toolset_change_listeners = []
+
+def on_toolset_changed(callback):
+    """
+    Registers a callback that is invoked whenever the agent installs or uninstalls a package.
+
+    :param callback: A callable taking no arguments.
+    """
+    _toolset_change_listeners.append(callback)
+
+def _notify_toolset_changed():
+    for callback in _toolset_change_listeners:
+        callback()
+
+_installed_tools = InstalledToolsStore()
+
+_package_index_policy = {"max_age": PACKAGE_INDEX_MAX_AGE}
+
+def set_package_index_max_age(seconds: float):
+    """
+    Sets how old the package index may get before an install refreshes it.
+
+    :param seconds: The maximum age; 0 refreshes before every install.
+    """
+    _package_index_policy["max_age"] = seconds
+
+def file_mtime(path: str):
+    """Returns a file's modification time, or None if it does not exist."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def _package_index_timestamps(pm: str) -> list:
+    """Collects the modification times that reveal when the package index was last refreshed."""
+    timestamps = []
+    try:
+        with open(PACKAGE_INDEX_STAMP_FILE, 'r') as f:
+            timestamps.append(float(json.load(f)["refreshed_at"]))
+    except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+        pass
+
+    if pm == "apt":
+        try:
+            lists = [entry for entry in os.scandir(APT_LISTS_DIR) if entry.is_file() and entry.name != "lock"]
+        except OSError:
+            lists = []
+        if not lists:
+            # Without any index files nothing can be installed until apt-get update runs
+            return []
+        # apt keeps the server's timestamps on unchanged lists, so the directories are checked as well
+        timestamps += [entry.stat().st_mtime for entry in lists]
+        timestamps += [file_mtime(APT_LISTS_DIR), file_mtime(os.path.join(APT_LISTS_DIR, "partial")), file_mtime(APT_UPDATE_STAMP)]
+    elif pm == "brew":
+        cache_dir = os.environ.get("HOMEBREW_CACHE") or os.path.expanduser("~/Library/Caches/Homebrew")
+        timestamps.append(file_mtime(os.path.join(cache_dir, "api", "formula.jws.json")))
+        timestamps += [file_mtime(os.path.join(repository, ".git", "FETCH_HEAD")) for repository in HOMEBREW_REPOSITORIES]
+    return [timestamp for timestamp in timestamps if timestamp is not None]
+
+def package_index_age():
+    """
+    Returns how many seconds ago the package index was last refreshed.
+
+    :return: The age in seconds, or None if it is unknown (e.g. apt has no index files).
+    """
+    timestamps = _package_index_timestamps(get_package_manager())
+    return max(0.0, time.time() - max(timestamps)) if timestamps else None
+
+def package_index_is_stale() -> bool:
+    """Returns True if the next install should refresh the package index first."""
+    age = package_index_age()
+    return age is None or age > _package_index_policy["max_age"]
+
+def _record_package_index_refresh():
+    temp_path = f"{PACKAGE_INDEX_STAMP_FILE}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump({"refreshed_at": time.time()}, f)
+    os.replace(temp_path, PACKAGE_INDEX_STAMP_FILE)
+
+def _package_command(pm: str, action: str, package_names: list, refresh_index: bool = False) -> str:
+    """
+    Builds a single package-manager invocation for all given packages.
+
+    :param refresh_index: If True, an install refreshes the package index first.
+    """
+    packages = " ".join(shlex.quote(name) for name in package_names)
     if pm == "brew":
-        cmd = f"brew install {package_name}"
+        if action == "install":
+            # Homebrew's own auto-update is replaced by the agent's freshness policy
+            update = "brew update && " if refresh_index else ""
+            return f"{update}HOMEBREW_NO_AUTO_UPDATE=1 brew install {packages}"
+        return f"brew {action} {packages}"
     elif pm == "apt":
-        cmd = f"sudo apt-get update && sudo apt-get install -y {package_name}"
-    else:
-        raise NotImplementedError(f"Install not supported for {pm}")
-
-    print(f"Attempting to install {package_name} using {pm}...")
-    output = run_command_on_host(cmd)
-    
-    installed_tools = _load_installed_tools()
-    if package_name not in installed_tools:
-        installed_tools.append(package_name)
-        _save_installed_tools(installed_tools)
+        if action == "install":
+            update = "sudo apt-get update && " if refresh_index else ""
+            return f"{update}sudo apt-get install -y {packages}"
+        return f"sudo apt-get remove -y {packages}"
+    raise NotImplementedError(f"{action.capitalize()} not supported for {pm}")
+
+def _package_metadata(package_names: list) -> dict:
+    """
+    Looks up the version and installed size of packages (best effort).
+
+    :return: A dictionary mapping each package name to its metadata.
+    """
+    pm = get_package_manager()
+    metadata = {name: {"package_manager": pm} for name in package_names}
+    packages = " ".join(shlex.quote(name) for name in package_names)
+    try:
+        if pm == "apt":
+            output = run_command_on_host(f"dpkg-query -W -f='${{Package}}\\t${{Version}}\\t${{Installed-Size}}\\n' {packages}", check_output=False)
+            for line in output.splitlines():
+                name, version, size = (line.split("\t") + ["", ""])[:3]
+                if name in metadata:
+                    # dpkg reports the installed size in KiB
+                    metadata[name].update(version=version or None, size_bytes=int(size) * 1024 if size.isdigit() else None)
+        elif pm == "brew":
+            for line in run_command_on_host(f"brew list --versions {packages}", check_output=False).splitlines():
+                name, _, version = line.partition(" ")
+                if name in metadata:
+                    metadata[name]["version"] = version.strip() or None
+            cellar_paths = " ".join(f'"$cellar"/{shlex.quote(name)}' for name in package_names)
+            for line in run_command_on_host(f'cellar=$(brew --cellar) && du -sk {cellar_paths}', check_output=False).splitlines():
+                size, _, path = line.partition("\t")
+                name = os.path.basename(path.strip())
+                if name in metadata and size.isdigit():
+                    metadata[name]["size_bytes"] = int(size) * 1024
+    except RuntimeError:
+        pass
+    return metadata
+
+def install_packages(package_names: list) -> str:
+    """
+    Installs several packages with a single package-manager invocation.
+
+    The package index is only refreshed first when it is older than the
+    configured maximum age, or when the install fails because a package is
+    unknown to the current index.
+
+    :param package_names: The packages to install.
+    :return: The package manager's output.
+    """
+    package_names = list(dict.fromkeys(package_names))
+    if not package_names:
+        return ""
+    pm = get_package_manager()
+    refresh_index = package_index_is_stale()
+    cmd = _package_command(pm, "install", package_names, refresh_index=refresh_index)
+
+    print(f"Attempting to install {', '.join(package_names)} using {pm}...")
+    try:
+        try:
+            output = run_command_on_host(cmd)
+        except RuntimeError as e:
+            if refresh_index or not any(error in str(e) for error in PACKAGE_NOT_FOUND_ERRORS):
+                raise
+            # The index is recent but may still predate the package
+            print("Package not found in the local index; refreshing it and retrying...")
+            refresh_index = True
+            output = run_command_on_host(_package_command(pm, "install", package_names, refresh_index=True))
+        if refresh_index:
+            _record_package_index_refresh()
+    finally:
+        # Even a failed run may have changed what is installed
+        _notify_toolset_changed()
+
+    _installed_tools.add(_package_metadata(package_names))
     return output
 
-def uninstall_package(package_name: str) -> str:
+def install_package(package_name: str) -> str:
     """
-    Uninstalls a package using the detected package manager.
+    Installs a package using the detected package manager.
     """
+    return install_packages([package_name])
+
+def uninstall_packages(package_names: list) -> str:
+    """
+    Uninstalls several packages with a single package-manager invocation.
+
+    If the combined invocation fails (e.g. because one package is unknown),
+    the packages are removed one at a time so the others are still cleaned up.
+
+    :param package_names: The packages to uninstall.
+    :return: The package manager's output.
+    :raises RuntimeError: If any package could not be uninstalled.
+    """
+    package_names = list(dict.fromkeys(package_names))
+    if not package_names:
+        return ""
     pm = get_package_manager()
-    if pm == "brew":
-        cmd = f"brew uninstall {package_name}"
-    elif pm == "apt":
-        cmd = f"sudo apt-get remove -y {package_name}"
-    else:
-        raise NotImplementedError(f"Uninstall not supported for {pm}")
+    cmd = _package_command(pm, "uninstall", package_names)
 
-    print(f"Attempting to uninstall {package_name} using {pm}...")
-    output = run_command_on_host(cmd)
+    print(f"Attempting to uninstall {', '.join(package_names)} using {pm}...")
+    try:
+        try:
+            output = run_command_on_host(cmd)
+        except RuntimeError:
+            if len(package_names) == 1:
+                raise
+            return _uninstall_individually(pm, package_names)
+    finally:
+        _notify_toolset_changed()
 
-    installed_tools = _load_installed_tools()
-    if package_name in installed_tools:
-        installed_tools.remove(package_name)
-        _save_installed_tools(installed_tools)
+    _installed_tools.remove(package_names)
     return output
 
+def _uninstall_individually(pm: str, package_names: list) -> str:
+    outputs = []
+    removed = []
+    failures = []
+    for name in package_names:
+        try:
+            outputs.append(run_command_on_host(_package_command(pm, "uninstall", [name])))
+            removed.append(name)
+        except RuntimeError as e:
+            failures.append(f"{name}: {e}")
+    _installed_tools.remove(removed)
+    if failures:
+        raise RuntimeError("Failed to uninstall " + "; ".join(failures))
+    return "\n".join(outputs)
+
+def uninstall_package(package_name: str) -> str:
+    """
+    Uninstalls a package using the detected package manager.
+    """
+    return uninstall_packages([package_name])
+
 def get_installed_by_agent() -> list:
     """
     Returns a list of packages installed by the agent.
     """
-    return _load_installed_tools()
+    return _installed_tools.names()
+
+def get_installed_tool_details() -> dict:
+    """
+    Returns the packages installed by the agent with their metadata (install time, version, size).
+    """
+    return _installed_tools.packages()
 
 
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+RESPONSE_CACHE_FILE = "response_cache.json"
+MAX_CACHE_ENTRIES = 500
+CACHE_TTL = 7 * 24 * 3600 # Seconds a cached response stays valid
+
+# Words that make a request depend on the earlier turns of the session, e.g. "scan it again"
+FOLLOW_UP_WORDS = frozenset("""
+it its it's that this these those them they their there again same previous last above earlier before result results output
+""".split())
+FOLLOW_UP_MARKERS = ("它", "这个", "那个", "这些", "那些", "刚才", "上面", "之前", "再", "同样", "结果") # No word boundaries in Chinese
+
+def normalize_request(user_input: str) -> str:
+    """
+    Normalizes a request so trivially different phrasings share a cache entry.
+    """
+    text = re.sub(r"\s+", " ", user_input.strip().lower())
+    return text.rstrip(" .!?。！？")
+
+def is_follow_up(user_input: str) -> bool:
+    """True if a request seems to refer to earlier turns, so its command depends on the session history."""
+    text = normalize_request(user_input)
+    return bool(FOLLOW_UP_WORDS.intersection(re.findall(r"[\w']+", text))) or any(marker in text for marker in FOLLOW_UP_MARKERS)
+
+def cache_key(user_input: str, tool_definitions: str, os_type: str, model_name: str, context: str = None, history: str = None) -> str:
+    """
+    Builds the cache key for a command-generation request.
+
+    :param history: The session history sent with the request, if any. It changes on every turn, so it is only part of
+        the key for follow-up requests (see `is_follow_up`); a standalone request gets the same command either way.
+    :return: A hex digest over everything that influences the LLM's answer.
+    """
+    parts = [normalize_request(user_input), tool_definitions or "", os_type, model_name, context or ""]
+    if history and is_follow_up(user_input):
+        parts.append(history)
+    return hashlib.sha256("\x00".join(parts).encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    An on-disk cache of generated (thought, command) pairs.
+
+    Entries expire after `ttl` seconds, and the least recently used entries are
+    evicted once more than `max_entries` are stored.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_FILE, max_entries: int = MAX_CACHE_ENTRIES, ttl: float = CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = self._load()
+
+    def get(self, key: str):
+        """
+        Looks up a cached response.
+
+        :param key: A key built with `cache_key`.
+        :return: A (thought, command) tuple, or None on a miss.
+        """
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry is None or now - entry["created"] > self.ttl:
+            if entry is not None:
+                del self._entries[key]
+                self._save()
+            self.misses += 1
+            return None
+        entry["last_used"] = now
+        self._save()
+        self.hits += 1
+        return entry["thought"], entry["command"]
+
+    def put(self, key: str, thought: str, command: str):
+        """Stores a response, evicting expired and least recently used entries as needed."""
+        now = time.time()
+        self._entries[key] = {"thought": thought, "command": command, "created": now, "last_used": now}
+        self._evict(now)
+        self._save()
+
+    def discard(self, key: str):
+        """Removes a single entry, e.g. when its command stopped working."""
+        if self._entries.pop(key, None) is not None:
+            self._save()
+
+    def clear(self) -> int:
+        """
+        Removes all entries.
+
+        :return: The number of entries removed.
+        """
+        count = len(self._entries)
+        self._entries = {}
+        self._save()
+        return count
+
+    def stats(self) -> dict:
+        """Returns the number of entries and this session's hit/miss counts."""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_hours": self.ttl / 3600,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _evict(self, now: float):
+        for key in [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl]:
+            del self._entries[key]
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            by_last_use = sorted(self._entries, key=lambda key: self._entries[key]["last_used"])
+            for key in by_last_use[:overflow]:
+                del self._entries[key]
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _save(self):
+        # Write to a temporary file first so a crash cannot leave a truncated cache behind
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(temp_path, self.path)
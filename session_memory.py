@@ -0,0 +1,170 @@
+from output_chunking import estimate_tokens, shorten
+
+RECENT_TURNS = 3 # Most recent turns kept verbatim
+MEMORY_TOKEN_BUDGET = 1500 # Upper bound for the compacted digest of older turns
+RECENT_OUTPUT_LINES = 15 # Output lines kept for each verbatim turn
+MAX_RECENT_OUTPUT_CHARS = 1500
+MAX_DIGEST_FIELD_CHARS = 200 # Longer commands and summaries are cut in the digest
+
+def _first_sentence(text: str) -> str:
+    for separator in (". ", "。", "\n"):
+        if separator in text:
+            text = text.split(separator, 1)[0]
+    return text.strip()
+
+class SessionMemory:
+    """
+    The history of an interactive session, kept to a bounded size.
+
+    The most recent turns are kept verbatim (request, command, exit status,
+    summary and the end of the output). Older turns are compacted into one
+    digest line each (request, command, exit status and the first sentence of
+    the summary, never the raw output) and appended to a digest that only
+    changes when a turn ages out, so the start of the prompt stays
+    byte-identical across requests and can be reused by prefix caching. Once
+    the digest exceeds its token budget, its oldest lines are dropped in one go
+    down to three quarters of the budget rather than one line per turn. A turn
+    whose summary arrives after it was compacted (a background summary, or no
+    verbatim turns at all) has its line rewritten by the next `render`.
+    """
+
+    def __init__(self, recent_turns: int = RECENT_TURNS, token_budget: int = MEMORY_TOKEN_BUDGET):
+        """
+        :param recent_turns: The number of turns kept verbatim.
+        :param token_budget: The maximum estimated size of the digest of older turns.
+        """
+        self.recent_turns = max(0, recent_turns)
+        self.token_budget = token_budget
+        self.turns = [] # Turns still kept verbatim, oldest first
+        self.compacted_turns = 0
+        self.dropped_turns = 0
+        self._digest = [] # [line, tokens, turn] per compacted turn; the turn is kept only while its summary may still arrive
+        self._digest_tokens = 0
+        self._digest_text = ""
+
+    def record(self, user_input: str, command: str = None, result=None, error: str = None) -> dict:
+        """
+        Adds a finished turn.
+
+        :param user_input: The user's request.
+        :param command: The last command run for it, if any.
+        :param result: The `CommandResult` (or `PlanResult`) of that command, if it ran.
+        :param error: Why the request failed, if it did.
+        :return: The turn record; set its "summary" once the output has been summarized.
+        """
+        turn = {"request": user_input, "command": command, "exit_code": None, "output": None, "summary": None, "error": error}
+        if result is not None:
+            turn["exit_code"] = result.exit_code
+            tail = result.output.splitlines()[-RECENT_OUTPUT_LINES:]
+            turn["output"] = "\n".join(tail)[-MAX_RECENT_OUTPUT_CHARS:]
+            if result.line_count > len(tail):
+                turn["output_lines"] = result.line_count
+        self.turns.append(turn)
+        while len(self.turns) > self.recent_turns:
+            self._compact(self.turns.pop(0))
+        return turn
+
+    def clear(self):
+        """Forgets the whole session history."""
+        self.turns = []
+        self.compacted_turns = 0
+        self.dropped_turns = 0
+        self._digest = []
+        self._digest_tokens = 0
+        self._digest_text = ""
+
+    def render(self) -> str:
+        """
+        Formats the history for the command-generation prompt.
+
+        :return: The history, or an empty string if there is none.
+        """
+        self._refresh_digest()
+        if not self._digest_text and not self.turns:
+            return ""
+        parts = []
+        if self._digest_text:
+            parts.append(self._digest_text)
+        if self.turns:
+            parts.append("Most recent requests in this session:\n" + "\n\n".join(self._format_turn(turn) for turn in self.turns))
+        return "\n\n".join(parts) + "\n\n"
+
+    def stats(self) -> dict:
+        """Returns the size of the history."""
+        return {
+            "recent_turns": len(self.turns),
+            "compacted_turns": self.compacted_turns,
+            "dropped_turns": self.dropped_turns,
+            "digest_tokens": self._digest_tokens,
+            "token_budget": self.token_budget,
+            "tokens": estimate_tokens(self.render()),
+        }
+
+    def _compact(self, turn: dict):
+        line = self._digest_line(turn)
+        tokens = estimate_tokens(line)
+        awaiting_summary = not turn["summary"] and not turn["error"]
+        turn["output"] = None # Never part of the digest
+        self._digest.append([line, tokens, turn if awaiting_summary else None])
+        self._digest_tokens += tokens
+        self.compacted_turns += 1
+        self._trim_digest()
+        self._digest_text = self._format_digest()
+
+    def _refresh_digest(self):
+        """Rewrites the lines of compacted turns whose summary has arrived since."""
+        changed = False
+        for entry in self._digest:
+            turn = entry[2]
+            if turn is not None and turn["summary"]:
+                line = self._digest_line(turn)
+                tokens = estimate_tokens(line)
+                self._digest_tokens += tokens - entry[1]
+                entry[:] = [line, tokens, None]
+                changed = True
+        if changed:
+            self._trim_digest()
+            self._digest_text = self._format_digest()
+
+    def _trim_digest(self):
+        if self._digest_tokens > self.token_budget:
+            # Drop a batch of the oldest lines so the digest is not rewritten on every turn
+            while self._digest and self._digest_tokens > self.token_budget * 3 // 4:
+                _, dropped_tokens, _ = self._digest.pop(0)
+                self._digest_tokens -= dropped_tokens
+                self.dropped_turns += 1
+
+    @staticmethod
+    def _digest_line(turn: dict) -> str:
+        line = f"- {shorten(turn['request'], MAX_DIGEST_FIELD_CHARS)}"
+        if turn["command"]:
+            line += f" -> `{shorten(turn['command'], MAX_DIGEST_FIELD_CHARS)}`"
+        if turn["error"]:
+            line += f" (failed: {shorten(turn['error'], MAX_DIGEST_FIELD_CHARS)})"
+        elif turn["exit_code"] is not None:
+            line += f" (exit code {turn['exit_code']})"
+        if turn["summary"]:
+            line += f": {shorten(_first_sentence(turn['summary']), MAX_DIGEST_FIELD_CHARS)}"
+        return line
+
+    def _format_digest(self) -> str:
+        if not self._digest:
+            return ""
+        header = "Earlier requests in this session (oldest first"
+        header += f", {self.dropped_turns} older ones omitted):" if self.dropped_turns else "):"
+        return header + "\n" + "\n".join(line for line, _, _ in self._digest)
+
+    def _format_turn(self, turn: dict) -> str:
+        lines = [f"Request: {turn['request']}"]
+        if turn["command"]:
+            lines.append(f"Command: {turn['command']}")
+        if turn["error"]:
+            lines.append(f"Failed: {turn['error'][:MAX_RECENT_OUTPUT_CHARS]}")
+        elif turn["exit_code"] is not None:
+            lines.append(f"Exit code: {turn['exit_code']}")
+        if turn["summary"]:
+            lines.append(f"Summary: {turn['summary'][:MAX_RECENT_OUTPUT_CHARS]}")
+        elif turn["output"]:
+            label = f"Output (last lines of {turn['output_lines']})" if turn.get("output_lines") else "Output"
+            lines.append(f"{label}:\n{turn['output']}")
+        return "\n".join(lines)
@@ -0,0 +1,230 @@
+import contextvars
+import itertools
+import json
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+MAX_STAGE_SAMPLES = 1000 # Durations kept per stage for the session statistics
+
+# The turn and span the running code belongs to; copied into worker threads by async_utils
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+def percentiles(samples) -> dict:
+    """
+    Summarizes latency samples.
+
+    :param samples: Durations in seconds.
+    :return: Count, mean, p50, p90, p95, p99 and max, rounded to 0.1 ms.
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(p):
+        # Nearest-rank percentile
+        return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered) + 0.5) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered), 4),
+        "p50": round(rank(50), 4),
+        "p90": round(rank(90), 4),
+        "p95": round(rank(95), 4),
+        "p99": round(rank(99), 4),
+        "max": round(ordered[-1], 4),
+    }
+
+class Telemetry:
+    """
+    Lightweight span instrumentation for the agent's pipeline.
+
+    Every user request is a turn made of spans (LLM request, command execution,
+    summarization, discovery). Span durations are aggregated per stage for the
+    `stats` command, and each finished turn can be appended to a JSONL trace
+    file. Token usage reported by the API is attributed to the innermost open
+    span, including calls made from worker threads.
+    """
+
+    def __init__(self):
+        self.stages = {} # Stage name -> recent durations
+        self.tokens = {"prompt_tokens": 0, "completion_tokens": 0}
+        self.llm_requests = 0
+        self.turns = 0
+        self._trace_file = None
+        self._turn_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def enable_trace(self, path: str):
+        """
+        Appends one JSON line per finished turn to `path`.
+
+        Spans that end after their turn, such as background summaries, are
+        appended as separate lines referring to the turn's id.
+        """
+        self._trace_file = open(path, 'a', encoding='utf-8')
+
+    def close(self):
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+
+    @contextmanager
+    def turn(self, user_input: str):
+        """
+        Records one user request.
+
+        :param user_input: The request, stored in the trace.
+        :return: A context manager yielding the turn record; callers may add attributes to it.
+        """
+        record = {
+            "type": "turn",
+            "id": next(self._turn_ids),
+            "request": user_input,
+            "timestamp": time.time(),
+            "spans": [],
+            "tokens": {"prompt_tokens": 0, "completion_tokens": 0},
+            "_start": time.monotonic(),
+            "_open": True,
+        }
+        token = _current_turn.set(record)
+        try:
+            yield record
+        finally:
+            _current_turn.reset(token)
+            with self._lock:
+                record["_open"] = False
+                record["duration"] = round(time.monotonic() - record["_start"], 4)
+                self.turns += 1
+                self._add_sample("turn", record["duration"])
+                self._write(record)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Times one stage of the pipeline.
+
+        :param name: The stage, e.g. "llm", "execute", "summary" or "discovery".
+        :param attributes: Extra fields stored with the span, e.g. the attempt number.
+        :return: A context manager yielding the span record; callers may add attributes to it.
+        """
+        turn = _current_turn.get()
+        record = {"name": name, **attributes}
+        start = time.monotonic()
+        if turn is not None:
+            record["offset"] = round(start - turn["_start"], 4)
+        token = _current_span.set(record)
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            record["duration"] = round(time.monotonic() - start, 4)
+            with self._lock:
+                self._add_sample(name, record["duration"])
+                if turn is not None and turn["_open"]:
+                    turn["spans"].append(record)
+                elif turn is not None:
+                    self._write({"type": "span", "turn": turn["id"], **record})
+
+    def record_usage(self, usage: dict):
+        """
+        Adds the token usage of one LLM response.
+
+        :param usage: The response's "usage" object (None if the API did not report it, or the stream was abandoned).
+        """
+        with self._lock:
+            self.llm_requests += 1
+            span = _current_span.get()
+            if not usage:
+                if span is not None:
+                    span["usage"] = "unknown"
+                return
+            targets = [self.tokens]
+            turn = _current_turn.get()
+            if span is not None:
+                targets.append(span.setdefault("tokens", {"prompt_tokens": 0, "completion_tokens": 0}))
+            if turn is not None:
+                targets.append(turn["tokens"])
+            for target in targets:
+                for field in ("prompt_tokens", "completion_tokens"):
+                    target[field] += usage.get(field) or 0
+
+    def summary(self) -> dict:
+        """
+        Returns the session's aggregate statistics.
+        """
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "llm_requests": self.llm_requests,
+                "tokens": dict(self.tokens),
+                "stages": {name: {**percentiles(samples), "total": round(sum(samples), 4)} for name, samples in self.stages.items()},
+            }
+
+    def _add_sample(self, name: str, duration: float):
+        self.stages.setdefault(name, deque(maxlen=MAX_STAGE_SAMPLES)).append(duration)
+
+    def _write(self, record: dict):
+        if self._trace_file is None:
+            return
+        line = {key: value for key, value in record.items() if not key.startswith("_")}
+        self._trace_file.write(json.dumps(line, ensure_ascii=False) + "\n")
+        self._trace_file.flush()
+
+class StartupProfile:
+    """
+    Timestamps of the agent's startup phases, reported by `--profile-startup`.
+
+    Time spent waiting for the user (e.g. choosing a configuration) is tracked
+    separately, so the reported time to the first prompt only counts the
+    agent's own work.
+    """
+
+    def __init__(self, start: float = None):
+        """
+        :param start: The `time.perf_counter()` value startup began at (defaults to now).
+        """
+        self.start = start if start is not None else time.perf_counter()
+        self.marks = [] # (phase, seconds since start, excluding user input)
+        self.user_wait = 0.0
+
+    def mark(self, phase: str) -> float:
+        """
+        Records that `phase` has finished.
+
+        :return: The seconds since start, excluding user input.
+        """
+        offset = time.perf_counter() - self.start - self.user_wait
+        self.marks.append((phase, offset))
+        return offset
+
+    @contextmanager
+    def waiting_for_user(self):
+        """Excludes the time spent in the block from the profile."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.user_wait += time.perf_counter() - start
+
+    def report(self) -> list:
+        """
+        Returns the phases in the order they finished.
+
+        :return: A list of (phase, milliseconds since start, milliseconds since the previous phase).
+        """
+        rows = []
+        previous = 0.0
+        for phase, offset in sorted(self.marks, key=lambda mark: mark[1]):
+            rows.append((phase, round(offset * 1000, 1), round((offset - previous) * 1000, 1)))
+            previous = offset
+        return rows
+
+# The session-wide instance used by every module
+telemetry = Telemetry()
@@ -0,0 +1,45 @@
+import asyncio
+import io
+import json
+
+from batch import BatchRunner
+from llm_client import LLMClient
+from mock_llm_server import MockLLMServer
+from tool_discovery import ToolCatalog
+
+def run_batch(url: str, summary_policy: dict, requests: list) -> list:
+    llm_client = LLMClient({"name": "mock", "url": url, "api_key": None, "model_name": "mock"}, pool_size=2)
+    runner = BatchRunner(ToolCatalog(""), llm_client, summary_policy, workers=2, max_retries=1,
+                         llm_timeout=30, command_timeout=30, summary_timeout=30)
+    output = io.StringIO()
+    counts = asyncio.run(runner.run(requests, output))
+    assert counts["total"] == len(requests)
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+def test_benchmark_policy_without_parser_settings():
+    # The policy benchmark.py used before the output parsers existed
+    with MockLLMServer(latency=0, command="seq 1 200") as server:
+        records = run_batch(server.url, {"mode": "inline", "min_lines": 0, "min_chars": 0}, ["list the numbers up to 200"])
+    record = records[0]
+    assert record["error"] is None
+    assert record["success"]
+    assert record["summary"]
+    assert record["parsed"] is None
+    assert set(record["timings"]) == {"llm", "execute", "parse", "summary", "total"}
+
+def test_parsers_can_be_disabled():
+    with MockLLMServer(latency=0, command="seq 1 3") as server:
+        records = run_batch(server.url, {"mode": "inline", "min_lines": 0, "min_chars": 0, "parsers": False}, ["count to 3"])
+    assert records[0]["success"]
+    assert records[0]["error"] is None
+
+def test_install_requests_fail_fast_without_running():
+    with MockLLMServer(latency=0, command="platform_utils.install_package('nmap') && nmap -sn 10.0.0.0/24") as server:
+        llm_client = LLMClient({"name": "mock", "url": server.url, "api_key": None, "model_name": "mock"}, pool_size=1)
+        runner = BatchRunner(ToolCatalog(""), llm_client, {"mode": "off", "min_lines": 0, "min_chars": 0}, workers=1, max_retries=3)
+        record = asyncio.run(runner.process(0, "scan the local network"))
+    assert not record["success"]
+    assert record["attempts"] == 1
+    assert record["exit_code"] is None
+    assert record["missing_packages"][0] == "nmap"
+    assert "nmap" in record["error"]
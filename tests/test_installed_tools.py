@@ -0,0 +1,12 @@
+from installed_tools import InstalledToolsStore
+
+def test_reinstall_keeps_install_time_and_order(tmp_path):
+    store = InstalledToolsStore(path=str(tmp_path / "installed_tools.json"))
+    store.add({"nmap": {"version": "7.80"}})
+    store.add({"whois": {"version": "5.5"}})
+    installed_at = store.packages()["nmap"]["installed_at"]
+
+    store.add({"nmap": {"version": "7.94"}})
+    packages = store.packages()
+    assert list(packages) == ["nmap", "whois"]
+    assert packages["nmap"] == {"version": "7.94", "installed_at": installed_at}
@@ -0,0 +1,40 @@
+import time
+
+from llm_client import LLMClient
+from llm_handler import stream_command_from_llm
+from mock_llm_server import MockLLMServer
+from telemetry import telemetry
+
+def wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+def test_streamed_command_records_usage_after_returning():
+    with MockLLMServer(latency=0, command="ls -la") as server:
+        llm_client = LLMClient({"name": "mock", "url": server.url, "api_key": None, "model_name": "mock"}, pool_size=1)
+        with telemetry.turn("list the files") as turn:
+            with telemetry.span("llm") as span:
+                _, command = stream_command_from_llm("list the files", "[]", llm_client)
+            assert command == "ls -la"
+            # The usage event follows the command and is read in the background
+            assert wait_for(lambda: span.get("tokens", {}).get("completion_tokens"))
+        assert span["tokens"]["prompt_tokens"] > 0
+        assert turn["tokens"]["completion_tokens"] == span["tokens"]["completion_tokens"]
+        assert "usage" not in span
+
+def test_cancelled_stream_marks_usage_unknown():
+    class Cancelled:
+        @staticmethod
+        def is_set():
+            return True
+
+    with MockLLMServer(latency=0, command="ls -la") as server:
+        llm_client = LLMClient({"name": "mock", "url": server.url, "api_key": None, "model_name": "mock"}, pool_size=1)
+        with telemetry.span("llm") as span:
+            thought, command = stream_command_from_llm("list the files", "[]", llm_client, cancel_event=Cancelled())
+    assert command == ""
+    assert span["usage"] == "unknown"
@@ -0,0 +1,31 @@
+import asyncio
+import os
+
+from llm_client import LLMClient
+from main import process_request
+from mock_llm_server import MockLLMServer
+from tool_discovery import ToolCatalog
+
+def test_failed_command_output_stays_pageable():
+    with MockLLMServer(latency=0, command="seq 1 300; exit 3") as server:
+        llm_client = LLMClient({"name": "mock", "url": server.url, "api_key": None, "model_name": "mock"}, pool_size=1)
+        result = asyncio.run(process_request("count to 300", ToolCatalog(""), llm_client, streaming=False))
+    try:
+        # The last failed attempt is returned so `show output` can page it
+        assert result is not None
+        assert not result.succeeded
+        assert os.path.exists(result.spool_path)
+        lines = list(result.iter_output_lines())
+        assert lines[0] == "1" and lines[-1] == "300"
+    finally:
+        result.cleanup()
+
+def test_bracketed_stderr_does_not_break_error_output(capsys):
+    with MockLLMServer(latency=0, command="echo 'grep: Unmatched [/x]' >&2; exit 2") as server:
+        llm_client = LLMClient({"name": "mock", "url": server.url, "api_key": None, "model_name": "mock"}, pool_size=1)
+        result = asyncio.run(process_request("search for [/x]", ToolCatalog(""), llm_client, streaming=False))
+    try:
+        assert not result.succeeded
+        assert "grep: Unmatched [/x]" in capsys.readouterr().out
+    finally:
+        result.cleanup()
@@ -0,0 +1,19 @@
+from output_chunking import compact_lines
+
+def test_folds_consecutive_repeats():
+    lines = ["start", "retrying", "retrying", "retrying", "done"]
+    assert list(compact_lines(lines)) == ["start", "retrying  [repeated 3 times]", "done"]
+
+def test_keeps_non_adjacent_duplicates():
+    # The same port line under two hosts must survive
+    lines = [
+        "Nmap scan report for 10.0.0.1",
+        "22/tcp open  ssh",
+        "",
+        "Nmap scan report for 10.0.0.2",
+        "22/tcp open  ssh",
+    ]
+    assert list(compact_lines(lines)) == lines
+
+def test_strips_trailing_whitespace_before_comparing():
+    assert list(compact_lines(["a  ", "a", "b"])) == ["a  [repeated 2 times]", "b"]
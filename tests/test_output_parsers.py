@@ -0,0 +1,132 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from output_parsers import command_tool, parse_output, parse_result
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def fixture(name: str) -> list:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read().splitlines()
+
+def parse(command: str, name: str):
+    parsed = parse_output(command, fixture(name))
+    assert parsed is not None
+    assert parsed.raw_lines == len(fixture(name))
+    return parsed
+
+@pytest.mark.parametrize("command, tool", [
+    ("nmap -sV 10.0.0.1", "nmap"),
+    ("sudo nmap -sS 10.0.0.1", "nmap"),
+    ("timeout 30 dig example.com", "dig"),
+    ("nmap 10.0.0.1 | grep open", None),
+    ("dig a.com && dig b.com", "dig"),
+    ("dig a.com; whois a.com", None),
+])
+def test_command_tool(command, tool):
+    assert command_tool(command) == tool
+
+def test_unknown_tools_are_not_parsed():
+    assert parse_output("cat nmap.txt", fixture("nmap.txt")) is None
+
+def test_nmap_text():
+    parsed = parse("nmap -sV 192.168.1.0/24", "nmap.txt")
+    lines = parsed.text.splitlines()
+    assert parsed.tool == "nmap"
+    assert lines[0] == "nmap: 256 IP addresses (3 hosts up) scanned in 12.34 seconds"
+    assert lines[1].split() == ["PORT", "STATE", "SERVICE", "VERSION", "HOSTS"]
+    assert lines[2].startswith("22/tcp") and lines[2].endswith("3")
+    assert "443/tcp  filtered  https" in parsed.text
+    # Hosts sharing a port set are listed together, and every host keeps its ports
+    assert "- 22/tcp (2 hosts): 192.168.1.10, 192.168.1.11" in lines
+    assert "- 22/tcp, 53/tcp, 80/tcp, 443/tcp filtered (1 host): 192.168.1.1 (router.lan, Netgear)" in lines
+    assert "    http-title: Welcome to nginx!" in lines
+    assert parsed.is_short()
+
+def test_nmap_xml():
+    parsed = parse("nmap -sV -oX - 10.0.0.0/30", "nmap.xml")
+    lines = parsed.text.splitlines()
+    assert lines[0].startswith("nmap: Nmap done at")
+    assert "- 22/tcp, 80/tcp (1 host): 10.0.0.1 (gw, X)" in lines
+    assert "    80 http-title: Welcome" in lines
+    assert lines[-1] == "(1 host down)"
+
+@pytest.mark.parametrize("command, name, established, python", [
+    ("ss -tanp", "ss.txt", "ESTAB", "python3"),
+    ("netstat -tanp", "netstat.txt", "ESTABLISHED", "python"),
+])
+def test_sockets(command, name, established, python):
+    parsed = parse(command, name)
+    lines = parsed.text.splitlines()
+    assert lines[0] == f"{command.split()[0]}: 3 listening sockets, 2 connections ({established} 2)"
+    listening = lines[lines.index("Listening:") + 2:lines.index("Connections:")]
+    assert [line.split()[:3] for line in listening] == [["tcp", "2024", "-"], ["tcp", "18555", python], ["tcp", "48271", "nginx"]]
+    connections = lines[lines.index("Connections:") + 2:]
+    assert [line.split() for line in connections] == [
+        [established, "51048", "127.0.0.1", "curl", "1"],
+        [established, "48271", "127.0.0.1", "nginx", "1"],
+    ]
+
+def test_dig():
+    parsed = parse("dig example.com ANY", "dig.txt")
+    lines = parsed.text.splitlines()
+    assert lines[0].startswith("dig: status NOERROR; Query time: 20 msec")
+    rows = [line.split(None, 3) for line in lines[3:]]
+    assert rows == [
+        ["example.com.", "A", "200", "93.184.216.34, 93.184.216.35"],
+        ["example.com.", "NS", "86400", "a.iana-servers.net., b.iana-servers.net."],
+        ["example.com.", "TXT", "3600", '"v=spf1 -all"'],
+    ]
+
+def test_whois():
+    parsed = parse("whois example.com", "whois.txt")
+    lines = parsed.text.splitlines()
+    assert lines[0] == "whois: 9 fields (12 comment, notice, redacted or duplicate lines dropped)"
+    assert "Domain Status: clientDeleteProhibited, clientTransferProhibited" in lines
+    assert "Name Server: A.IANA-SERVERS.NET, B.IANA-SERVERS.NET" in lines
+    assert "REDACTED" not in parsed.text
+    assert "TERMS OF USE" not in parsed.text
+
+def test_tshark_fields():
+    parsed = parse("tshark -r capture.pcap -T fields -e ip.src -e ip.dst -e tcp.dstport", "tshark_fields.txt")
+    lines = parsed.text.splitlines()
+    assert lines[0] == "tshark: 48 packets, 3 distinct rows"
+    assert lines[1].split() == ["COUNT", "ip.src", "ip.dst", "tcp.dstport"]
+    assert [line.split() for line in lines[2:]] == [
+        ["30", "10.0.0.5", "10.0.0.2", "443"],
+        ["12", "10.0.0.7", "10.0.0.2", "80"],
+        ["6", "10.0.0.5", "8.8.8.8", "53"],
+    ]
+
+def test_tshark_packet_summaries():
+    parsed = parse("tshark -r capture.pcap", "tshark.txt")
+    lines = parsed.text.splitlines()
+    assert lines[0] == "tshark: 40 packets in 3 conversations (source, destination, protocol)"
+    assert [line.split() for line in lines[2:]] == [
+        ["10.0.0.5", "10.0.0.2", "TCP", "20", "1320"],
+        ["10.0.0.2", "10.0.0.5", "TLSv1.3", "10", "15140"],
+        ["10.0.0.5", "8.8.8.8", "DNS", "10", "740"],
+    ]
+
+def test_output_that_would_grow_is_not_parsed():
+    assert parse_output("tshark -r capture.pcap", fixture("tshark.txt")[:2]) is None
+
+def test_plan_steps_are_parsed_one_by_one():
+    def step_result(name, exit_code=0):
+        lines = fixture(name) if name else ["hello", "hello", "world"]
+        return SimpleNamespace(exit_code=exit_code, line_count=len(lines), iter_output_lines=lambda: iter(lines))
+
+    steps = [SimpleNamespace(id="dns", command="dig example.com ANY"), SimpleNamespace(id="echo", command="echo hello"),
+             SimpleNamespace(id="later", command="whois example.com")]
+    result = SimpleNamespace(steps=steps, results={"dns": step_result("dig.txt"), "echo": step_result(None)})
+    parsed = parse_result(result)
+    lines = parsed.text.splitlines()
+    assert parsed.tool == "dig"
+    assert lines[0] == "plan: 3 steps"
+    assert lines[1] == "### Step dns (exit code 0): dig example.com ANY"
+    assert lines[2].startswith("dig: status NOERROR")
+    # Steps without a parser keep their compacted raw output
+    assert lines[-4:] == ["### Step echo (exit code 0): echo hello", "hello  [repeated 2 times]", "world",
+                          "### Step later was skipped: whois example.com"]
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from plan_executor import MAX_PLAN_STEPS, PlanStep, execute_plan, parse_plan
+
+def plan(*steps) -> str:
+    return "<plan>" + json.dumps(list(steps)) + "</plan>"
+
+def step(step_id: str, command: str, *depends_on) -> dict:
+    return {"id": step_id, "command": command, "depends_on": list(depends_on)}
+
+def test_a_single_command_is_not_a_plan():
+    assert parse_plan("ls -la") is None
+
+def test_parses_steps_in_order():
+    steps = parse_plan(plan(step("a", "true"), step("b", "true", "a")) + "\ntrailing text")
+    assert steps == [PlanStep("a", "true", []), PlanStep("b", "true", ["a"])]
+
+def test_accepts_an_object_with_steps_and_a_single_dependency():
+    steps = parse_plan('<plan>{"steps": [{"command": "true"}, {"command": "true", "depends_on": "1"}]}</plan>')
+    assert [(s.id, s.depends_on) for s in steps] == [("1", []), ("2", ["1"])]
+
+@pytest.mark.parametrize("command, message", [
+    (plan(step("a", "true", "b"), step("b", "true", "a")), "form a cycle"),
+    (plan(step("a", "true", "a")), "form a cycle"),
+    (plan(step("a", "true", "missing")), "unknown steps: missing"),
+    (plan(step("a", "true"), step("a", "false")), "duplicate step ids: a"),
+    (plan(step("a", "  ")), "step 1 has no command"),
+    (plan(), "non-empty JSON array"),
+    ("<plan>[{</plan>", "not valid JSON"),
+    (plan(*(step(str(i), "true") for i in range(MAX_PLAN_STEPS + 1))), f"at most {MAX_PLAN_STEPS}"),
+])
+def test_rejects_invalid_plans(command, message):
+    with pytest.raises(ValueError, match=message):
+        parse_plan(command)
+
+def test_failed_step_skips_its_dependents_only():
+    steps = parse_plan(plan(
+        step("bad", "false"),
+        step("after_bad", "true", "bad"),
+        step("transitive", "true", "after_bad"),
+        step("good", "echo ok"),
+        step("after_good", "true", "good"),
+    ))
+    result = asyncio.run(execute_plan(steps))
+    try:
+        assert not result.succeeded
+        assert result.exit_code == 1
+        assert set(result.results) == {"bad", "good", "after_good"}
+        assert result.skipped == {"after_bad": "step bad did not succeed", "transitive": "step after_bad did not succeed"}
+        assert "### Step transitive was skipped (step after_bad did not succeed): true" in list(result.iter_output_lines())
+        assert "Plan step bad failed." in result.describe_failure()
+        assert "Steps that succeeded: good, after_good." in result.describe_failure()
+    finally:
+        result.cleanup()
+
+def test_independent_steps_run_concurrently():
+    steps = parse_plan(plan(step("a", "sleep 0.5"), step("b", "sleep 0.5"), step("c", "sleep 0.5")))
+    start = time.monotonic()
+    result = asyncio.run(execute_plan(steps, max_parallel=3))
+    try:
+        assert result.succeeded
+        assert time.monotonic() - start < 1.2
+    finally:
+        result.cleanup()
+
+def test_dependent_steps_wait_for_each_other():
+    finished = []
+    steps = parse_plan(plan(step("slow", "sleep 0.3"), step("next", "true", "slow")))
+    result = asyncio.run(execute_plan(steps, on_step_done=lambda s, r: finished.append(s.id)))
+    try:
+        assert result.succeeded
+        assert finished == ["slow", "next"]
+    finally:
+        result.cleanup()
@@ -0,0 +1,38 @@
+import asyncio
+import os
+import sys
+
+from platform_utils import MAX_LINE_LENGTH, stream_command_on_host
+
+def run(command: str):
+    return asyncio.run(stream_command_on_host(command, timeout=30))
+
+def test_overlong_line_is_truncated_in_memory_but_spooled_in_full():
+    size = 3 * 1024 * 1024
+    script = f"import sys; sys.stdout.write('x' * {size} + '\\\\nnext\\\\n' + 'y' * {size})"
+    result = run(f'"{sys.executable}" -c "{script}"')
+    try:
+        assert result.exit_code == 0
+        assert list(result.stdout_tail) == ["x" * MAX_LINE_LENGTH, "next", "y" * MAX_LINE_LENGTH]
+        assert result.line_count == 3
+        assert result.byte_count == 2 * size + len("\nnext\n")
+        assert os.path.getsize(result.spool_path) == result.byte_count
+    finally:
+        result.cleanup()
+
+def test_short_lines_are_unchanged():
+    result = run("printf 'a\\nb\\nc'")
+    try:
+        assert list(result.stdout_tail) == ["a", "b", "c"]
+        assert result.line_count == 3
+    finally:
+        result.cleanup()
+
+def test_lines_split_across_reads_are_joined():
+    script = "import sys; sys.stdout.write(('z' * 3000 + '\\\\n') * 200)"
+    result = run(f'"{sys.executable}" -c "{script}"')
+    try:
+        assert result.line_count == 200
+        assert all(line == "z" * 3000 for line in result.stdout_tail)
+    finally:
+        result.cleanup()
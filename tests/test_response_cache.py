@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from artifact_store import ArtifactStore
+from llm_client import LLMClient
+from main import process_request
+from mock_llm_server import MockLLMServer
+from response_cache import ResponseCache, cache_key, is_follow_up
+from session_memory import SessionMemory
+from tool_discovery import ToolCatalog
+
+@pytest.mark.parametrize("request_text, follow_up", [
+    ("list the open ports on 10.0.0.1", False),
+    ("Show disk usage.", False),
+    ("scan it again", True),
+    ("what does that output mean?", True),
+    ("再扫描一次", True),
+    ("查看磁盘使用情况", False),
+])
+def test_is_follow_up(request_text, follow_up):
+    assert is_follow_up(request_text) == follow_up
+
+def test_history_only_keys_follow_ups():
+    key = lambda request, history: cache_key(request, "[]", "Linux", "mock", history=history)
+    assert key("show disk usage", "Request: whoami") == key("show disk usage", "Request: uptime")
+    assert key("run it again", "Request: whoami") != key("run it again", "Request: uptime")
+
+def run_requests(tmp_path, requests: list, **options) -> ResponseCache:
+    response_cache = ResponseCache(path=str(tmp_path / "response_cache.json"))
+    with MockLLMServer(latency=0, command="echo hello") as server:
+        llm_client = LLMClient({"name": "mock", "url": server.url, "api_key": None, "model_name": "mock"}, pool_size=1)
+
+        async def run():
+            for request in requests:
+                result = await process_request(request, ToolCatalog(""), llm_client, streaming=False, response_cache=response_cache, **options)
+                result.cleanup()
+
+        asyncio.run(run())
+    return response_cache
+
+def test_repeated_request_hits_the_cache_with_session_memory(tmp_path):
+    response_cache = run_requests(tmp_path, ["say hello"] * 3, session_memory=SessionMemory())
+    assert (response_cache.hits, response_cache.misses) == (2, 1)
+    assert len(response_cache._entries) == 1
+
+def test_repeated_request_hits_the_cache_with_stored_output(tmp_path):
+    artifact_store = ArtifactStore()
+    try:
+        response_cache = run_requests(tmp_path, ["say hello"] * 3, session_memory=SessionMemory(), artifact_store=artifact_store)
+        # Later runs are sent the earlier output as references, which must not change the key
+        assert artifact_store.stats()["artifacts"] == 3
+    finally:
+        artifact_store.close()
+    assert (response_cache.hits, response_cache.misses) == (2, 1)
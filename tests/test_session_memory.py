@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+from session_memory import SessionMemory
+
+def command_result(output: str, exit_code: int = 0):
+    return SimpleNamespace(exit_code=exit_code, output=output, line_count=len(output.splitlines()))
+
+def test_summary_reaches_the_digest_without_verbatim_turns():
+    memory = SessionMemory(recent_turns=0)
+    turn = memory.record("scan the router", "nmap 192.168.1.1", command_result("22/tcp open ssh"))
+    turn["summary"] = "Only SSH is open. Nothing else answered."
+    history = memory.render()
+    assert "- scan the router -> `nmap 192.168.1.1` (exit code 0): Only SSH is open" in history
+    assert "Nothing else answered" not in history
+    assert "22/tcp" not in history
+
+def test_late_summary_rewrites_the_compacted_line():
+    memory = SessionMemory(recent_turns=1)
+    first = memory.record("list files", "ls", command_result("a\nb"))
+    memory.record("show disk usage", "df -h", command_result("/dev/sda1 50%"))
+    assert "- list files -> `ls` (exit code 0)\n" in memory.render()
+    # A background summary of the first turn arrives after it was compacted
+    first["summary"] = "Two files, a and b."
+    assert "- list files -> `ls` (exit code 0): Two files, a and b" in memory.render()
+    assert memory.stats()["compacted_turns"] == 1
+
+def test_recent_turns_are_verbatim():
+    memory = SessionMemory(recent_turns=2)
+    memory.record("who am i", "whoami", command_result("root"))
+    history = memory.render()
+    assert "Most recent requests in this session:" in history
+    assert "Command: whoami" in history
+    assert "Output:\nroot" in history
+
+def test_digest_is_trimmed_in_one_batch_when_over_budget():
+    memory = SessionMemory(recent_turns=1, token_budget=200)
+    for i in range(40):
+        turn = memory.record(f"request number {i}", f"echo {i}", command_result(str(i)))
+        turn["summary"] = f"Printed {i}."
+        memory.render()
+        stats = memory.stats()
+        assert stats["digest_tokens"] <= memory.token_budget
+        assert stats["compacted_turns"] == i
+    stats = memory.stats()
+    assert stats["dropped_turns"] > 0
+    assert stats["compacted_turns"] == 39
+    history = memory.render()
+    assert f"{stats['dropped_turns']} older ones omitted" in history
+    assert "request number 0 " not in history
+    assert "- request number 38 -> `echo 38` (exit code 0): Printed 38." in history
+    assert "Request: request number 39" in history
+
+def test_trimming_drops_down_to_three_quarters_of_the_budget():
+    memory = SessionMemory(recent_turns=0, token_budget=100)
+    digests = []
+    for i in range(30):
+        memory.record(f"request {i}", "true", command_result(""))
+        digests.append(memory.stats()["digest_tokens"])
+    # After a trim there is room for several turns before the next one, so the digest
+    # (and the prompt prefix) is not rewritten on every turn
+    trims = [i for i in range(1, len(digests)) if digests[i] < digests[i - 1]]
+    assert trims
+    assert all(b - a > 1 for a, b in zip(trims, trims[1:]))
+    assert all(digests[i] <= 75 for i in trims)
+
+def test_clear_forgets_everything():
+    memory = SessionMemory(recent_turns=1, token_budget=100)
+    for i in range(5):
+        memory.record(f"request {i}", "true", command_result(""))
+    memory.clear()
+    assert memory.render() == ""
+    assert memory.stats()["compacted_turns"] == 0
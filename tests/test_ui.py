@@ -0,0 +1,11 @@
+from ui import console, print_error, print_summary, print_thought_process
+
+def test_model_and_command_text_is_not_markup():
+    with console.capture() as capture:
+        print_error("grep: Unmatched [/x]")
+        print_summary("Use [bold]nmap[/bold] or [/x].")
+        print_thought_process("The pattern [/x] is invalid.")
+    output = capture.get()
+    assert "Error: grep: Unmatched [/x]" in output
+    assert "Use [bold]nmap[/bold] or [/x]." in output
+    assert "The pattern [/x] is invalid." in output
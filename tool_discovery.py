@@ -1,5 +1,10 @@
+import asyncio
 import json
-from platform_utils import get_os_type, run_command_on_host
+import os
+import re
+import shlex
+from platform_utils import get_os_type, run_command_on_host_async, on_toolset_changed, file_mtime
+from telemetry import telemetry
 
 # A curated list of common and high-value tools to look for.
 # This strikes a balance between full dynamic discovery and practicality.
@@ -10,52 +15,241 @@ CORE_TOOLS = [
     "brew", "apt-get", "apt-cache", "dpkg"
 ]
 
-async def discover_tools_on_host():
+# Tools whose name is not the name of the binary that provides them.
+TOOL_BINARIES = {
+    "metasploit": "msfconsole",
+}
+
+# Optional file with additional tools to look for. It holds a JSON list whose
+# entries are either tool names or {"tool_name": ..., "description": ...} objects.
+EXTRA_TOOLS_FILE = "tools.json"
+
+# Discovered definitions are cached here and reused while the signature matches.
+TOOL_CACHE_FILE = "tool_cache.json"
+
+# Files and directories whose modification time changes when packages are installed or removed.
+PACKAGE_DB_PATHS = {
+    "linux": ["/var/lib/dpkg/status"],
+    "macos": ["/opt/homebrew/Cellar", "/usr/local/Cellar"],
+}
+
+def _cache_signature(os_type: str) -> dict:
+    """
+    Builds the cheap change signals the tool cache is keyed on.
+    """
+    path = os.environ.get("PATH", "")
+    return {
+        "os_type": os_type,
+        "path": path,
+        "path_mtimes": [file_mtime(directory) for directory in path.split(os.pathsep) if directory],
+        "package_db_mtimes": [file_mtime(db_path) for db_path in PACKAGE_DB_PATHS.get(os_type, [])],
+        "extra_tools_mtime": file_mtime(EXTRA_TOOLS_FILE),
+        "core_tools": CORE_TOOLS,
+    }
+
+def _load_cached_tools(signature: dict):
+    """
+    Returns the cached tool definitions if they were discovered under the same signature.
+    """
+    try:
+        with open(TOOL_CACHE_FILE, 'r') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if cache.get("signature") != signature:
+        return None
+    return cache.get("definitions")
+
+def _save_cached_tools(signature: dict, definitions: list):
+    try:
+        with open(TOOL_CACHE_FILE, 'w') as f:
+            json.dump({"signature": signature, "definitions": definitions}, f, indent=4)
+    except OSError:
+        pass
+
+def invalidate_tool_cache():
+    """
+    Discards the cached tool definitions so the next discovery rescans the host.
+    """
+    try:
+        os.remove(TOOL_CACHE_FILE)
+    except FileNotFoundError:
+        pass
+
+# Packages installed or removed by the agent change the toolset.
+on_toolset_changed(invalidate_tool_cache)
+
+def scan_path(path: str = None) -> dict:
+    """
+    Indexes the executables on PATH with a single pass over its directories.
+
+    :param path: The PATH string to scan; defaults to the current environment's PATH.
+    :return: A dictionary mapping each binary name to its full path. Earlier PATH entries win.
+    """
+    if path is None:
+        path = os.environ.get("PATH", "")
+    binaries = {}
+    for directory in path.split(os.pathsep):
+        if not directory:
+            continue
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name not in binaries:
+                        binaries[entry.name] = entry.path
+        except OSError:
+            continue
+    return binaries
+
+def load_tool_list() -> list:
+    """
+    Returns the tools to look for: CORE_TOOLS plus the entries of EXTRA_TOOLS_FILE.
+
+    :return: A list of (tool_name, description) tuples; description is None unless configured.
+    """
+    tools = [(tool, None) for tool in CORE_TOOLS]
+    try:
+        with open(EXTRA_TOOLS_FILE, 'r') as f:
+            extra_tools = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        extra_tools = []
+
+    for entry in extra_tools:
+        if isinstance(entry, str):
+            tools.append((entry, None))
+        elif isinstance(entry, dict) and entry.get("tool_name"):
+            tools.append((entry["tool_name"], entry.get("description")))
+    return tools
+
+def _is_executable(path: str) -> bool:
+    return os.path.isfile(path) and os.access(path, os.X_OK)
+
+async def _describe_binaries(binaries: list) -> dict:
+    """
+    Looks up the man page descriptions of several binaries with one `whatis` call.
+
+    :param binaries: The binary names to describe.
+    :return: A dictionary mapping binary names to their `whatis` line.
+    """
+    if not binaries:
+        return {}
+    try:
+        output = await run_command_on_host_async(
+            "whatis " + " ".join(shlex.quote(binary) for binary in binaries) + " 2>/dev/null",
+            check_output=False  # whatis exits non-zero when any name is unknown
+        )
+    except (RuntimeError, OSError):
+        return {}
+
+    wanted = set(binaries)
+    descriptions = {}
+    for line in output.splitlines():
+        line = re.sub(r"\s+", " ", line).strip()
+        if not line or "nothing appropriate" in line:
+            continue
+        # e.g. "nmap (1) - Network exploration tool" or "dig(1), host(1) - DNS lookup utility"
+        names = line.split(" - ", 1)[0]
+        for name in re.split(r",\s*", names):
+            name = re.sub(r"\s*\(.*\)$", "", name).strip()
+            if name in wanted and name not in descriptions:
+                descriptions[name] = line
+    return descriptions
+
+async def discover_tools_on_host(verbose: bool = True, use_cache: bool = True):
     """
     Discovers available tools on the host system and gets their descriptions.
 
+    Tools are resolved by binary name on PATH, so tools installed outside the
+    package manager (or under a different package name) are found too. The
+    result is cached on disk and reused until PATH, the package database or
+    the tool list changes.
+
+    :param verbose: If True, progress messages are printed.
+    :param use_cache: If False, the cache is ignored and the host is rescanned.
     :return: A JSON string of tool definitions for the LLM.
     """
-    print("Starting tool discovery on host system...")
-    definitions = []
-    os_type = get_os_type()
+    with telemetry.span("discovery") as span:
+        signature = _cache_signature(get_os_type())
+        if use_cache:
+            definitions = _load_cached_tools(signature)
+            if definitions is not None:
+                if verbose:
+                    print(f"Loaded {len(definitions)} tools from the discovery cache.")
+                span.update(cached=True, tools=len(definitions))
+                return json.dumps(definitions, indent=4)
 
-    if os_type == "macos":
-        # For macOS, use `brew list` to find installed packages
-        try:
-            installed_packages = run_command_on_host("brew list").splitlines()
-            for tool in CORE_TOOLS:
-                if tool in installed_packages:
-                    # Attempt to get a short description using `man -f` or `whatis`
-                    try:
-                        description = run_command_on_host(f"whatis {tool} 2>/dev/null").splitlines()[0].strip()
-                        if description and "nothing appropriate" not in description:
-                            definitions.append({"tool_name": tool, "description": description})
-                        else:
-                            definitions.append({"tool_name": tool, "description": f"A common command-line tool for {tool}."})
-                    except Exception:
-                        definitions.append({"tool_name": tool, "description": f"A common command-line tool for {tool}."})
-        except RuntimeError as e:
-            print(f"Error discovering tools with brew: {e}")
-
-    elif os_type == "linux":
-        # For Linux, use `dpkg -l` or `apt list --installed`
-        try:
-            installed_packages_output = run_command_on_host("dpkg -l | grep '^ii' | awk '{print $2}'").splitlines()
-            installed_packages = [pkg.split(':')[0] for pkg in installed_packages_output]
-
-            for tool in CORE_TOOLS:
-                if tool in installed_packages:
-                    try:
-                        description = run_command_on_host(f"whatis {tool} 2>/dev/null").splitlines()[0].strip()
-                        if description and "nothing appropriate" not in description:
-                            definitions.append({"tool_name": tool, "description": description})
-                        else:
-                            definitions.append({"tool_name": tool, "description": f"A common command-line tool for {tool}."})
-                    except Exception:
-                        definitions.append({"tool_name": tool, "description": f"A common command-line tool for {tool}."})
-        except RuntimeError as e:
-            print(f"Error discovering tools with dpkg: {e}")
-
-    print(f"Discovery complete. Found {len(definitions)} tools.")
-    return json.dumps(definitions, indent=4)
\ No newline at end of file
+        if verbose:
+            print("Starting tool discovery on host system...")
+
+        path_index = scan_path()
+        found = []
+        seen_binaries = set()
+        for tool, description in load_tool_list():
+            binary = TOOL_BINARIES.get(tool, tool)
+            if binary in seen_binaries:
+                continue
+            binary_path = path_index.get(binary)
+            if binary_path and _is_executable(binary_path):
+                seen_binaries.add(binary)
+                found.append((tool, binary, description))
+
+        descriptions = await _describe_binaries([binary for _, binary, description in found if not description])
+
+        definitions = []
+        for tool, binary, description in found:
+            description = description or descriptions.get(binary) or f"A common command-line tool for {tool}."
+            definitions.append({"tool_name": tool, "description": description})
+
+        _save_cached_tools(signature, definitions)
+        span.update(cached=False, tools=len(definitions))
+        if verbose:
+            print(f"Discovery complete. Found {len(definitions)} tools.")
+        return json.dumps(definitions, indent=4)
+
+class ToolCatalog:
+    """
+    Holds the tool definitions used by the agent and refreshes them in the background.
+
+    A refresh runs as an asyncio task, so the agent keeps serving requests with
+    the previous definitions until the new ones are ready.
+    """
+
+    def __init__(self, definitions: str = None):
+        """
+        :param definitions: The initial tool definitions; without them the catalog is empty until the first refresh finishes.
+        """
+        self.definitions = definitions if definitions is not None else "[]"
+        self.loaded = definitions is not None
+        self._refresh_task = None
+
+    @property
+    def loading(self) -> bool:
+        """True while the first discovery run is still in progress."""
+        return not self.loaded and self._refresh_task is not None and not self._refresh_task.done()
+
+    def refresh(self, verbose: bool = False) -> asyncio.Task:
+        """
+        Starts a background discovery run unless one is already in progress.
+
+        :param verbose: If True, discovery progress messages are printed.
+        :return: The discovery task.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(discover_tools_on_host(verbose=verbose))
+            self._refresh_task.add_done_callback(self._apply_refresh)
+        return self._refresh_task
+
+    async def wait(self) -> str:
+        """
+        Waits for a pending refresh to finish.
+
+        :return: The current tool definitions.
+        """
+        if self._refresh_task is not None and not self._refresh_task.done():
+            await asyncio.shield(self._refresh_task)
+        return self.definitions
+
+    def _apply_refresh(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is None:
+            self.definitions = task.result()
+            self.loaded = True
\ No newline at end of file
@@ -0,0 +1,126 @@
+import json
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+
+TOP_K_TOOLS = 8 # Tools described in full in each prompt
+MAX_OTHER_TOOL_NAMES = 100 # Remaining tools are listed by name only, up to this many
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "me",
+    "my", "of", "on", "or", "please", "the", "this", "to", "tool", "utility", "with",
+}
+
+def _normalize(term: str) -> str:
+    """Applies a very light stemming so that e.g. "ports" matches "port"."""
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        return term[:-1]
+    return term
+
+def tokenize(text: str) -> list:
+    """
+    Splits text into lowercase search terms.
+
+    Hyphenated names are indexed both whole and by their parts, so "aircrack-ng"
+    matches "aircrack-ng" as well as "aircrack". Numbers and stop words are ignored.
+    """
+    tokens = []
+    for word in re.findall(r"[\w\-.]+", text.lower()):
+        word = word.strip("-.")
+        parts = re.split(r"[\-.]", word)
+        if len(parts) > 1:
+            parts.insert(0, word)
+        for part in parts:
+            if part and not part.isdigit() and part not in STOP_WORDS:
+                tokens.append(_normalize(part))
+    return tokens
+
+class ToolIndex:
+    """
+    A small BM25 index over tool definitions.
+
+    The tool name is weighted above its description, since users often name
+    the tool they want directly.
+    """
+
+    def __init__(self, definitions: list):
+        """
+        :param definitions: A list of {"tool_name": ..., "description": ...} dictionaries.
+        """
+        self.definitions = definitions
+        self._term_counts = []
+        document_frequency = Counter()
+        for tool in definitions:
+            name_tokens = tokenize(tool["tool_name"])
+            terms = Counter(tokenize(tool.get("description", "")) + name_tokens * 3)
+            self._term_counts.append(terms)
+            document_frequency.update(terms.keys())
+
+        self._lengths = [sum(terms.values()) for terms in self._term_counts]
+        self._average_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0
+        count = len(definitions)
+        self._idf = {
+            term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def search(self, query: str, k: int = TOP_K_TOOLS) -> list:
+        """
+        Returns the definitions most relevant to a query.
+
+        :param query: The user's request (and any retry context).
+        :param k: The maximum number of definitions to return.
+        :return: Up to `k` definitions with a positive score, best first.
+        """
+        query_terms = set(tokenize(query))
+        scored = []
+        for position, terms in enumerate(self._term_counts):
+            score = 0.0
+            for term in query_terms:
+                frequency = terms.get(term)
+                if not frequency:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[position] / self._average_length)
+                score += self._idf[term] * frequency * (BM25_K1 + 1) / (frequency + norm)
+            if score > 0:
+                scored.append((score, position))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [self.definitions[position] for _, position in scored[:k]]
+
+@lru_cache(maxsize=8)
+def _index_for(tool_definitions: str) -> ToolIndex:
+    """Builds (once per catalog) the index for a JSON string of tool definitions."""
+    try:
+        definitions = json.loads(tool_definitions) if tool_definitions else []
+    except json.JSONDecodeError:
+        definitions = []
+    return ToolIndex(definitions)
+
+def format_tool_catalog(tool_definitions: str, query: str, k: int = TOP_K_TOOLS) -> str:
+    """
+    Serializes the tools relevant to a request compactly for the prompt.
+
+    The top-k matching tools are listed with their descriptions, one per line;
+    the remaining tools are only named so the prompt stays small as the catalog grows.
+
+    :param tool_definitions: A JSON string of tool definitions.
+    :param query: The user's request (and any retry context).
+    :param k: How many tools are described in full.
+    :return: The catalog text.
+    """
+    index = _index_for(tool_definitions)
+    relevant = index.search(query, k)
+    lines = [f"- {tool['tool_name']}: {tool.get('description', '')}" for tool in relevant]
+
+    relevant_names = {tool["tool_name"] for tool in relevant}
+    other_names = [tool["tool_name"] for tool in index.definitions if tool["tool_name"] not in relevant_names]
+    if other_names:
+        listed = other_names[:MAX_OTHER_TOOL_NAMES]
+        more = len(other_names) - len(listed)
+        lines.append("Also installed: " + ", ".join(listed) + (f" (and {more} more)" if more else ""))
+    return "\n".join(lines) if lines else "(none discovered)"
@@ -1,10 +1,22 @@
+import os
+import shlex
+import shutil
+import subprocess
+import time
+from collections import deque
 from rich.console import Console
+from rich.live import Live
+from rich.markup import escape
 from rich.panel import Panel
 from rich.prompt import Prompt, IntPrompt
-from rich.syntax import Syntax
+from rich.spinner import Spinner
 from rich.table import Table
+from rich.text import Text
+from async_utils import run_in_thread
 
 console = Console()
+# Progress and diagnostics in batch mode go to stderr so stdout carries only results
+err_console = Console(stderr=True)
 
 def print_welcome():
     """Displays a welcome message."""
@@ -31,55 +43,495 @@ def get_llm_config_from_user():
     }
 
 def choose_llm_config(configs):
-    """Allows the user to choose from existing LLM configurations."""
+    """
+    Allows the user to choose from existing LLM configurations.
+
+    With more than one configuration, index 0 routes across all of them.
+
+    :return: The chosen configuration, or None to route across all configurations.
+    """
     table = Table(title="Available LLM Configurations")
     table.add_column("Index", style="cyan")
     table.add_column("Name", style="magenta")
     table.add_column("URL", style="green")
     table.add_column("Model", style="yellow")
 
+    choices = [str(i+1) for i in range(len(configs))]
+    if len(configs) > 1:
+        table.add_row("0", "All", "(fastest healthy endpoint, with failover)", "")
+        choices.insert(0, "0")
     for i, config in enumerate(configs):
         table.add_row(str(i + 1), config['name'], config['url'], config['model_name'])
     
     console.print(table)
-    choice = IntPrompt.ask("Choose a configuration to use for this session", choices=[str(i+1) for i in range(len(configs))])
-    return configs[choice - 1]
+    choice = IntPrompt.ask("Choose a configuration to use for this session", choices=choices)
+    return configs[choice - 1] if choice else None
 
-def print_thought_process(thought):
-    """Displays the LLM's thought process in a panel."""
-    console.print(
-        Panel(
-            thought,
-            title="[bold yellow]:brain: LLM Thought Process[/bold yellow]",
-            border_style="yellow",
-            expand=False
+def print_backend_stats(backend_stats):
+    """Prints the routing statistics of each LLM backend."""
+    table = Table(title="LLM Backends")
+    table.add_column("Name", style="magenta")
+    table.add_column("Model", style="yellow")
+    table.add_column("Status")
+    table.add_column("Latency (stream / complete)", style="cyan")
+    table.add_column("Requests", justify="right")
+    table.add_column("Errors", justify="right")
+    table.add_column("Hedges won", justify="right")
+
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else "-"
+
+    for backend in backend_stats:
+        status = "[green]healthy[/green]" if backend["healthy"] else "[red]cooling down[/red]"
+        latency = f"{seconds(backend['latency'].get('stream'))} / {seconds(backend['latency'].get('complete'))}"
+        table.add_row(backend["name"], backend["model_name"], status, latency,
+                      str(backend["requests"]), f"{backend['errors']} ({backend['error_rate']:.0%})", str(backend["hedges_won"]))
+    console.print(table)
+
+def print_installed_tools(tools):
+    """Prints the packages installed by the agent with their metadata."""
+    table = Table(title="Tools installed by Agent")
+    table.add_column("Name", style="cyan")
+    table.add_column("Version", style="yellow")
+    table.add_column("Size", justify="right")
+    table.add_column("Installed", style="green")
+
+    for name, details in tools.items():
+        size = details.get("size_bytes")
+        installed_at = details.get("installed_at")
+        table.add_row(
+            name,
+            details.get("version") or "-",
+            f"{size / (1024 * 1024):.1f} MB" if size else "-",
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(installed_at)) if installed_at else "-"
         )
+    console.print(table)
+
+def print_stats(stats):
+    """Prints the session's per-stage latencies and token usage."""
+    table = Table(title="Session Statistics")
+    table.add_column("Stage", style="magenta")
+    table.add_column("Count", justify="right")
+    table.add_column("Mean", justify="right", style="cyan")
+    table.add_column("p50", justify="right", style="cyan")
+    table.add_column("p95", justify="right", style="cyan")
+    table.add_column("Max", justify="right", style="cyan")
+    table.add_column("Total", justify="right", style="green")
+
+    for stage in ("turn", "llm", "execute", "step", "install", "recall", "archive", "parse", "summary", "discovery", "warmup"):
+        if stage in stats["stages"]:
+            timing = stats["stages"][stage]
+            table.add_row(stage, str(timing["count"]), *(f"{timing[key]:.2f}s" for key in ("mean", "p50", "p95", "max", "total")))
+    console.print(table)
+
+    tokens = stats["tokens"]
+    console.print(f"[bold green]Turns:[/bold green] {stats['turns']}  "
+                  f"[bold green]LLM requests:[/bold green] {stats['llm_requests']}  "
+                  f"[bold green]Tokens:[/bold green] {tokens['prompt_tokens']} prompt / {tokens['completion_tokens']} completion")
+
+def print_startup_profile(rows, user_wait):
+    """
+    Prints how long each startup phase took.
+
+    :param rows: (phase, milliseconds since start, milliseconds since the previous phase) tuples.
+    :param user_wait: Seconds spent waiting for the user, which are excluded from the timings.
+    """
+    table = Table(title="Startup Profile")
+    table.add_column("Phase", style="magenta")
+    table.add_column("At", justify="right", style="cyan")
+    table.add_column("Took", justify="right", style="green")
+    for phase, offset, duration in rows:
+        table.add_row(phase, f"{offset:.1f} ms", f"{duration:.1f} ms")
+    console.print(table)
+    console.print(f"[dim](excluding {user_wait * 1000:.0f} ms waiting for input; interpreter start-up before main.py is not included)[/dim]")
+
+def print_startup_event(phase, offset):
+    """Reports a background startup phase that finished after the first prompt was shown."""
+    waiting_prompt = _prompt_state["message"]
+    if waiting_prompt is not None:
+        console.print()
+    console.print(f"[dim](startup: {phase} finished at {offset * 1000:.1f} ms)[/dim]")
+    if waiting_prompt is not None:
+        console.print(f"{waiting_prompt}: ", end="")
+
+def print_session_memory(history, stats):
+    """Prints the session history sent with each request and its size."""
+    if not history:
+        console.print("[bold yellow]The session history is empty.[/bold yellow]")
+        return
+    console.print(Panel(Text(history.strip()), title="[bold blue]Session History[/bold blue]", border_style="blue", expand=False))
+    console.print(f"[bold green]Verbatim turns:[/bold green] {stats['recent_turns']}  "
+                  f"[bold green]Compacted turns:[/bold green] {stats['compacted_turns']} ({stats['dropped_turns']} dropped)  "
+                  f"[bold green]Size:[/bold green] ~{stats['tokens']} tokens (digest {stats['digest_tokens']} / {stats['token_budget']})")
+
+def _format_size(size_bytes):
+    return f"{size_bytes / (1024 * 1024):.1f} MB" if size_bytes >= 1024 * 1024 else f"{size_bytes / 1024:.1f} KB"
+
+def print_artifacts(artifacts, title):
+    """
+    Prints stored command outputs in a table.
+
+    :param artifacts: Records from `ArtifactStore.search` (with matching lines) or `ArtifactStore.recent`.
+    :param title: The table title.
+    """
+    table = Table(title=title, show_lines=True)
+    table.add_column("ID", style="cyan", justify="right")
+    table.add_column("Run", style="green")
+    table.add_column("Request / Command")
+    table.add_column("Exit", justify="right")
+    table.add_column("Lines", justify="right")
+    show_snippets = any(artifact.get("snippets") for artifact in artifacts)
+    if show_snippets:
+        table.add_column("Matching lines", style="dim")
+
+    for artifact in artifacts:
+        exit_code = artifact["exit_code"]
+        row = [
+            str(artifact["id"]),
+            time.strftime("%m-%d %H:%M", time.localtime(artifact["created"])),
+            Text(f"{artifact['request']}\n", style="bold").append(artifact["command"] or "", style="white"),
+            Text(str(exit_code), style="green" if exit_code == 0 else "red"),
+            str(artifact["line_count"]),
+        ]
+        if show_snippets:
+            row.append(Text("\n".join(f"{line_number}: {line}" for line_number, line in artifact.get("snippets", []))))
+        table.add_row(*row)
+    console.print(table)
+
+def print_artifact_stats(stats):
+    """Prints the size and location of the artifact store."""
+    location = "temporary, deleted at exit" if stats["temporary"] else "kept across sessions"
+    search = "full-text index" if stats["indexed"] else "scan (SQLite without FTS5)"
+    console.print(f"[bold green]Stored outputs:[/bold green] {stats['artifacts']}  "
+                  f"[bold green]Size:[/bold green] {_format_size(stats['stored_bytes'])} compressed "
+                  f"({_format_size(stats['output_chars'])} of output)  "
+                  f"[bold green]Search:[/bold green] {search}  [dim]{escape(stats['path'])} ({location})[/dim]")
+
+def print_artifact(artifact):
+    """Prints the request, command, exit status and summary of a stored output."""
+    lines = Text()
+    lines.append("Request: ", style="bold").append(f"{artifact['request']}\n")
+    lines.append("Command: ", style="bold").append(f"{artifact['command']}\n")
+    lines.append("Run: ", style="bold").append(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(artifact["created"])))
+    lines.append(f", exit code {artifact['exit_code']}, {artifact['line_count']} lines")
+    if artifact["truncated"]:
+        lines.append(" (only the start was stored)", style="yellow")
+    if artifact["stderr"]:
+        lines.append("\nStderr: ", style="bold red").append(artifact["stderr"].strip())
+    console.print(Panel(lines, title=f"[bold blue]Output #{artifact['id']}[/bold blue]", border_style="blue", expand=False))
+    if artifact["summary"]:
+        print_summary(artifact["summary"])
+
+def print_related_artifacts(hits):
+    """Tells the user which stored outputs are sent with the request."""
+    ids = ", ".join(f"#{hit['id']}" for hit in hits)
+    console.print(f"[dim](Earlier output matching this request is sent along: {ids}; 'recall <id>' shows it.)[/dim]")
+
+# The prompt currently waiting for input, so background output can redraw it
+_prompt_state = {"message": None}
+
+async def prompt_async(message, **kwargs):
+    """
+    Asks the user for input without blocking the event loop.
+
+    :param message: The prompt to display.
+    :return: The user's answer.
+    """
+    _prompt_state["message"] = message
+    try:
+        return await run_in_thread(Prompt.ask, message, **kwargs)
+    finally:
+        _prompt_state["message"] = None
+
+def _thought_panel(thought, cached=False):
+    title = "[bold yellow]:brain: LLM Thought Process[/bold yellow]"
+    if cached:
+        title += " [bold magenta](cached)[/bold magenta]"
+    return Panel(
+        Text(thought),
+        title=title,
+        border_style="magenta" if cached else "yellow",
+        expand=False
     )
 
+def print_thought_process(thought, cached=False):
+    """
+    Displays the LLM's thought process in a panel.
+
+    :param cached: If True, the panel is marked as coming from the response cache.
+    """
+    console.print(_thought_panel(thought, cached))
+
+class LiveThoughtProcess:
+    """
+    Shows a spinner until the first thought tokens arrive, then renders the
+    thought process panel incrementally while the LLM is still streaming.
+    """
+
+    def __init__(self, status_message):
+        self._status = console.status(status_message)
+        self._live = None
+        self.rendered = False
+
+    def __enter__(self):
+        self._status.start()
+        return self
+
+    def update(self, thought):
+        """Replaces the panel content with the thought process received so far."""
+        if not thought:
+            return
+        if self._live is None:
+            self._status.stop()
+            self._live = Live(_thought_panel(thought), console=console, refresh_per_second=8, vertical_overflow="visible")
+            self._live.start()
+            self.rendered = True
+        else:
+            self._live.update(_thought_panel(thought))
+
+    def __exit__(self, exc_type, exc, tb):
+        self._status.stop()
+        if self._live is not None:
+            self._live.stop()
+        return False
+
+# Limits for drawing command output inline; `show output` pages through all of it
+OUTPUT_HEAD_LINES = 200 # Lines drawn as they arrive
+OUTPUT_TAIL_LINES = 40 # Last lines drawn once the command has finished
+STATUS_REFRESH_INTERVAL = 0.2 # Seconds between line-count updates of the spinner
+SYNTAX_MAX_CHARS = 500 # Longer commands are printed without syntax highlighting
+SYNTAX_MAX_LINES = 20
+DEFAULT_PAGER = "less -R"
+
 def print_command_to_execute(command):
-    """Displays the command to be executed with syntax highlighting."""
+    """
+    Displays the command to be executed.
+
+    Short commands are syntax highlighted; long generated scripts are printed
+    as plain text, where highlighting would cost more than it helps.
+    """
     console.print("[bold green]Executing Command:[/bold green]")
-    console.print(Syntax(command, "bash", theme="monokai", line_numbers=True))
+    if len(command) <= SYNTAX_MAX_CHARS and command.count("\n") < SYNTAX_MAX_LINES:
+        from rich.syntax import Syntax # Loads pygments; deferred until the first command is shown
+        console.print(Syntax(command, "bash", theme="monokai", line_numbers=True))
+    else:
+        console.out(command, highlight=False)
+
+class CommandOutputView:
+    """
+    Draws streamed command output without letting the terminal become the bottleneck.
+
+    Lines are written raw, without markup or highlighting, so brackets in the
+    output are shown as they are. Only the first `head_lines` lines are drawn
+    as they arrive; after that the spinner shows a running line count, and when
+    the command has finished the last `tail_lines` lines are drawn below the
+    number of lines left out.
+
+    Use it as a context manager around the command; `write` (or `write_step`
+    for plan steps) is the `on_line` callback.
+    """
+
+    def __init__(self, message: str = None, head_lines: int = OUTPUT_HEAD_LINES, tail_lines: int = OUTPUT_TAIL_LINES):
+        """
+        :param message: The spinner text shown while the command runs (None shows no spinner).
+        :param head_lines: The number of lines drawn as they arrive.
+        :param tail_lines: The number of last lines drawn at the end.
+        """
+        self.message = message
+        self.head_lines = head_lines
+        self.tail = deque(maxlen=tail_lines)
+        self.lines = 0
+        self.elided = 0
+        self._status = None
+        self._next_status_update = 0.0
+
+    def __enter__(self):
+        if self.message is not None:
+            self._status = console.status(self.message)
+            self._status.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._status is not None:
+            self._status.stop()
+        self.elided = max(0, self.lines - self.head_lines - len(self.tail))
+        if self.elided:
+            console.print(f"[dim]... {self.elided:,} lines not shown, type [bold]show output[/bold] to page through the full output ...[/dim]")
+        for line, is_stderr, step_id in self.tail:
+            self._draw(line, is_stderr, step_id)
+        return False
+
+    def write(self, line, is_stderr=False):
+        """Handles one line of command output."""
+        self._add(line, is_stderr, None)
+
+    def write_step(self, step_id, line, is_stderr=False):
+        """Handles one line of output from a plan step; it is drawn with the step id as a prefix."""
+        self._add(line, is_stderr, step_id)
+
+    def _add(self, line, is_stderr, step_id):
+        self.lines += 1
+        if self.lines <= self.head_lines:
+            self._draw(line, is_stderr, step_id)
+            return
+        self.tail.append((line, is_stderr, step_id))
+        now = time.monotonic()
+        if self._status is not None and now >= self._next_status_update:
+            self._next_status_update = now + STATUS_REFRESH_INTERVAL
+            self._status.update(f"{self.message} [dim]({self.lines:,} lines)[/dim]")
+
+    def _draw(self, line, is_stderr, step_id):
+        if step_id is None:
+            console.out(line, style="red" if is_stderr else None, highlight=False)
+            return
+        text = Text(f"[{step_id}] ", style=_step_styles.get(step_id, "cyan"))
+        text.append(line, style="red" if is_stderr else None)
+        console.print(text, highlight=False, no_wrap=True, overflow="ignore", crop=False)
+
+def page_output(lines):
+    """
+    Shows a long command output one screen at a time.
 
+    The lines are streamed into `$PAGER` (`less` by default) without loading
+    the whole output into memory. Without a terminal or a pager, they are
+    written straight to stdout or paged with a simple built-in prompt.
+
+    :param lines: An iterable of output lines, e.g. `CommandResult.iter_output_lines()`.
+    """
+    pager = shlex.split(os.environ.get("PAGER") or DEFAULT_PAGER)
+    if not console.is_terminal:
+        for line in lines:
+            console.file.write(line + "\n")
+        console.file.flush()
+        return
+
+    if pager and shutil.which(pager[0]):
+        process = subprocess.Popen(pager, stdin=subprocess.PIPE, text=True, errors='replace')
+        try:
+            for line in lines:
+                process.stdin.write(line + "\n")
+        except BrokenPipeError:
+            pass # The user quit the pager before the end
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            process.wait()
+        return
+
+    page_size = max(5, console.height - 2)
+    for index, line in enumerate(lines, 1):
+        console.out(line, highlight=False)
+        if index % page_size == 0:
+            answer = console.input("[dim]-- more (Enter: next page, q: quit) --[/dim] ")
+            if answer.strip().lower() == "q":
+                return
+
+
+# Prefix colours that tell the interleaved output of concurrent plan steps apart
+STEP_STYLES = ["cyan", "magenta", "yellow", "green", "blue", "bright_cyan", "bright_magenta", "bright_yellow"]
+_step_styles = {}
+
+def print_plan(steps):
+    """Displays the steps of a multi-step plan and their dependencies."""
+    console.print("[bold green]Executing Plan:[/bold green]")
+    table = Table(show_header=True, header_style="bold")
+    table.add_column("Step")
+    table.add_column("Depends on", style="dim")
+    table.add_column("Command", style="white")
+    for step in steps:
+        _step_styles.setdefault(step.id, STEP_STYLES[len(_step_styles) % len(STEP_STYLES)])
+        table.add_row(Text(step.id, style=_step_styles[step.id]), ", ".join(step.depends_on) or "-", Text(step.command))
+    console.print(table)
+
+def print_plan_result(plan_result):
+    """Displays the exit status of every step of a finished plan."""
+    for step in plan_result.steps:
+        result = plan_result.results.get(step.id)
+        if result is None:
+            status = f"[yellow]skipped, {escape(plan_result.skipped.get(step.id, 'not run'))}[/yellow]"
+        elif result.timed_out:
+            status = f"[bold red]timed out after {result.duration:.1f}s[/bold red]"
+        elif result.exit_code == 0:
+            status = f"[green]exit code 0[/green][dim], {result.line_count} lines in {result.duration:.1f}s"
+        else:
+            status = f"[bold red]exit code {result.exit_code}[/bold red][dim], {result.line_count} lines in {result.duration:.1f}s"
+        console.print(f"[dim]([/dim][{_step_styles.get(step.id, 'cyan')}]{escape(step.id)}[/]: {status}[dim])[/dim]", highlight=False)
+    console.print(f"[dim](plan finished in {plan_result.duration:.1f}s)[/dim]")
 
 def print_command_output(output):
-    """Displays the output from the executed command."""
-    # Simple print for now, can be enhanced later
-    console.print(output, end='')
+    """Displays the output from the executed command, with the same limits as streamed output."""
+    with CommandOutputView() as view:
+        for line in output.splitlines():
+            view.write(line)
+
+def print_command_result(result):
+    """Displays the exit status of a finished command."""
+    if result.timed_out:
+        status = f"[bold red]timed out after {result.duration:.1f}s[/bold red]"
+    elif result.exit_code == 0:
+        status = "[green]exit code 0[/green]"
+    else:
+        status = f"[bold red]exit code {result.exit_code}[/bold red]"
+    details = f"{result.line_count} lines in {result.duration:.1f}s"
+    if result.truncated:
+        details += f", full output saved to {result.spool_path}"
+    console.print(f"[dim]({status}[dim], {details})[/dim]")
+
+def _summary_panel(summary):
+    return Panel(
+        Text(summary),
+        title="[bold blue]:bulb: Summary[/bold blue]",
+        border_style="blue",
+        expand=False
+    )
 
 def print_summary(summary):
     """
     Displays the LLM's summary of the command output in a panel.
+
+    :param summary: The summary text, or an iterable of text chunks that is rendered as it arrives.
+    :return: The full summary text.
     """
-    console.print(
-        Panel(
-            summary,
-            title="[bold blue]:bulb: Summary[/bold blue]",
-            border_style="blue",
-            expand=False
-        )
-    )
+    if isinstance(summary, str):
+        console.print(_summary_panel(summary))
+        return summary
+
+    text = ""
+    waiting = Spinner("dots", text="[bold green]Summarizing output...[/bold green]")
+    with Live(waiting, console=console, refresh_per_second=8, vertical_overflow="visible") as live:
+        for chunk in summary:
+            text += chunk
+            live.update(_summary_panel(text.strip()))
+        text = text.strip()
+        live.update(_summary_panel(text))
+    return text
+
+def print_parsed_output(parsed):
+    """Displays a command's output as condensed by a local parser (see `output_parsers`)."""
+    console.print(Panel(
+        Text(parsed.text),
+        title=f"[bold blue]:mag: {escape(parsed.tool)}[/bold blue]",
+        subtitle=f"[dim]{parsed.raw_lines} lines parsed locally[/dim]",
+        border_style="blue",
+        expand=False
+    ))
+
+def print_background_summary(summary):
+    """
+    Displays a summary that finished in the background.
+
+    If the user is at the prompt, the summary is printed above it and the
+    prompt is drawn again.
+    """
+    waiting_prompt = _prompt_state["message"]
+    if waiting_prompt is not None:
+        console.print()
+    print_summary(summary)
+    if waiting_prompt is not None:
+        console.print(f"{waiting_prompt}: ", end="")
 
 def print_error(message):
-    """Displays an error message in a styled panel."""
-    console.print(Panel(f"[bold red]Error: {message}[/bold red]", title="[bold red]Error[/bold red]"))
\ No newline at end of file
+    """Displays an error message in a styled panel; the message is shown as plain text, never as markup."""
+    console.print(Panel(Text(f"Error: {message}", style="bold red"), title="[bold red]Error[/bold red]"))
\ No newline at end of file